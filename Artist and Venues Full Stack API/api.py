@@ -0,0 +1,266 @@
+#----------------------------------------------------------------------------#
+# JSON API, mounted at /api/v1.
+#
+# List and detail endpoints take a comma separated `fields` argument and only
+# select those columns. Every response carries an ETag, and a request whose
+# If-None-Match still matches gets an empty 304.
+#----------------------------------------------------------------------------#
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+
+from availability import calendar, free_intervals
+from export import FORMATS, export, show_rows
+from models import db, Genre, Venue, Artist, venue_genre, artist_genre
+from queries import (artist_listing, artist_show, load_artist, load_venue, partition_shows,
+                     search_page, show_column, shows_page, venue_listing, venue_show, venues_near)
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Requestable fields per resource. Columns and counters are selected as asked,
+# the other fields are filled in afterwards with one extra query each.
+columns = {
+  Venue: ['id', 'name', 'city', 'state', 'address', 'phone', 'phone_e164', 'image_link',
+          'facebook_link', 'website', 'seeking_description'],
+  Artist: ['id', 'name', 'city', 'state', 'phone', 'phone_e164', 'image_link',
+           'facebook_link', 'website', 'seeking_venue'],
+}
+# field -> the counter column maintained by counters.py
+counter_fields = {'num_upcoming_shows': 'upcoming_shows_count', 'num_past_shows': 'past_shows_count'}
+extra_fields = ['genres']
+detail_fields = ['past_shows', 'upcoming_shows']
+show_fields = ['venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link', 'start_time']
+links = {Venue: (venue_genre, venue_genre.c.venue_id), Artist: (artist_genre, artist_genre.c.artist_id)}
+
+
+def default(value):
+  if isinstance(value, datetime):
+    return value.isoformat()
+  raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def encode(data):
+  if orjson is not None:
+    return orjson.dumps(data, default=default)
+  return json.dumps(data, default=default, separators=(',', ':')).encode('utf-8')
+
+def json_response(data):
+  body = encode(data)
+  response = Response(body, mimetype='application/json')
+  response.set_etag(hashlib.sha1(body).hexdigest())
+  return response.make_conditional(request)
+
+def requested_fields(available):
+  # The fields named in ?fields=, all of `available` when absent
+  names = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()]
+  unknown = [name for name in names if name not in available]
+  if unknown:
+    abort(400, description='Unknown fields: ' + ', '.join(unknown))
+  return names or list(available)
+
+def page_size():
+  return min(max(request.args.get('limit', current_app.config['API_PER_PAGE'], type=int), 1),
+             current_app.config['API_MAX_PER_PAGE'])
+
+def genre_names(model, ids):
+  # Genre names of each of the given ids, in one query
+  link, key = links[model]
+  rows = db.session.query(key, Genre.name).join(Genre, Genre.id == link.c.genre_id).filter(
+    key.in_(ids)).order_by(key, Genre.name)
+  names = {id: [] for id in ids}
+  for id, name in rows:
+    names[id].append(name)
+  return names
+
+def selected_fields(model, fields):
+  # The requested fields read straight from the model's row, id first
+  return ['id'] + [name for name in fields
+                   if (name in columns[model] or name in counter_fields) and name != 'id']
+
+def field_column(model, name):
+  return getattr(model, counter_fields.get(name, name))
+
+def add_extra_fields(model, records, fields):
+  if 'genres' in fields:
+    genres = genre_names(model, [record['id'] for record in records])
+    for record in records:
+      record['genres'] = genres[record['id']]
+
+def listing(model, listing_query):
+  fields = requested_fields(columns[model] + list(counter_fields) + extra_fields)
+  # id is always selected, it keys the extra fields and the next page
+  selected = selected_fields(model, fields)
+  limit = page_size()
+  query = listing_query([field_column(model, name) for name in selected], request.args.get('genre'))
+  after = request.args.get('after', type=int)
+  if after is not None:
+    query = query.filter(model.id > after)
+  rows = query.limit(limit + 1).all()
+
+  records = [dict(zip(selected, row)) for row in rows[:limit]]
+  add_extra_fields(model, records, fields)
+  for record in records:
+    for name in set(record) - set(fields):
+      del record[name]
+  return json_response({
+    'data': records,
+    'next': rows[limit - 1].id if len(rows) > limit else None,
+  })
+
+def availability(model, listing_query):
+  # Owners of the next page, by id, that have a free slot of at least
+  # min_length minutes between start and end
+  try:
+    start = datetime.fromisoformat(request.args['start'])
+    end = datetime.fromisoformat(request.args['end'])
+  except (KeyError, ValueError):
+    abort(400, description='start and end must be ISO 8601 date times')
+  if not start < end <= start + timedelta(days=current_app.config['AVAILABILITY_MAX_DAYS']):
+    abort(400, description='end must be after start, within %d days' % current_app.config['AVAILABILITY_MAX_DAYS'])
+  length = timedelta(minutes=current_app.config['SHOW_LENGTH_MINUTES'])
+  min_length = timedelta(minutes=request.args.get('min_length', length.total_seconds() // 60, type=float))
+
+  limit = page_size()
+  query = listing_query([model.id, model.name], request.args.get('genre'))
+  after = request.args.get('after', type=int)
+  if after is not None:
+    query = query.filter(model.id > after)
+  rows = query.limit(limit + 1).all()
+
+  starts = calendar.starts(show_column[model], start, end, length)
+  data = []
+  for row in rows[:limit]:
+    free = free_intervals(starts.get(row.id, []), start, end, length, min_length)
+    if free:
+      data.append({'id': row.id, 'name': row.name, 'free': free})
+  return json_response({
+    'data': data,
+    'next': rows[limit - 1].id if len(rows) > limit else None,
+  })
+
+def detail(model, id, load, render):
+  fields = requested_fields(columns[model] + list(counter_fields) + extra_fields + detail_fields)
+  if set(fields) & set(detail_fields):
+    # The shows are needed anyway, load the whole entity in two statements
+    entity = load(id)
+    if entity is None:
+      abort(404)
+    record = {name: getattr(entity, counter_fields.get(name, name)) for name in selected_fields(model, fields)}
+    record['genres'] = [genre.name for genre in entity.genres]
+    past_shows, upcoming_shows = partition_shows(
+      entity.shows_venue if model is Venue else entity.shows_art, render)
+    record.update(past_shows=past_shows, upcoming_shows=upcoming_shows)
+  else:
+    selected = selected_fields(model, fields)
+    row = db.session.query(*[field_column(model, name) for name in selected]).filter(model.id == id).first()
+    if row is None:
+      abort(404)
+    record = dict(zip(selected, row))
+    add_extra_fields(model, [record], fields)
+  return json_response({name: record[name] for name in fields})
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@api.route('/venues')
+def venues():
+  return listing(Venue, venue_listing)
+
+@api.route('/venues/availability')
+def venue_availability():
+  return availability(Venue, venue_listing)
+
+@api.route('/venues/nearby')
+def nearby_venues():
+  latitude = request.args.get('lat', type=float)
+  longitude = request.args.get('lng', type=float)
+  if latitude is None or longitude is None or not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+    abort(400, description='lat and lng are required coordinates')
+  radius = min(max(request.args.get('radius', 10, type=float), 0), current_app.config['NEARBY_MAX_RADIUS_KM'])
+  hits = venues_near(latitude, longitude, radius, page_size())
+  return json_response({
+    'count': len(hits),
+    'data': [{
+      'id': venue.id,
+      'name': venue.name,
+      'city': venue.city,
+      'state': venue.state,
+      'distance_km': round(distance, 3),
+    } for distance, venue in hits]
+  })
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+  return detail(Venue, venue_id, load_venue, venue_show)
+
+@api.route('/venues/search')
+def search_venues():
+  return json_response(search_page(Venue, request.args.get('q', ''), page_size(),
+                                   max(request.args.get('offset', 0, type=int), 0)))
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@api.route('/artists')
+def artists():
+  return listing(Artist, artist_listing)
+
+@api.route('/artists/availability')
+def artist_availability():
+  return availability(Artist, artist_listing)
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+  return detail(Artist, artist_id, load_artist, artist_show)
+
+@api.route('/artists/search')
+def search_artists():
+  return json_response(search_page(Artist, request.args.get('q', ''), page_size(),
+                                   max(request.args.get('offset', 0, type=int), 0)))
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@api.route('/shows')
+def shows():
+  fields = requested_fields(show_fields)
+  try:
+    rows, next_cursor = shows_page(page_size(), request.args.get('after'),
+                                   request.args.get('upcoming', '1') != '0')
+  except ValueError:
+    abort(400, description='Malformed cursor')
+  return json_response({
+    'data': [{name: getattr(row, name) for name in fields} for row in rows],
+    'next': next_cursor,
+  })
+
+@api.route('/shows/export')
+def export_shows():
+  # Every show, or those starting in [since, until), streamed as it is read
+  format = request.args.get('format', 'csv')
+  if format not in FORMATS:
+    abort(400, description='format must be one of ' + ', '.join(FORMATS))
+  try:
+    since, until = [datetime.fromisoformat(request.args[name]) if name in request.args else None
+                    for name in ('since', 'until')]
+  except ValueError:
+    abort(400, description='since and until must be ISO 8601 date times')
+  chunk = current_app.config['EXPORT_CHUNK_ROWS']
+  response = Response(stream_with_context(export(format, show_rows(since, until, chunk), chunk)),
+                      mimetype=FORMATS[format])
+  response.headers['Content-Disposition'] = f'attachment; filename=shows.{format}'
+  return response
+
+#  Errors
+#  ----------------------------------------------------------------
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def error(error):
+  return jsonify({'error': error.code, 'message': error.description}), error.code
@@ -3,18 +3,41 @@
 #----------------------------------------------------------------------------#
 import config
 import json
+import time
+import click
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+from functools import lru_cache
+from flask import (Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify,
+                   send_from_directory)
+from sqlalchemy import and_, bindparam, select
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
-from sqlalchemy.sql import func
-from datetime import datetime
+from models import db, Show, Genre, Venue, Artist
+from queries import *
+from api import api
+from cache import FragmentCache
+from metrics import Metrics
+from querybudget import QueryBudget
+from replicas import Replicas, read_only
+from counters import adjust, recount, roll_forward
+from booking import BookingError, SlotTaken, book_show
+from availability import calendar
+from phones import normalize
+from geo import locate
+from thumbnails import NAME as THUMBNAIL_NAME, ImageError, ThumbnailStore, ingest
+from importer import copy_rows, import_rows, read_rows, validate
+from sampledata import SCALES, generate
+from export import FORMATS, export, show_rows
+from recommendations import is_new_pair, rebuild as rebuild_recommendations, refresh as refresh_recommendations
+from jobs import JobQueue, enqueue
+from partitions import add_months, archive, create_partitions, month_start, partition_name
+from datetime import datetime, timedelta
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -22,68 +45,121 @@ from datetime import datetime
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+db.init_app(app)
 migrate = Migrate(app, db, compare_type=True)
 migrate.init_app(app)
+cache = FragmentCache.from_config(app.config)
+metrics = Metrics()
+metrics.init_app(app, db)
+query_budget = QueryBudget(app, db)
+replicas = Replicas(app, watchers=[metrics.watch, query_budget.watch])
+jobs = JobQueue(app, db)
+calendar.ttl = app.config['AVAILABILITY_TTL']
+app.register_blueprint(api)
 
 # TODO: connect to a local postgresql database
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
-class Show(db.Model):
-    __tablename__ = 'show'
-    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey('artist.id'), primary_key=True)
-    start_time = db.Column(db.DateTime, primary_key=True)
-
-class Venue(db.Model):
-    __tablename__ = 'venue'
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    address = db.Column(db.String(120))
-    phone = db.Column(db.String(120))
-    image_link = db.Column(db.String(500))
-    facebook_link = db.Column(db.String(120))
-    genres = db.Column(db.String(500))
-    website = db.Column(db.String(500))
-    seeking_description = db.Column(db.Boolean, default=False)
-    shows_venue = db.relationship('Show', backref='venue')
-
-class Artist(db.Model):
-    __tablename__ = 'artist'
-
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
-    image_link = db.Column(db.String(500))
-    facebook_link = db.Column(db.String(120))
-    website = db.Column(db.String(500))
-    seeking_venue = db.Column(db.Boolean, default=False)
-    shows_art = db.relationship('Show', backref='artist')
-
-    # DONE: implement any missing fields, as a database migration using Flask-Migrate
-
-# DONE Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+# Models live in models.py, shared queries in queries.py.
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+named_formats = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+@lru_cache(maxsize=64)
+def datetime_pattern(format, locale):
+  # Parsed babel pattern and locale, built once per (format, locale). The
+  # other babel format names ('short', 'long') use the locale's pattern.
+  locale = babel.Locale.parse(locale)
+  if format in named_formats:
+    format = named_formats[format]
+  elif format in ('short', 'medium', 'long', 'full'):
+    format = str(locale.datetime_formats[format]).replace(
+      '{0}', locale.time_formats[format].pattern).replace('{1}', locale.date_formats[format].pattern)
+  return babel.dates.parse_pattern(format), locale
+
+def format_datetime(value, format='medium', locale='en'):
+  # Only strings need parsing, datetimes coming from the database are used as is
+  if not isinstance(value, datetime):
+    value = dateutil.parser.parse(value)
+  pattern, locale = datetime_pattern(format, locale)
+  return pattern.apply(value, locale)
+
+def format_datetimes(values, format='medium', locale='en'):
+  # format_datetime() for a whole list of values, e.g. one listing page
+  pattern, locale = datetime_pattern(format, locale)
+  return [pattern.apply(value if isinstance(value, datetime) else dateutil.parser.parse(value), locale)
+          for value in values]
+
+def format_start_times(shows, format='full'):
+  # Replace the start_time of each show dict by its display text, in place
+  for show, text in zip(shows, format_datetimes([show['start_time'] for show in shows], format)):
+    show['start_time'] = text
+  return shows
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+def thumbnail_url(thumbnail, image_link):
+  # The stored thumbnail when there is one, the original image until then
+  if thumbnail:
+    return url_for('thumbnail', name=thumbnail)
+  return image_link
+
+app.jinja_env.filters['thumbnail'] = thumbnail_url
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def venue_from_form(form, genres):
+  # A new Venue from a validated VenueForm, `genres` being its Genre rows
+  latitude, longitude, geohash = locate(form.city.data, form.state.data)
+  return Venue(
+    name=form.name.data,
+    city=form.city.data,
+    state=form.state.data,
+    latitude=latitude,
+    longitude=longitude,
+    geohash=geohash,
+    phone=form.phone.data,
+    phone_e164=normalize(form.phone.data),
+    address=form.address.data,
+    genres=genres,
+    image_link=form.image_link.data,
+    facebook_link=form.facebook_link.data,
+    website=form.website.data,
+    seeking_description=form.seeking_talent.data
+  )
+
+def artist_from_form(form, genres):
+  # A new Artist from a validated ArtistForm, `genres` being its Genre rows
+  return Artist(
+    name=form.name.data,
+    city=form.city.data,
+    state=form.state.data,
+    phone=form.phone.data,
+    phone_e164=normalize(form.phone.data),
+    facebook_link=form.facebook_link.data,
+    genres=genres,
+    image_link=form.image_link.data,
+    website=form.website.data,
+    seeking_venue=form.seeking_venue.data
+  )
+
+def search_paging():
+  # limit/offset of a search request, with the page size capped by config
+  page_size = app.config['SEARCH_RESULTS_PER_PAGE']
+  limit = request.values.get('limit', page_size, type=int)
+  offset = request.values.get('offset', 0, type=int)
+  return min(max(limit, 1), page_size), max(offset, 0)
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -98,102 +174,37 @@ def index():
 
 @app.route('/venues')
 def venues():
-  data = []
-  areas = Venue.query.distinct('city','state').all()
-
-  today = datetime.now()
-  today = today.strftime('%Y-%m-%d')
-
-  def get_venue(venue):
-    venue_id = venue.id 
-    upcoming_shows = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id).filter(
-      Show.start_time>today).all()
-    
-    upcoming_shows_count = 0
-    for show in upcoming_shows:
-        upcoming_shows_count = upcoming_shows_count+1
-    return {'id': venue_id, 'name': venue.name, 'num_upcoming_shows': upcoming_shows_count}
-
-  for area in areas:
-    venues = Venue.query.filter(Venue.city == area.city, Venue.state == area.state).all()
-    record = {
-      'city': area.city,
-      'state': area.state,
-      'venues': [get_venue(venue) for venue in venues],
-    }
-    data.append(record)
-
-
-  return render_template('pages/venues.html', areas=data);
+  listing = cache.fragment('venues', request.args, app.config['CACHE_UPCOMING_TTL'],
+                           lambda: render_template('fragments/venues.html',
+                                                   areas=venue_areas(request.args.get('genre'))))
+  return render_template('pages/venues.html', listing=listing)
 
 @app.route('/venues/search', methods=['POST'])
+@read_only
 def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for Hop should return "The Musical Hop".
-  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  search_term = request.form.get('search_term')
-  search_results = Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).all()
-  count_results = len(search_results)
-  response = {}
-  data = []
-
-  today = datetime.now()
-  today = today.strftime('%Y-%m-%d')
-  def get_upcoming_number(venue_id):
-    total = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id).filter(
-    Show.start_time>today).all()
-    return len(total)
-  for result in search_results:
-    data.append({
-      "id": result.id,
-      "name": result.name,
-      "num_upcoming_shows": get_upcoming_number(result.id)
-    })
-  response["count"] = count_results
-  response["data"] = data
-  
+  search_term = request.form.get('search_term', '')
+  response = search_page(Venue, search_term, *search_paging())
   return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
-  venue = Venue.query.get(venue_id)
-  arr = venue.genres[1:-1] 
-  arr = ''.join(arr).split(",")
-  venue.genres = arr
-  today = datetime.now()
-  today = today.strftime('%Y-%m-%d')
+  venue = load_venue(venue_id)
+  if venue is None:
+    abort(404)
   if venue.seeking_description:
     venue.seeking_text = "We are on the lookout for a local artist to play every two weeks. Please call us."
-  
-  #Query upcoming and past shows
-  upcoming_shows = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id).filter(
-    Show.start_time>today).all()
-  past_shows = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id).filter(
-    Show.start_time<today).all()
-  #Function to get filtered shows data for display, past or upcoming
-  def shows(shows):
-    show_render_data = []
-    shows_count = 0
-    for show in shows:
-      shows_count = shows_count+1
-      show_render_data.append(
-        {
-          "start_time" : show.start_time,
-          "artist_id" : show.artist_id,
-          "artist_image_link" : show.artist.image_link,
-          "artist_name" : show.artist.name
-        }
-      )
-    return [shows_count, show_render_data]
-
-  past_shows = shows(past_shows)
-  upcoming_shows = shows(upcoming_shows)
-
-  venue.past_shows_count = past_shows[0]
-  venue.past_shows = past_shows[1]
-
-  venue.upcoming_shows_count = upcoming_shows[0]
-  venue.upcoming_shows = upcoming_shows[1]
+
+  past_shows, upcoming_shows = partition_shows(venue.shows_venue, venue_show)
+  format_start_times(past_shows)
+  format_start_times(upcoming_shows)
+
+  venue.past_shows_count = len(past_shows)
+  venue.past_shows = past_shows
+
+  venue.upcoming_shows_count = len(upcoming_shows)
+  venue.upcoming_shows = upcoming_shows
+  venue.recommended_artists = [recommended_artist(recommendation) for recommendation in
+    venue.recommendations[:app.config['RECOMMENDATIONS_PER_PAGE']]]
 
   return render_template('pages/show_venue.html', venue=venue)
 
@@ -209,20 +220,10 @@ def create_venue_form():
 def create_venue_submission():
     form = VenueForm()
     if form.validate():
-      venue = Venue( 
-        name=request.form['name'],
-        city=request.form['city'],
-        state=request.form['state'], 
-        phone=request.form['phone'],
-        address=request.form['address'],
-        genres=form.genres.data,
-        image_link=request.form['image_link'],
-        facebook_link=request.form['facebook_link'],
-        website=request.form['website'],
-        seeking_description=form.seeking_talent.data
-        )
+      venue = venue_from_form(form, Genre.named(form.genres.data))
       db.session.add(venue)
       db.session.commit()
+      cache.invalidate('venues')
       flash('Venue ' + request.form['name'] + ' was successfully listed!')
       return render_template('pages/home.html')
     else:
@@ -233,79 +234,40 @@ def create_venue_submission():
 #  ----------------------------------------------------------------
 @app.route('/artists')
 def artists():
-  data = Artist.query.all()
-  return render_template('pages/artists.html', artists=data)
+  def render():
+    data = artist_listing((Artist.id, Artist.name), request.args.get('genre')).all()
+    return render_template('fragments/artists.html', artists=data)
+  listing = cache.fragment('artists', request.args, app.config['CACHE_TTL'], render)
+  return render_template('pages/artists.html', listing=listing)
 
 @app.route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
-  search_term = request.form.get('search_term')
-  search_results = Artist.query.filter(Artist.name.ilike(f'%{search_term}%')).all()
-  count_results = len(search_results)
-  response = {}
-  data = []
-
-  today = datetime.now()
-  today = today.strftime('%Y-%m-%d')
-
-  def get_upcoming_number(artist_id):
-    total = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).filter(
-    Show.start_time>today).all()
-    return len(total)
-  for result in search_results:
-    data.append({
-      "id": result.id,
-      "name": result.name,
-      "num_upcoming_shows": get_upcoming_number(result.id)
-    })
-  response["count"] = count_results
-  response["data"] = data
- 
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  search_term = request.form.get('search_term', '')
+  response = search_page(Artist, search_term, *search_paging())
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-  artist = Artist.query.get(artist_id)
-  arr = artist.genres[1:-1] 
-  arr = ''.join(arr).split(",")
-  artist.genres = arr
-  today = datetime.now()
-  today = today.strftime('%Y-%m-%d')
+  artist = load_artist(artist_id)
+  if artist is None:
+    abort(404)
   if artist.seeking_venue:
     artist.seeking_text = "Looking for venue to play in."
-  
-  #Query upcoming and past shows
-  upcoming_shows = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).filter(
-    Show.start_time>today).all()
-  past_shows = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).filter(
-    Show.start_time<today).all()
-  #Function to get filtered shows data for display, past or upcoming
-  def shows(shows):
-    show_render_data = []
-    shows_count = 0
-    for show in shows:
-      shows_count = shows_count+1
-      show_render_data.append(
-        {
-          "start_time" : show.start_time,
-          "venue_id" : show.venue_id,
-          "venue_image_link" : show.venue.image_link,
-          "venue_name" : show.venue.name
-        }
-      )
-    return [shows_count, show_render_data]
-
-  past_shows = shows(past_shows)
-  upcoming_shows = shows(upcoming_shows)
-
-  artist.past_shows_count = past_shows[0]
-  artist.past_shows = past_shows[1]
-
-  artist.upcoming_shows_count = upcoming_shows[0]
-  artist.upcoming_shows = upcoming_shows[1]
 
-  return render_template('pages/show_artist.html', artist=artist)
+  past_shows, upcoming_shows = partition_shows(artist.shows_art, artist_show)
+  format_start_times(past_shows)
+  format_start_times(upcoming_shows)
 
+  artist.past_shows_count = len(past_shows)
+  artist.past_shows = past_shows
 
+  artist.upcoming_shows_count = len(upcoming_shows)
+  artist.upcoming_shows = upcoming_shows
+  artist.recommended_artists = [recommended_artist(recommendation) for recommendation in
+    artist.recommendations[:app.config['RECOMMENDATIONS_PER_PAGE']]]
+
+  return render_template('pages/show_artist.html', artist=artist)
 
 #  Create Artist
 #  ----------------------------------------------------------------
@@ -321,18 +283,10 @@ def create_artist_submission():
   form = ArtistForm()
   
   if form.validate():
-    artist = Artist( 
-      name=request.form['name'],
-      city=request.form['city'],
-      state=request.form['state'], 
-      phone=request.form['phone'],
-      facebook_link=request.form['facebook_link'],
-      genres=form.genres.data,
-      image_link=request.form['image_link'],
-      website=request.form['website']
-      )
+    artist = artist_from_form(form, Genre.named(form.genres.data))
     db.session.add(artist)
     db.session.commit()
+    cache.invalidate('artists')
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
     return render_template('pages/home.html')
   else:
@@ -344,19 +298,20 @@ def create_artist_submission():
 
 @app.route('/shows')
 def shows():
-  data = []
-  all_shows = db.session.query(Show).join(Artist).join(Venue).all()
-  for show in all_shows:
-    data.append({
-          "venue_id" : show.venue_id,
-          "venue_name" : show.venue.name,
-          "artist_id" : show.artist_id,
-          "artist_image_link" : show.artist.image_link,
-          "artist_name" : show.artist.name,
-          "start_time" : show.start_time
-    })
-
-  return render_template('pages/shows.html', shows=data)
+  listing = cache.fragment('shows', request.args, app.config['CACHE_UPCOMING_TTL'], render_shows)
+  return render_template('pages/shows.html', listing=listing)
+
+def render_shows():
+  per_page = min(max(request.args.get('per_page', app.config['SHOWS_PER_PAGE'], type=int), 1),
+                 app.config['SHOWS_MAX_PER_PAGE'])
+  upcoming_only = request.args.get('upcoming', '1') != '0'
+  try:
+    data, next_cursor = shows_page(per_page, request.args.get('after'), upcoming_only)
+  except ValueError:
+    abort(400)
+  data = format_start_times([show._asdict() for show in data])
+  return render_template('fragments/shows.html', shows=data, next_cursor=next_cursor,
+                         per_page=per_page, upcoming=int(upcoming_only))
 
 @app.route('/shows/create')
 def create_shows():
@@ -366,29 +321,48 @@ def create_shows():
 
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
+  form = ShowForm()
+  if not form.validate():
+    flash('An error occurred. Show could not be listed.')
+    return render_template('forms/new_show.html', form=form), 400
   try:
-    form = ShowForm()
-    if form.validate():
-
-      artist_id=request.form['artist_id'],
-      venue_id=request.form['venue_id'],
-      start_time=request.form['start_time']
-      artist = Artist.query.get(artist_id)
-      venue = Venue.query.get(venue_id)
-      start_time = start_time
-
-      new_show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
-      artist.show =[new_show]
-      venue.show =[new_show]
-      db.session.add_all([artist,venue, new_show])
-      db.session.commit()
-      flash('Show was successfully listed!')
-      return render_template('pages/home.html')
-    else:
-      flash('An error occurred. Show could not be listed.')
-      return render_template('forms/new_show.html', form=form)
-  except:
-    return render_template('errors/500.html'), 500
+    venue_id, artist_id = int(form.venue_id.data), int(form.artist_id.data)
+    book_show(venue_id, artist_id, form.start_time.data, timedelta(minutes=app.config['SHOW_LENGTH_MINUTES']))
+  except ValueError:
+    form.venue_id.errors.append('Venue and artist ids must be numbers.')
+    status = 400
+  except SlotTaken as e:
+    form.start_time.errors.append(e.message)
+    status = 409
+  except BookingError as e:
+    getattr(form, e.field).errors.append(e.message)
+    status = 400
+  else:
+    cache.invalidate('venues', 'shows')
+    calendar.invalidate(form.start_time.data)
+    flash('Show was successfully listed!')
+    return render_template('pages/home.html')
+  flash('An error occurred. Show could not be listed.')
+  return render_template('forms/new_show.html', form=form), status
+
+@app.route('/thumbnails/<name>')
+def thumbnail(name):
+  if not THUMBNAIL_NAME.match(name):
+    abort(404)
+  response = send_from_directory(app.config['THUMBNAIL_DIR'], name, mimetype='image/jpeg')
+  # Names change with the content, so a thumbnail never changes
+  response.cache_control.public = True
+  response.cache_control.max_age = 365 * 24 * 3600
+  response.cache_control.immutable = True
+  return response
+
+@app.route('/cache/stats')
+def cache_stats():
+  return jsonify(cache.stats())
+
+@app.route('/metrics')
+def metrics_page():
+  return Response(metrics.render(cache.stats()), mimetype='text/plain; version=0.0.4')
 
 @app.errorhandler(404)
 def not_found_error(error):
@@ -409,6 +383,271 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+#----------------------------------------------------------------------------#
+# Jobs.
+#----------------------------------------------------------------------------#
+
+# Queued in the transaction of the insert, see jobs.py
+
+@db.event.listens_for(Show, 'after_insert')
+def queue_recommendations(mapper, connection, show):
+  # Only the first show of an artist at a venue changes its recommendations
+  if is_new_pair(connection, show.venue_id, show.artist_id, show.start_time):
+    enqueue(connection, 'recommendations', venue_id=show.venue_id, artist_id=show.artist_id)
+
+def queue_thumbnail(mapper, connection, row):
+  if row.image_link:
+    enqueue(connection, 'thumbnail', table=row.__tablename__, id=row.id)
+
+for model in (Venue, Artist):
+  db.event.listen(model, 'after_insert', queue_thumbnail)
+
+@jobs.handler('recommendations')
+def recommendations_job(begin, venue_id, artist_id):
+  with begin() as connection:
+    refresh_recommendations(connection, venue_id, artist_id, app.config['RECOMMENDATIONS_PER_PAGE'],
+                            app.config['RECOMMENDATIONS_SIMILAR_VENUES'])
+
+@jobs.handler('thumbnail')
+def thumbnail_job(begin, table, id):
+  table = {model.__tablename__: model.__table__ for model in (Venue, Artist)}[table]
+  with db.engine.connect() as connection:
+    row = connection.execute(select([table.c.image_link, table.c.thumbnail]).where(table.c.id == id)).first()
+  if row is None or row.thumbnail or not row.image_link:
+    return
+  # Downloaded with no connection held, only public addresses, see thumbnails.py
+  result = ingest([row.image_link], ThumbnailStore(app.config['THUMBNAIL_DIR']), workers=1,
+                  size=app.config['THUMBNAIL_SIZE'], timeout=app.config['THUMBNAIL_FETCH_TIMEOUT'],
+                  max_bytes=app.config['THUMBNAIL_MAX_BYTES'],
+                  allow_private=app.config['THUMBNAIL_ALLOW_PRIVATE'])[row.image_link]
+  if isinstance(result, ImageError):
+    raise result
+  with begin() as connection:
+    # unless the link changed in the meantime
+    connection.execute(table.update().where(and_(table.c.id == id, table.c.image_link == row.image_link)).values(
+      thumbnail=result))
+  cache.invalidate('shows')
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+def genre_lookup():
+  # Genre rows by name, remembered across the chunks of one import
+  genres = {}
+  def lookup(names):
+    missing = [name for name in names if name not in genres]
+    if missing:
+      genres.update((genre.name, genre) for genre in Genre.named(missing))
+    return [genres[name] for name in names]
+  return lookup
+
+def venue_importer():
+  genres = genre_lookup()
+  def prepare(row):
+    return validate(VenueForm, row, multiple=('genres',))
+  def insert(forms):
+    db.session.add_all([venue_from_form(form, genres(form.genres.data)) for form in forms])
+    db.session.flush()
+  return prepare, insert
+
+def artist_importer():
+  genres = genre_lookup()
+  def prepare(row):
+    return validate(ArtistForm, row, multiple=('genres',))
+  def insert(forms):
+    db.session.add_all([artist_from_form(form, genres(form.genres.data)) for form in forms])
+    db.session.flush()
+  return prepare, insert
+
+def show_importer():
+  # Ids are checked up front so one dangling reference doesn't fail a chunk
+  venue_ids = {venue_id for venue_id, in db.session.query(Venue.id)}
+  artist_ids = {artist_id for artist_id, in db.session.query(Artist.id)}
+  columns = ['venue_id', 'artist_id', 'start_time']
+
+  def prepare(row):
+    form, errors = validate(ShowForm, row)
+    # ShowForm falls back to a default start time, an import must not
+    if not row.get('start_time'):
+      errors.setdefault('start_time', ['This field is required.'])
+    record = {}
+    for column, known in (('venue_id', venue_ids), ('artist_id', artist_ids)):
+      try:
+        record[column] = int(getattr(form, column).data)
+      except (TypeError, ValueError):
+        errors.setdefault(column, ['Not a valid id.'])
+        continue
+      if record[column] not in known:
+        errors.setdefault(column, ['No such ' + column[:-3] + '.'])
+    record['start_time'] = form.start_time.data
+    return record, errors
+
+  def insert(records):
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+      copy_rows(connection, Show.__tablename__, columns,
+                [[record[column] for column in columns] for record in records])
+    else:
+      connection.execute(Show.__table__.insert(), records)
+    # Core inserts skip the ORM events that keep the counters
+    adjust(connection, [(record['venue_id'], record['artist_id'], record['start_time'])
+                        for record in records])
+  return prepare, insert
+
+importers = {
+  'venues': (venue_importer, ['venues']),
+  'artists': (artist_importer, ['artists']),
+  'shows': (show_importer, ['venues', 'shows']),
+}
+
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(sorted(importers)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows per transaction.')
+@click.option('--rejects', type=click.File('w'), help='NDJSON file receiving the rejected rows.')
+def import_data(kind, path, chunk_size, rejects):
+  """Bulk import venues, artists or shows from a CSV or NDJSON file."""
+  make_importer, listings = importers[kind]
+  prepare, insert = make_importer()
+  imported, rejected = import_rows(read_rows(path), prepare, insert, db.session,
+                                   chunk_size=chunk_size, rejects=rejects)
+  cache.invalidate(*listings)
+  if kind == 'shows':
+    calendar.invalidate()
+  click.echo(f'Imported {imported} {kind}, rejected {rejected}.')
+
+@app.cli.command('roll-show-counts')
+@click.option('--recount', 'full', is_flag=True, help='Recompute every counter from the show table.')
+def roll_show_counts(full):
+  """Move shows that have started from the upcoming to the past counters.
+
+  Meant to run every few minutes from cron."""
+  connection = db.session.connection()
+  if full:
+    recount(connection)
+    click.echo('Recounted all shows.')
+  else:
+    click.echo(f'Moved {roll_forward(connection)} show counts to past.')
+  db.session.commit()
+  cache.invalidate('venues')
+
+@app.cli.command('thumbnails')
+@click.option('--workers', type=int, help='Download threads, THUMBNAIL_WORKERS by default.')
+def make_thumbnails(workers):
+  """Fetch and thumbnail the venue and artist images that have none yet."""
+  pending = {model: db.session.query(model.id, model.image_link).filter(
+               model.thumbnail.is_(None), model.image_link.isnot(None), model.image_link != '').all()
+             for model in (Venue, Artist)}
+  results = ingest([row.image_link for rows in pending.values() for row in rows],
+                   ThumbnailStore(app.config['THUMBNAIL_DIR']),
+                   workers=workers or app.config['THUMBNAIL_WORKERS'],
+                   size=app.config['THUMBNAIL_SIZE'],
+                   timeout=app.config['THUMBNAIL_FETCH_TIMEOUT'],
+                   max_bytes=app.config['THUMBNAIL_MAX_BYTES'],
+                   allow_private=app.config['THUMBNAIL_ALLOW_PRIVATE'])
+
+  failed = [result for result in results.values() if isinstance(result, Exception)]
+  for model, rows in pending.items():
+    updates = [{'row_id': row.id, 'thumbnail_name': results[row.image_link]} for row in rows
+               if isinstance(results.get(row.image_link), str)]
+    if updates:
+      table = model.__table__
+      db.session.execute(table.update().where(table.c.id == bindparam('row_id')).values(
+        thumbnail=bindparam('thumbnail_name')), updates)
+  db.session.commit()
+  cache.invalidate('shows')
+  for error in failed:
+    click.echo(f'Failed: {error}', err=True)
+  click.echo(f'Thumbnailed {len(results) - len(failed)} images, {len(failed)} failed.')
+
+def partitioned_connection():
+  connection = db.session.connection()
+  if connection.dialect.name != 'postgresql':
+    raise click.ClickException('The show table is only partitioned on PostgreSQL.')
+  return connection
+
+@app.cli.command('show-partitions')
+@click.option('--ahead', type=int, help='Months to prepare, SHOW_PARTITION_MONTHS_AHEAD by default.')
+def show_partitions(ahead):
+  """Create the monthly show partitions of the coming months.
+
+  Meant to run daily from cron."""
+  this_month = month_start(datetime.now())
+  ahead = app.config['SHOW_PARTITION_MONTHS_AHEAD'] if ahead is None else ahead
+  created = create_partitions(partitioned_connection(), this_month, add_months(this_month, ahead))
+  db.session.commit()
+  for month in created:
+    click.echo(f'Created {partition_name(month)}')
+  click.echo(f'Created {len(created)} show partitions.')
+
+@app.cli.command('archive-shows')
+@click.option('--months', type=int, help='Months of shows to keep, SHOW_RETENTION_MONTHS by default.')
+@click.option('--directory', type=click.Path(file_okay=False), help='SHOW_ARCHIVE_DIR by default.')
+def archive_shows(months, directory):
+  """Move the show partitions older than the retention to gzipped CSV files."""
+  months = app.config['SHOW_RETENTION_MONTHS'] if months is None else months
+  paths = archive(partitioned_connection(), add_months(month_start(datetime.now()), -months),
+                  directory or app.config['SHOW_ARCHIVE_DIR'])
+  db.session.commit()
+  cache.invalidate('venues', 'artists', 'shows')
+  calendar.invalidate()
+  for path in paths:
+    click.echo(f'Archived {path}')
+  click.echo(f'Archived {len(paths)} show partitions.')
+
+@app.cli.command('export-shows')
+@click.option('--format', 'format', type=click.Choice(sorted(FORMATS)), default='csv', show_default=True)
+@click.option('--output', type=click.File('w'), default='-', help='File to write, standard output by default.')
+@click.option('--since', type=click.DateTime(), help='Only shows starting from then.')
+@click.option('--until', type=click.DateTime(), help='Only shows starting before then.')
+def export_shows(format, output, since, until):
+  """Stream every show, with venue and artist names, as CSV or NDJSON."""
+  chunk = app.config['EXPORT_CHUNK_ROWS']
+  for piece in export(format, show_rows(since, until, chunk), chunk):
+    output.write(piece)
+
+@app.cli.command('recommendations')
+def recommend_artists():
+  """Rebuild the recommended artists of every venue and artist page.
+
+  Meant to run nightly from cron, and after bulk imports of shows."""
+  rebuild_recommendations(db.session.connection(), app.config['RECOMMENDATIONS_PER_PAGE'],
+                          app.config['RECOMMENDATIONS_SIMILAR_VENUES'])
+  db.session.commit()
+  click.echo('Rebuilt the recommended artists.')
+
+@app.cli.command('run-jobs')
+@click.option('--forever', is_flag=True, help='Keep polling for due jobs every JOBS_POLL_SECONDS.')
+@click.option('--retry-failed', is_flag=True, help='First give the jobs past JOB_MAX_ATTEMPTS another round.')
+def run_jobs(forever, retry_failed):
+  """Run the due jobs: retries, and jobs left by stopped app processes."""
+  if retry_failed:
+    click.echo(f'Retrying {jobs.retry_failed()} failed jobs.')
+  ran = failed = 0
+  while True:
+    succeeded, errors = jobs.run_pending()
+    ran, failed = ran + succeeded, failed + errors
+    if not succeeded + errors:
+      if not forever:
+        break
+      time.sleep(app.config['JOBS_POLL_SECONDS'])
+  click.echo(f'Ran {ran} jobs, {failed} failed.')
+
+@app.cli.command('seed-data')
+@click.option('--scale', type=click.Choice(sorted(SCALES)), default='10k', show_default=True,
+              help='Number of shows, with venues and artists in proportion.')
+@click.option('--seed', default=0, show_default=True, help='Random seed, the same seed makes the same data.')
+def seed_data(scale, seed):
+  """Add synthetic venues, artists and shows, for development and benchmarks."""
+  added = generate(*SCALES[scale], seed=seed)
+  rebuild_recommendations(db.session.connection(), app.config['RECOMMENDATIONS_PER_PAGE'],
+                          app.config['RECOMMENDATIONS_SIMILAR_VENUES'])
+  db.session.commit()
+  cache.invalidate('venues', 'artists', 'shows')
+  calendar.invalidate()
+  click.echo(f"Added {added['venues']} venues, {added['artists']} artists and {added['shows']} shows.")
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
@@ -0,0 +1,94 @@
+#----------------------------------------------------------------------------#
+# Availability of venues and artists.
+#
+# Every show occupies its venue and artist from start_time for
+# SHOW_LENGTH_MINUTES. As all shows have that length, the shows overlapping
+# a window are the ones starting less than a show length before it, a range
+# scan of the start_time indexes. Start times are cached per day and per
+# owner (venue or artist) in sorted lists, so free slots of one owner are
+# found by bisection.
+#----------------------------------------------------------------------------#
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+
+from models import db, Show
+
+
+def free_intervals(starts, start, end, length, min_length):
+  '''Gaps of at least `min_length` within [start, end) between shows of
+  `length` starting at the sorted `starts`.'''
+  free = []
+  cursor = start
+  for show_start in starts[bisect_left(starts, start - length):]:
+    if show_start >= end:
+      break
+    show_end = show_start + length
+    if show_end <= start:
+      continue
+    if show_start - cursor >= min_length:
+      free.append((cursor, show_start))
+    cursor = max(cursor, show_end)
+  if end - cursor >= min_length:
+    free.append((cursor, end))
+  return free
+
+
+class Calendar(object):
+  '''Show start times per day and owner, loaded with one range query per
+  day and kept for `ttl` seconds or until invalidated.'''
+
+  def __init__(self, max_days=512, ttl=60):
+    self.max_days = max_days
+    self.ttl = ttl
+    self.days = OrderedDict()
+    self.lock = threading.Lock()
+
+  def day(self, column, day):
+    key = (column.key, day)
+    with self.lock:
+      entry = self.days.get(key)
+      if entry is not None and entry[1] > time.monotonic():
+        self.days.move_to_end(key)
+        return entry[0]
+
+    midnight = datetime.combine(day, datetime.min.time())
+    starts = defaultdict(list)
+    for owner, start_time in db.session.query(column, Show.start_time).filter(
+        Show.start_time >= midnight, Show.start_time < midnight + timedelta(days=1)):
+      starts[owner].append(start_time)
+    for owner_starts in starts.values():
+      owner_starts.sort()
+
+    with self.lock:
+      self.days[key] = (starts, time.monotonic() + self.ttl)
+      while len(self.days) > self.max_days:
+        self.days.popitem(last=False)
+    return starts
+
+  def starts(self, column, start, end, length):
+    '''{owner id: sorted start times} of the shows that may overlap
+    [start, end), `column` being Show.venue_id or Show.artist_id.'''
+    merged = defaultdict(list)
+    day, last = (start - length).date(), (end - timedelta(microseconds=1)).date()
+    while day <= last:
+      # days come in order, so the merged lists stay sorted
+      for owner, owner_starts in self.day(column, day).items():
+        merged[owner].extend(owner_starts)
+      day += timedelta(days=1)
+    return merged
+
+  def invalidate(self, *start_times):
+    '''Forget the days of the given show start times, or everything.'''
+    with self.lock:
+      if not start_times:
+        self.days.clear()
+        return
+      days = {start_time.date() for start_time in start_times}
+      for key in [key for key in self.days if key[1] in days]:
+        del self.days[key]
+
+
+calendar = Calendar()
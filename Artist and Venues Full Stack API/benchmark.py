@@ -0,0 +1,634 @@
+"""Micro-benchmarks for Fyyur.
+
+The benchmarks drop and recreate every table, so they refuse to run unless
+DATABASE_URL points at a scratch database, e.g.
+
+    DATABASE_URL=sqlite:////tmp/fyyur-bench.db python benchmark.py search --rows 100000
+
+Benchmarks that don't touch the database run without it:
+
+    python benchmark.py phones
+
+`suite` seeds a database at one of the sampledata.SCALES and drives every
+route, writing a JSON report that `compare` diffs against another one:
+
+    DATABASE_URL=sqlite:////tmp/fyyur-bench.db python benchmark.py suite --scale 10k --output new.json
+    python benchmark.py compare old.json new.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import babel.dates
+import dateutil.parser
+import phonenumbers
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from datetime import datetime, timedelta
+
+from app import app, cache, db, Venue, Artist, Show, format_datetimes, venues_near
+from availability import calendar, free_intervals
+from geo import distance_km, encode, gazetteer
+from models import RecommendedArtist
+from partitions import add_months, create_partitions, month_start, partitions
+from phones import normalize
+from queries import shows_page
+from recommendations import rebuild, refresh
+from sampledata import SCALES, VENUE_WORDS, ARTIST_WORDS, generate, phone
+from search import ilike_contains, search
+from werkzeug.serving import make_server
+
+WORDS = ['Musical', 'Hop', 'Park', 'Square', 'Live', 'Music', 'Coffee', 'Dueling',
+         'Pianos', 'Bar', 'Hall', 'Lounge', 'Club', 'Garden', 'Theatre', 'Cellar']
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'),
+          ('Chicago', 'IL'), ('Seattle', 'WA'), ('Boston', 'MA')]
+
+
+def timed(fn, repeat):
+    """Median wall time of `fn` in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def reset_database():
+    if 'DATABASE_URL' not in os.environ:
+        sys.exit('Set DATABASE_URL to a scratch database to run this benchmark.')
+    db.drop_all()
+    db.create_all()
+
+
+def insert_in_chunks(table, rows, chunk=10000):
+    for i in range(0, len(rows), chunk):
+        db.session.execute(table.insert(), rows[i:i + chunk])
+        db.session.commit()
+
+
+def random_name(rng):
+    return ' '.join(rng.sample(WORDS, 3)) + f' {rng.randrange(10000)}'
+
+
+def bench_search(args):
+    """Indexed, ranked search against the plain ILIKE scan it replaced."""
+    rng = random.Random(args.seed)
+    reset_database()
+    for model in (Venue, Artist):
+        rows = []
+        for i in range(args.rows):
+            city, state = rng.choice(CITIES)
+            rows.append({'name': random_name(rng), 'city': city, 'state': state})
+        insert_in_chunks(model.__table__, rows)
+
+    for term in args.terms:
+        def ilike_scan():
+            db.session.query(Venue.id, Venue.name).filter(
+                ilike_contains(Venue.name, term)).order_by(Venue.id).limit(50).all()
+
+        def indexed():
+            search(db.session.query(Venue.id, Venue.name), Venue, term).limit(50).all()
+
+        print(f'{term!r:>12}  ilike scan {timed(ilike_scan, args.repeat):8.2f} ms'
+              f'   indexed search {timed(indexed, args.repeat):8.2f} ms')
+
+
+def bench_phones(args):
+    """Per-call cost of phone validation, uncached against memoised."""
+    rng = random.Random(args.seed)
+    distinct = [f'+1 415 {rng.randrange(200, 999)} {rng.randrange(1000, 9999)}'
+                for _ in range(args.distinct)]
+    calls = [rng.choice(distinct) for _ in range(args.calls)]
+
+    def uncached():
+        for number in calls:
+            phonenumbers.is_valid_number(phonenumbers.parse(number))
+
+    def memoised():
+        normalize.cache_clear()
+        for number in calls:
+            normalize(number)
+
+    for label, fn in (('uncached', uncached), ('memoised', memoised)):
+        per_call = timed(fn, args.repeat) * 1000 / len(calls)
+        print(f'{label:>10}  {per_call:8.2f} us per call')
+
+
+def bench_render(args):
+    """Date formatting and full render of one large /shows page."""
+    reset_database()
+    insert_in_chunks(Venue.__table__, [{'name': f'Venue {i}'} for i in range(100)])
+    insert_in_chunks(Artist.__table__, [{'name': f'Artist {i}'} for i in range(100)])
+    start = datetime.now() + timedelta(days=1)
+    insert_in_chunks(Show.__table__, [
+        {'venue_id': i % 100 + 1, 'artist_id': i // 100 % 100 + 1, 'start_time': start + timedelta(minutes=i)}
+        for i in range(args.rows)])
+    start_times = [start + timedelta(minutes=i) for i in range(args.rows)]
+
+    def reparse_each():
+        # what the datetime filter did per row before
+        for value in start_times:
+            babel.dates.format_datetime(dateutil.parser.parse(str(value)),
+                                        "EEEE MMMM, d, y 'at' h:mma", locale='en')
+
+    def vectorised():
+        format_datetimes(start_times, 'full')
+
+    print(f'format {args.rows} start times: reparse each {timed(reparse_each, args.repeat):8.2f} ms'
+          f'   vectorised {timed(vectorised, args.repeat):8.2f} ms')
+
+    app.config['SHOWS_MAX_PER_PAGE'] = args.rows
+    client = app.test_client()
+
+    def render():
+        cache.clear()
+        client.get(f'/shows?per_page={args.rows}')
+
+    print(f'render /shows with {args.rows} rows: {timed(render, args.repeat):8.2f} ms')
+
+
+def bench_nearby(args):
+    """Radius queries over geohash ranges against a scan of every venue."""
+    rng = random.Random(args.seed)
+    reset_database()
+    points = [(rng.uniform(25, 48), rng.uniform(-124, -70)) for _ in range(args.rows)]
+    insert_in_chunks(Venue.__table__, [
+        {'name': random_name(rng), 'latitude': lat, 'longitude': lon, 'geohash': encode(lat, lon)}
+        for lat, lon in points])
+    centres = [(rng.uniform(30, 45), rng.uniform(-120, -75)) for _ in range(args.repeat)]
+
+    for radius in args.radius:
+        def scan():
+            for lat, lon in centres:
+                [row for row in db.session.query(Venue.id, Venue.latitude, Venue.longitude)
+                 if distance_km(lat, lon, row.latitude, row.longitude) <= radius]
+
+        def indexed():
+            for lat, lon in centres:
+                venues_near(lat, lon, radius, 50)
+
+        print(f'{radius:>6} km  scan {timed(scan, 1) / len(centres):8.2f} ms'
+              f'   geohash {timed(indexed, 1) / len(centres):8.2f} ms')
+
+
+def bench_availability(args):
+    """Free venue slots on Friday nights, with a year of shows loaded."""
+    rng = random.Random(args.seed)
+    reset_database()
+    venues = max(args.shows // 500, 1)
+    insert_in_chunks(Venue.__table__, [{'name': f'Venue {i}'} for i in range(venues)])
+    insert_in_chunks(Artist.__table__, [{'name': f'Artist {i}'} for i in range(venues // 2 or 1)])
+    start = datetime(2035, 1, 1)
+    # show k of every venue starts 17 hours after the previous one
+    insert_in_chunks(Show.__table__, [
+        {'venue_id': i % venues + 1, 'artist_id': rng.randrange(1, (venues // 2 or 1) + 1),
+         'start_time': start + timedelta(hours=i // venues * 17 + i % 17)}
+        for i in range(args.shows)], chunk=50000)
+
+    length = timedelta(minutes=app.config['SHOW_LENGTH_MINUTES'])
+    fridays = [datetime(2035, 1, 5) + timedelta(weeks=week, hours=18) for week in range(args.repeat)]
+
+    def free_venues():
+        for friday in fridays:
+            end = friday + timedelta(hours=7)
+            starts = calendar.starts(Show.venue_id, friday, end, length)
+            [venue_id for venue_id in range(1, venues + 1)
+             if free_intervals(starts.get(venue_id, []), friday, end, length, length)]
+
+    def cold():
+        calendar.invalidate()
+        free_venues()
+
+    print(f'{args.shows} shows, {venues} venues, free venues on one Friday night: '
+          f'cold {timed(cold, 3) / len(fridays):8.2f} ms   cached {timed(free_venues, 3) / len(fridays):8.2f} ms')
+
+    client = app.test_client()
+    def page():
+        client.get('/api/v1/venues/availability?start=2035-03-02T18:00:00&end=2035-03-03T01:00:00&limit=500')
+    print(f'/api/v1/venues/availability page of 500: {timed(page, args.repeat):8.2f} ms')
+
+
+def bench_booking(args):
+    """Concurrent show bookings, many of them for the same venue slots."""
+    rng = random.Random(args.seed)
+    reset_database()
+    insert_in_chunks(Venue.__table__, [{'name': f'Venue {i}'} for i in range(args.venues)])
+    insert_in_chunks(Artist.__table__, [{'name': f'Artist {i}'} for i in range(args.venues)])
+    start = datetime.now() + timedelta(days=1)
+    # slots a show length apart, so only bookings of the same slot conflict
+    length = timedelta(minutes=app.config['SHOW_LENGTH_MINUTES'])
+    slots = [(venue_id, start + slot * length)
+             for venue_id in range(1, args.venues + 1) for slot in range(args.slots)]
+    requests = [rng.choice(slots) for _ in range(args.requests)]
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    def book(slot):
+        venue_id, start_time = slot
+        started = time.perf_counter()
+        status = app.test_client().post('/shows/create', data={
+            'venue_id': venue_id, 'artist_id': rng.randrange(1, args.venues + 1),
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')}).status_code
+        return status, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(book, requests))
+    elapsed = time.perf_counter() - started
+
+    statuses = [status for status, _ in results]
+    latencies = sorted(latency for _, latency in results)
+    booked = db.session.query(Show.venue_id, Show.start_time).count()
+    distinct = db.session.query(Show.venue_id, Show.start_time).distinct().count()
+    print(f'{len(requests)} requests on {args.threads} threads: {len(requests) / elapsed:8.1f} req/s'
+          f'   p50 {latencies[len(latencies) // 2]:6.2f} ms   p95 {latencies[int(len(latencies) * .95)]:6.2f} ms')
+    print(f'booked {statuses.count(200)}, conflicts {statuses.count(409)}, errors '
+          f'{len(statuses) - statuses.count(200) - statuses.count(409)}, '
+          f'shows {booked}, double bookings {booked - distinct}')
+
+
+def bench_partitions(args):
+    """Upcoming show queries as the history of a partitioned show table grows."""
+    if db.engine.dialect.name != 'postgresql':
+        sys.exit('The show table is only partitioned on PostgreSQL.')
+    rng = random.Random(args.seed)
+    this_month = month_start(datetime.now())
+    evening = datetime.now().replace(hour=20, minute=0, second=0, microsecond=0)
+    friday = evening + timedelta(days=(4 - evening.weekday()) % 7 + 7)
+    for years in args.years:
+        reset_database()
+        insert_in_chunks(Venue.__table__, [{'name': f'Venue {i}'} for i in range(args.shows_per_day)])
+        insert_in_chunks(Artist.__table__, [{'name': f'Artist {i}'} for i in range(args.shows_per_day)])
+        create_partitions(db.session.connection(), add_months(this_month, -12 * years), add_months(this_month, 6))
+        db.session.commit()
+        # the same six months of upcoming shows each round, `years` of history before them
+        rows = [{'venue_id': venue_id, 'artist_id': rng.randint(1, args.shows_per_day),
+                 'start_time': evening + timedelta(days=day)}
+                for day in range(-365 * years, 180) for venue_id in range(1, args.shows_per_day + 1)]
+        insert_in_chunks(Show.__table__, rows, chunk=50000)
+        db.session.execute('ANALYZE show')
+        db.session.commit()
+
+        def upcoming_page():
+            shows_page(30)
+
+        def upcoming_counts():
+            # counted live, as the pages did before counters.py
+            db.session.query(Show.venue_id, func.count()).filter(
+                Show.venue_id.in_(range(1, 51)), Show.start_time > datetime.now()).group_by(Show.venue_id).all()
+
+        def one_night():
+            db.session.query(Show.venue_id, Show.start_time).filter(
+                Show.start_time >= friday, Show.start_time < friday + timedelta(days=1)).all()
+
+        print(f'{years:>3} years, {len(rows):>8} shows, {len(partitions(db.session.connection())):>3} partitions:'
+              f'   upcoming page {timed(upcoming_page, args.repeat):6.2f} ms'
+              f'   upcoming counts {timed(upcoming_counts, args.repeat):6.2f} ms'
+              f'   one night {timed(one_night, args.repeat):6.2f} ms')
+
+
+def bench_recommendations(args):
+    """Rebuilding the recommended artists, reading and refreshing one list."""
+    reset_database()
+    venues, artists, shows = SCALES[args.scale]
+    generate(venues, artists, shows, seed=args.seed)
+    rng = random.Random(args.seed)
+    count, similar = app.config['RECOMMENDATIONS_PER_PAGE'], app.config['RECOMMENDATIONS_SIMILAR_VENUES']
+
+    started = time.perf_counter()
+    rebuild(db.session.connection(), count, similar)
+    db.session.commit()
+    print(f'rebuild of {shows} shows: {time.perf_counter() - started:.1f} s')
+
+    def lookup():
+        # the list as the detail pages load it, joined to its owner
+        model = rng.choice([Venue, Artist])
+        model.query.options(joinedload(model.recommendations).joinedload(RecommendedArtist.artist)).get(
+            rng.randint(1, min(venues, artists)))
+        db.session.expunge_all()
+
+    def first_pair():
+        # the lists are rewritten in place, the show itself needn't be new
+        venue_id, artist_id = db.session.query(Show.venue_id, Show.artist_id).filter(
+            Show.venue_id == rng.randint(1, venues)).first() or (1, 1)
+        refresh(db.session.connection(), venue_id, artist_id, count, similar)
+        db.session.rollback()
+
+    print(f'lookup {timed(lookup, args.repeat):6.2f} ms   refresh {timed(first_pair, args.repeat):6.2f} ms')
+
+
+def percentile(samples, p):
+    """Nearest rank percentile of the sorted `samples`."""
+    return samples[max(math.ceil(p / 100 * len(samples)) - 1, 0)]
+
+
+def summarise(results, elapsed):
+    """Report entry of (status, milliseconds, statements) results."""
+    latencies = sorted(ms for _, ms, _ in results)
+    statements = [count for _, _, count in results if count is not None]
+    return {
+        'requests': len(results),
+        'status': dict(sorted(Counter(str(status) for status, _, _ in results).items())),
+        'rps': round(len(results) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'sql_mean': round(statistics.mean(statements), 2) if statements else None,
+        'sql_max': max(statements, default=None),
+    }
+
+
+def workload(venues, artists):
+    """(method, rule) -> function of a random generator returning the path
+    and form data of one request to that route."""
+    cities = sorted(gazetteer().values())
+    serial = itertools.count()
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+
+    def venue_id(rng):
+        return rng.randint(1, venues)
+
+    def artist_id(rng):
+        return rng.randint(1, artists)
+
+    def term(rng, words):
+        return urllib.parse.quote(rng.choice(rng.choice(words)))
+
+    def window(rng):
+        start = now + timedelta(days=rng.randrange(1, 180))
+        return (f'?start={start.replace(hour=18):%Y-%m-%dT%H:%M:%S}'
+                f'&end={start.replace(hour=23, minute=59):%Y-%m-%dT%H:%M:%S}')
+
+    def nearby(rng):
+        lat, lon = rng.choice(cities)
+        return f'/api/v1/venues/nearby?lat={lat}&lng={lon}&radius={rng.choice([5, 25, 100])}', None
+
+    def listed(kind, rng):
+        number = next(serial)
+        city, state = rng.choice(CITIES)
+        return f'/{kind}/create', {
+            'name': f'Benchmark {kind} {number}', 'city': city, 'state': state,
+            'address': f'{number} Main Street', 'phone': phone(rng),
+            'genres': ['Jazz'], 'image_link': f'https://images.example.com/{number}.jpg',
+            'facebook_link': f'https://www.facebook.com/{number}', 'website': f'https://{number}.example.com'}
+
+    def booking(rng):
+        # far enough ahead to hit free slots most of the time
+        start_time = now + timedelta(days=rng.randrange(400, 4000), hours=rng.randrange(24))
+        return '/shows/create', {'venue_id': venue_id(rng), 'artist_id': artist_id(rng),
+                                 'start_time': f'{start_time:%Y-%m-%d %H:%M:%S}'}
+
+    return {
+        ('GET', '/'): lambda rng: ('/', None),
+        ('GET', '/venues'): lambda rng: ('/venues', None),
+        ('POST', '/venues/search'): lambda rng: ('/venues/search', {'search_term': term(rng, VENUE_WORDS)}),
+        ('GET', '/api/v1/venues/nearby'): nearby,
+        ('GET', '/venues/<int:venue_id>'): lambda rng: (f'/venues/{venue_id(rng)}', None),
+        ('GET', '/venues/create'): lambda rng: ('/venues/create', None),
+        ('POST', '/venues/create'): lambda rng: listed('venues', rng),
+        ('GET', '/artists'): lambda rng: ('/artists', None),
+        ('POST', '/artists/search'): lambda rng: ('/artists/search', {'search_term': term(rng, ARTIST_WORDS)}),
+        ('GET', '/artists/<int:artist_id>'): lambda rng: (f'/artists/{artist_id(rng)}', None),
+        ('GET', '/artists/create'): lambda rng: ('/artists/create', None),
+        ('POST', '/artists/create'): lambda rng: listed('artists', rng),
+        ('GET', '/shows'): lambda rng: ('/shows', None),
+        ('GET', '/shows/create'): lambda rng: ('/shows/create', None),
+        ('POST', '/shows/create'): booking,
+        ('GET', '/thumbnails/<name>'): lambda rng: (f'/thumbnails/{rng.getrandbits(256):064x}.jpg', None),
+        ('GET', '/cache/stats'): lambda rng: ('/cache/stats', None),
+        ('GET', '/metrics'): lambda rng: ('/metrics', None),
+        ('GET', '/api/v1/venues'): lambda rng: ('/api/v1/venues?fields=id,name,num_upcoming_shows', None),
+        ('GET', '/api/v1/venues/availability'): lambda rng: ('/api/v1/venues/availability' + window(rng), None),
+        ('GET', '/api/v1/venues/<int:venue_id>'): lambda rng: (f'/api/v1/venues/{venue_id(rng)}', None),
+        ('GET', '/api/v1/venues/search'): lambda rng: (f'/api/v1/venues/search?q={term(rng, VENUE_WORDS)}', None),
+        ('GET', '/api/v1/artists'): lambda rng: ('/api/v1/artists?fields=id,name,genres', None),
+        ('GET', '/api/v1/artists/availability'): lambda rng: ('/api/v1/artists/availability' + window(rng), None),
+        ('GET', '/api/v1/artists/<int:artist_id>'): lambda rng: (f'/api/v1/artists/{artist_id(rng)}', None),
+        ('GET', '/api/v1/artists/search'): lambda rng: (f'/api/v1/artists/search?q={term(rng, ARTIST_WORDS)}', None),
+        ('GET', '/api/v1/shows'): lambda rng: ('/api/v1/shows', None),
+        ('GET', '/api/v1/shows/export'): lambda rng: ('/api/v1/shows/export' + window(rng).replace(
+            'start=', 'since=').replace('end=', 'until='), None),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def bench_suite(args):
+    """Every route through the test client, then concurrently over HTTP."""
+    reset_database()
+    venues, artists, shows = SCALES[args.scale]
+    started = time.perf_counter()
+    seeded = generate(venues, artists, shows, seed=args.seed)
+    rebuild(db.session.connection(), app.config['RECOMMENDATIONS_PER_PAGE'],
+            app.config['RECOMMENDATIONS_SIMILAR_VENUES'])
+    db.session.commit()
+    seed_seconds = time.perf_counter() - started
+    cache.clear()
+    calendar.invalidate()
+    print(f'seeded {seeded} in {seed_seconds:.1f} s', file=sys.stderr)
+
+    routes = workload(venues, artists)
+    rules = {(method, rule.rule) for rule in app.url_map.iter_rules() if rule.endpoint != 'static'
+             for method in rule.methods & {'GET', 'POST'}}
+    if rules - set(routes):
+        sys.exit(f'No workload for {sorted(rules - set(routes))}, add it to benchmark.workload().')
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    # X-Query-Count, without failing or logging requests over budget
+    app.config['QUERY_BUDGET_ENABLED'] = True
+    app.config['QUERY_BUDGET_STRICT'] = False
+    app.logger.setLevel(logging.ERROR)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    rng = random.Random(args.seed)
+    client = app.test_client()
+
+    def query_count(headers):
+        count = headers.get('X-Query-Count')
+        return int(count) if count is not None else None
+
+    report = {
+        'meta': {
+            'commit': git_commit(), 'scale': args.scale, 'seed': args.seed, 'rows': seeded,
+            'seed_seconds': round(seed_seconds, 1), 'dialect': db.engine.dialect.name,
+            'python': platform.python_version(), 'created': datetime.now().isoformat(timespec='seconds'),
+        },
+        'client': {},
+    }
+    for (method, rule), make in sorted(routes.items(), key=lambda item: item[0][::-1]):
+        results = []
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            path, data = make(rng)
+            request_started = time.perf_counter()
+            response = client.open(path, method=method, data=data)
+            results.append((response.status_code, (time.perf_counter() - request_started) * 1000,
+                            query_count(response.headers)))
+        report['client'][f'{method} {rule}'] = summarise(results, time.perf_counter() - started)
+
+    # Mixed workload from concurrent clients against a threaded server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    mix = sorted(routes.items(), key=lambda item: item[0][::-1])
+    schedule = [rng.choice(mix) for _ in range(args.http_requests)]
+    seeds = [rng.getrandbits(32) for _ in schedule]
+
+    def call(job):
+        ((method, rule), make), seed = job
+        path, data = make(random.Random(seed))
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+        request = urllib.request.Request(base + path, data=body, method=method)
+        request_started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                status, headers = response.status, response.headers
+        except urllib.error.HTTPError as e:
+            status, headers = e.code, e.headers
+        return f'{method} {rule}', (status, (time.perf_counter() - request_started) * 1000, query_count(headers))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(call, zip(schedule, seeds)))
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    by_route = {}
+    for route, result in results:
+        by_route.setdefault(route, []).append(result)
+    report['http'] = {
+        'threads': args.threads,
+        'total': summarise([result for _, result in results], elapsed),
+        'routes': {route: summarise(by_route[route], elapsed) for route in sorted(by_route)},
+    }
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+def bench_compare(args):
+    """Latency and statement count changes between two suite reports."""
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"{old['meta']['commit']} -> {new['meta']['commit']}")
+    regressions = 0
+    for section in ('client', 'http'):
+        old_routes = old[section] if section == 'client' else old[section]['routes']
+        new_routes = new[section] if section == 'client' else new[section]['routes']
+        print(f'\n{section:<44} {"p50 ms":>17} {"p95 ms":>17} {"p99 ms":>17} {"sql":>11}')
+        for route in sorted(set(old_routes) | set(new_routes)):
+            if route not in old_routes or route not in new_routes:
+                print(f'{route:<44} only in {"new" if route in new_routes else "old"}')
+                continue
+            before, after = old_routes[route], new_routes[route]
+            columns = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                change = (after[key] - before[key]) / before[key] * 100 if before[key] else 0
+                columns.append(f'{after[key]:8.2f} {change:+7.1f}%')
+            sql = f'{before["sql_max"]} -> {after["sql_max"]}'
+            # sub-millisecond routes are too noisy to judge by percentage alone
+            slower = (after['p95_ms'] - before['p95_ms'] > args.min_ms and
+                      (after['p95_ms'] - before['p95_ms']) / (before['p95_ms'] or 1) * 100 > args.threshold)
+            more_sql = (after['sql_max'] or 0) > (before['sql_max'] or 0)
+            flag = '  <-- regression' if slower or more_sql else ''
+            regressions += bool(flag)
+            print(f'{route:<44} {" ".join(columns)} {sql:>11}{flag}')
+    if regressions:
+        sys.exit(f'\n{regressions} routes regressed: p95 over {args.threshold}% and {args.min_ms} ms slower, '
+                 f'or more statements.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    search_parser = commands.add_parser('search', help=bench_search.__doc__)
+    search_parser.add_argument('--rows', type=int, default=100000)
+    search_parser.add_argument('--terms', nargs='+', default=['Pianos 12', 'Lounge', 'Austin'])
+    search_parser.set_defaults(run=bench_search)
+
+    phones_parser = commands.add_parser('phones', help=bench_phones.__doc__)
+    phones_parser.add_argument('--calls', type=int, default=100000)
+    phones_parser.add_argument('--distinct', type=int, default=2000)
+    phones_parser.set_defaults(run=bench_phones)
+
+    render_parser = commands.add_parser('render', help=bench_render.__doc__)
+    render_parser.add_argument('--rows', type=int, default=5000)
+    render_parser.set_defaults(run=bench_render)
+
+    nearby_parser = commands.add_parser('nearby', help=bench_nearby.__doc__)
+    nearby_parser.add_argument('--rows', type=int, default=100000)
+    nearby_parser.add_argument('--radius', type=float, nargs='+', default=[5, 25, 100])
+    nearby_parser.set_defaults(run=bench_nearby)
+
+    availability_parser = commands.add_parser('availability', help=bench_availability.__doc__)
+    availability_parser.add_argument('--shows', type=int, default=1000000)
+    availability_parser.set_defaults(run=bench_availability)
+
+    booking_parser = commands.add_parser('booking', help=bench_booking.__doc__)
+    booking_parser.add_argument('--requests', type=int, default=2000)
+    booking_parser.add_argument('--threads', type=int, default=16)
+    booking_parser.add_argument('--venues', type=int, default=20)
+    booking_parser.add_argument('--slots', type=int, default=20)
+    booking_parser.set_defaults(run=bench_booking)
+
+    partitions_parser = commands.add_parser('partitions', help=bench_partitions.__doc__)
+    partitions_parser.add_argument('--years', type=int, nargs='+', default=[1, 5, 10])
+    partitions_parser.add_argument('--shows-per-day', type=int, default=200)
+    partitions_parser.set_defaults(run=bench_partitions)
+
+    recommendations_parser = commands.add_parser('recommendations', help=bench_recommendations.__doc__)
+    recommendations_parser.add_argument('--scale', choices=sorted(SCALES), default='10k')
+    recommendations_parser.set_defaults(run=bench_recommendations)
+
+    suite_parser = commands.add_parser('suite', help=bench_suite.__doc__)
+    suite_parser.add_argument('--scale', choices=sorted(SCALES), default='10k')
+    suite_parser.add_argument('--requests', type=int, default=50, help='Test client requests per route.')
+    suite_parser.add_argument('--http-requests', type=int, default=2000)
+    suite_parser.add_argument('--threads', type=int, default=16)
+    suite_parser.add_argument('--output', help='Report file, standard output by default.')
+    suite_parser.set_defaults(run=bench_suite)
+
+    compare_parser = commands.add_parser('compare', help=bench_compare.__doc__)
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=10, help='Allowed p95 slowdown in percent.')
+    compare_parser.add_argument('--min-ms', type=float, default=1, help='Ignore p95 slowdowns smaller than this.')
+    compare_parser.set_defaults(run=bench_compare)
+
+    args = parser.parse_args()
+    with app.app_context():
+        args.run(args)
+
+
+if __name__ == '__main__':
+    main()
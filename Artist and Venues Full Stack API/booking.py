@@ -0,0 +1,71 @@
+#----------------------------------------------------------------------------#
+# Show booking.
+#
+# A venue hosts one show at a time: a show takes it for SHOW_LENGTH_MINUTES,
+# so no other show of the venue may start less than that before or after
+# it. Bookings of the same venue are serialised by locking the venue row
+# (SELECT ... FOR UPDATE) for the rest of the transaction. On databases
+# without row locks, such as SQLite, the unique (venue_id, start_time)
+# constraint on show still rules out two shows starting at the same time.
+#----------------------------------------------------------------------------#
+from sqlalchemy.exc import IntegrityError
+
+from counters import rolled_until
+from models import db, Show, Venue, Artist
+
+
+class BookingError(Exception):
+  '''A show that can't be booked. `field` names the offending form field.'''
+
+  def __init__(self, field, message):
+    super().__init__(message)
+    self.field = field
+    self.message = message
+
+
+class SlotTaken(BookingError):
+  def __init__(self):
+    super().__init__('start_time', 'The venue already has a show at that time.')
+
+
+def is_slot_taken(error):
+  '''Whether the IntegrityError `error` is a unique violation on show. Both
+  of its unique keys, the primary key and (venue_id, start_time), include
+  the venue and start time. On PostgreSQL the violation is reported
+  against the month partition, show_yYYYYmMM.'''
+  orig = error.orig
+  if getattr(orig, 'pgcode', None) is not None:
+    return orig.pgcode == '23505' and (orig.diag.table_name or '').startswith('show')
+  return str(orig).startswith('UNIQUE constraint failed: show.')
+
+
+def book_show(venue_id, artist_id, start_time, length):
+  '''Create and commit the show, in one transaction. Raises BookingError for
+  an unknown venue or artist and SlotTaken when the venue has a show
+  overlapping it, shows lasting `length` (a timedelta).'''
+  try:
+    # The counter watermark first, in the order roll_forward() locks it and
+    # then the venue rows, see counters.adjust()
+    rolled_until(db.session.connection(), share=True)
+    venue = Venue.query.filter(Venue.id == venue_id).with_for_update().first()
+    if venue is None:
+      raise BookingError('venue_id', 'No such venue.')
+    if db.session.query(Artist.id).filter(Artist.id == artist_id).first() is None:
+      raise BookingError('artist_id', 'No such artist.')
+    if db.session.query(Show.venue_id).filter(
+        Show.venue_id == venue_id, Show.start_time > start_time - length,
+        Show.start_time < start_time + length).first() is not None:
+      raise SlotTaken()
+    show = Show(venue_id=venue_id, artist_id=artist_id, start_time=start_time)
+    db.session.add(show)
+    db.session.commit()
+  except IntegrityError as e:
+    db.session.rollback()
+    if not is_slot_taken(e):
+      raise
+    # A concurrent booking won the race for the slot
+    raise SlotTaken()
+  except BookingError:
+    db.session.rollback()
+    raise
+  return show
@@ -0,0 +1,132 @@
+#----------------------------------------------------------------------------#
+# Rendered fragment cache for the listing pages.
+#
+# Fragments are keyed by route and query arguments and live in a backend:
+# an in-process LRU with per-entry TTLs by default, or any Redis-compatible
+# server. Create handlers invalidate the routes whose output they change.
+#
+# An invalidation only reaches the LRU of the process making it: entries
+# cached by other app workers, or by the app when a `flask` command writes,
+# stay until they expire. The LRU therefore caps every TTL at
+# CACHE_MEMORY_TTL, use Redis where listings must change on the next request.
+#----------------------------------------------------------------------------#
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from urllib.parse import urlencode
+
+
+class LRUCache(object):
+  '''Bounded in-process cache, least recently used entries go first.'''
+
+  def __init__(self, max_entries=1024, max_ttl=None):
+    self.max_entries = max_entries
+    self.max_ttl = max_ttl
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        return None
+      value, expires = entry
+      if expires <= time.monotonic():
+        del self.entries[key]
+        return None
+      self.entries.move_to_end(key)
+      return value
+
+  def set(self, key, value, ttl):
+    if self.max_ttl is not None:
+      ttl = min(ttl, self.max_ttl)
+    with self.lock:
+      self.entries[key] = (value, time.monotonic() + ttl)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.max_entries:
+        self.entries.popitem(last=False)
+
+  def delete_prefix(self, prefix):
+    with self.lock:
+      for key in [key for key in self.entries if key.startswith(prefix)]:
+        del self.entries[key]
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+
+
+class RedisCache(object):
+  '''Cache stored in a Redis-compatible server, shared by all workers.'''
+
+  def __init__(self, url, namespace='fyyur:fragment:'):
+    import redis
+    self.client = redis.Redis.from_url(url)
+    self.namespace = namespace
+
+  def get(self, key):
+    value = self.client.get(self.namespace + key)
+    return None if value is None else value.decode('utf-8')
+
+  def set(self, key, value, ttl):
+    self.client.setex(self.namespace + key, max(1, math.ceil(ttl)), value)
+
+  def delete_prefix(self, prefix):
+    keys = list(self.client.scan_iter(match=self.namespace + prefix + '*'))
+    if keys:
+      self.client.delete(*keys)
+
+  def clear(self):
+    self.delete_prefix('')
+
+
+class FragmentCache(object):
+  '''Caches rendered fragments per route and counts hits and misses.'''
+
+  def __init__(self, backend):
+    self.backend = backend
+    self.lock = threading.Lock()
+    self.hits = Counter()
+    self.misses = Counter()
+    self.invalidations = Counter()
+
+  @classmethod
+  def from_config(cls, config):
+    if config['CACHE_BACKEND'] == 'redis':
+      return cls(RedisCache(config['CACHE_REDIS_URL']))
+    return cls(LRUCache(config['CACHE_MAX_ENTRIES'], config['CACHE_MEMORY_TTL']))
+
+  @staticmethod
+  def key(route, args):
+    return f'{route}:' + urlencode(sorted(args.items(multi=True)))
+
+  def fragment(self, route, args, ttl, render):
+    '''The cached fragment of `route` for request `args`, calling `render`
+    and keeping its result for `ttl` seconds on a miss.'''
+    key = self.key(route, args)
+    fragment = self.backend.get(key)
+    with self.lock:
+      (self.misses if fragment is None else self.hits)[route] += 1
+    if fragment is None:
+      fragment = render()
+      self.backend.set(key, fragment, ttl)
+    return fragment
+
+  def invalidate(self, *routes):
+    for route in routes:
+      self.backend.delete_prefix(f'{route}:')
+      with self.lock:
+        self.invalidations[route] += 1
+
+  def clear(self):
+    self.backend.clear()
+
+  def stats(self):
+    with self.lock:
+      return {
+        'backend': type(self.backend).__name__,
+        'hits': dict(self.hits),
+        'misses': dict(self.misses),
+        'invalidations': dict(self.invalidations),
+      }
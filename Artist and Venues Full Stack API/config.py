@@ -1,13 +1,153 @@
 import os
-SECRET_KEY = os.urandom(32)
+
+from metrics import TimedQueuePool
+# Set SECRET_KEY when running several processes, so they accept each
+# other's session cookies
+SECRET_KEY = os.getenv('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 # Enable debug mode.
 DEBUG = True
 
+# Largest number of hits returned by one venue/artist search request
+SEARCH_RESULTS_PER_PAGE = 50
+
+# Largest radius, in kilometres, of a /api/v1/venues/nearby query
+NEARBY_MAX_RADIUS_KM = 500
+
+# Every show takes its venue and artist for SHOW_LENGTH_MINUTES. Availability
+# queries span at most AVAILABILITY_MAX_DAYS, the shows of a day are cached
+# for AVAILABILITY_TTL seconds.
+SHOW_LENGTH_MINUTES = 180
+AVAILABILITY_MAX_DAYS = 31
+AVAILABILITY_TTL = 60
+
+# Thumbnails of venue and artist images, made by `flask thumbnails`
+THUMBNAIL_DIR = os.getenv('THUMBNAIL_DIR', os.path.join(basedir, 'thumbnails'))
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_WORKERS = 8
+THUMBNAIL_FETCH_TIMEOUT = 10
+THUMBNAIL_MAX_BYTES = 10 * 1024 * 1024
+# Image links resolving to loopback, private or link-local addresses are
+# refused, set this only where every address is trusted, as in tests
+THUMBNAIL_ALLOW_PRIVATE = False
+
+# Page size of the /shows listing, and the largest page a client may ask for
+SHOWS_PER_PAGE = 30
+SHOWS_MAX_PER_PAGE = 200
+
+# Default and largest page size of the /api/v1 listings
+API_PER_PAGE = 50
+API_MAX_PER_PAGE = 500
+
+# Side effects of writes run by jobs.py: JOBS_WORKERS threads per app
+# process (0 leaves them all to `flask run-jobs`) claim JOBS_BATCH jobs at a
+# time for JOB_LEASE_SECONDS. A failed job is retried after
+# JOB_RETRY_SECONDS, doubled with every attempt, up to JOB_MAX_ATTEMPTS.
+JOBS_WORKERS = int(os.getenv('JOBS_WORKERS', '2'))
+JOBS_BATCH = 10
+JOBS_POLL_SECONDS = 5
+JOB_LEASE_SECONDS = 300
+JOB_RETRY_SECONDS = 30
+JOB_MAX_ATTEMPTS = 5
+
+# Artists recommended on venue and artist pages (recommendations.py): the
+# length of each list, and the number of similar venues whose artists a
+# venue is recommended
+RECOMMENDATIONS_PER_PAGE = 10
+RECOMMENDATIONS_SIMILAR_VENUES = 20
+
+# Monthly show partitions on PostgreSQL (partitions.py): `flask
+# show-partitions` keeps SHOW_PARTITION_MONTHS_AHEAD months ready, `flask
+# archive-shows` moves months older than SHOW_RETENTION_MONTHS to gzipped
+# CSV files in SHOW_ARCHIVE_DIR.
+SHOW_PARTITION_MONTHS_AHEAD = 12
+SHOW_RETENTION_MONTHS = 24
+SHOW_ARCHIVE_DIR = os.getenv('SHOW_ARCHIVE_DIR', os.path.join(basedir, 'archive'))
+
+# Rows fetched per round trip, and written per chunk, by the streaming show
+# export (/api/v1/shows/export and `flask export-shows`)
+EXPORT_CHUNK_ROWS = 1000
+
+# Cache of the rendered /venues, /artists and /shows listings. CACHE_BACKEND
+# is 'memory' (per process LRU) or 'redis' (any Redis-compatible server at
+# CACHE_REDIS_URL, needs the redis package). Listings showing upcoming
+# shows are kept for at most CACHE_UPCOMING_TTL seconds. /shows can't go
+# stale for longer than that, but the upcoming counts of /venues are the
+# counters of counters.py: a show that has started stays counted as upcoming
+# until the next `flask roll-show-counts`, so their real bound is the
+# interval it runs at, plus the TTL.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_MAX_ENTRIES = 1024
+CACHE_TTL = 600
+CACHE_UPCOMING_TTL = 60
+# Invalidations only clear the per process LRU of the process making them,
+# so writes of other workers and of `flask` commands show up in a 'memory'
+# cached listing once its entry expires, after CACHE_MEMORY_TTL at most.
+CACHE_MEMORY_TTL = 30
+
+# Statement counting per request (querybudget.py), on in development. A
+# request running more statements than the budget of its endpoint, or the
+# same statement QUERY_REPEAT_LIMIT times, is logged; with
+# QUERY_BUDGET_STRICT it fails, which the tests turn on.
+QUERY_BUDGET_ENABLED = DEBUG or os.getenv('QUERY_BUDGET') == '1'
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT') == '1'
+QUERY_REPEAT_LIMIT = 5
+QUERY_BUDGET_DEFAULT = 10
+QUERY_BUDGETS = {
+  'venues': 1,
+  'create_venue_submission': 5,
+  'show_venue': 2,
+  'search_venues': 2,
+  'artists': 1,
+  'create_artist_submission': 5,
+  'show_artist': 2,
+  'search_artists': 2,
+  'shows': 1,
+  'create_show_submission': 10,
+  'api.venues': 2,
+  'api.venue': 4,
+  'api.venue_availability': 4,
+  'api.nearby_venues': 1,
+  'api.search_venues': 2,
+  'api.artists': 2,
+  'api.artist': 4,
+  'api.artist_availability': 4,
+  'api.search_artists': 2,
+  'api.shows': 1,
+}
+
 # Connect to the database
 
 
 # TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgres://antaltettinger@localhost:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'postgres://antaltettinger@localhost:5432/fyyur')
+
+# Read replicas, comma separated in DATABASE_REPLICA_URLS. Read-only requests
+# use them in turn, a client reads from the primary for
+# REPLICA_STICKY_SECONDS after its last write so it sees it, which should be
+# well above the replication lag. Replicas are health checked every
+# REPLICA_CHECK_INTERVAL seconds, see replicas.py.
+SQLALCHEMY_REPLICA_URIS = [url for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url]
+REPLICA_STICKY_SECONDS = 10
+REPLICA_CHECK_INTERVAL = 10
+
+# Connection pool of each app process. Every gunicorn worker holds up to
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections to the primary and as many to
+# each replica, keep the number of workers times that below the server's
+# max_connections. DB_POOL_RECYCLE (seconds) retires connections before
+# server or proxy idle timeouts cut them, pre-ping tests a connection before
+# handing it out. Pool and query metrics are served at /metrics.
+SQLALCHEMY_ENGINE_OPTIONS = {
+  'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', '1') == '1',
+}
+if not SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+  SQLALCHEMY_ENGINE_OPTIONS.update(
+    poolclass=TimedQueuePool,
+    pool_size=int(os.getenv('DB_POOL_SIZE', '5')),
+    max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '10')),
+    pool_timeout=int(os.getenv('DB_POOL_TIMEOUT', '30')),
+    pool_recycle=int(os.getenv('DB_POOL_RECYCLE', '1800')),
+  )
@@ -0,0 +1,25 @@
+import pytest
+
+
+@pytest.fixture
+def query_budget():
+    """A test client for a fresh database whose requests fail when they run
+    more statements than their budget in config.QUERY_BUDGETS. Responses
+    carry the statement count in X-Query-Count."""
+    # Imported here so test modules can point DATABASE_URL elsewhere first
+    from app import app, cache, calendar, db
+
+    settings = {'TESTING': True, 'WTF_CSRF_ENABLED': False,
+                'QUERY_BUDGET_ENABLED': True, 'QUERY_BUDGET_STRICT': True}
+    saved = {key: app.config.get(key) for key in settings}
+    app.config.update(settings)
+    with app.app_context():
+        db.create_all()
+        cache.clear()
+        calendar.invalidate()
+        try:
+            yield app.test_client()
+        finally:
+            db.session.remove()
+            db.drop_all()
+            app.config.update(saved)
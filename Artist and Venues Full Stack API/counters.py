@@ -0,0 +1,108 @@
+#----------------------------------------------------------------------------#
+# Denormalised show counters on venues and artists.
+#
+# upcoming_shows_count and past_shows_count are split at a watermark,
+# show_counts.rolled_until: a show starting after it is upcoming. Inserting
+# or deleting a show adjusts the counters of its venue and artist in the same
+# transaction, and roll_forward(), run periodically with
+# `flask roll-show-counts`, moves the shows that started since the previous
+# run from upcoming to past. Until then those still count as upcoming, on
+# /venues too, however short the listing cache TTL.
+#----------------------------------------------------------------------------#
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import and_, bindparam, event, func, select
+
+from models import Show, ShowCounts, Venue, Artist
+
+# Counted entity -> its Show column
+owners = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+watermark = ShowCounts.__table__
+
+
+def recount(connection, now=None):
+  '''Recompute every counter from the show table, split at `now`.'''
+  now = now or datetime.now()
+  for model, column in owners:
+    def shows(condition):
+      return select([func.count()]).where(and_(column == model.id, condition)).as_scalar()
+    connection.execute(model.__table__.update().values(
+      upcoming_shows_count=shows(Show.start_time > now),
+      past_shows_count=shows(Show.start_time <= now)))
+  if connection.execute(watermark.update().values(rolled_until=now)).rowcount == 0:
+    connection.execute(watermark.insert().values(id=1, rolled_until=now))
+  return now
+
+def rolled_until(connection, lock=False, share=False):
+  # The current watermark, None if the counters were never computed. `lock`
+  # holds it until the end of the transaction, `share` lets other readers
+  # share the lock while keeping it from moving
+  query = select([watermark.c.rolled_until])
+  if lock or share:
+    query = query.with_for_update(read=share and not lock)
+  return connection.execute(query).scalar()
+
+def adjust(connection, shows, sign=1):
+  '''Count (venue_id, artist_id, start_time) `shows`, already written to the
+  show table, in (sign=1) or out (sign=-1) of their venue and artist
+  counters.'''
+  # A roll forward moving the watermark waits for this transaction, or this
+  # one for it, so the shows are counted against the watermark that stays
+  until = rolled_until(connection, share=True)
+  if until is None:
+    # Never counted, `flask roll-show-counts --recount` starts the counters
+    return
+  for model, column in owners:
+    deltas = defaultdict(lambda: [0, 0])
+    for show in shows:
+      deltas[show[0] if column is Show.venue_id else show[1]][show[2] <= until] += sign
+    update_counters(connection, model, deltas)
+
+def update_counters(connection, model, deltas):
+  # Add {id: [upcoming, past]} deltas to the counters, in id order so that
+  # concurrent transactions lock rows in the same order
+  if not deltas:
+    return
+  table = model.__table__
+  connection.execute(
+    table.update().where(table.c.id == bindparam('row_id')).values(
+      upcoming_shows_count=table.c.upcoming_shows_count + bindparam('upcoming'),
+      past_shows_count=table.c.past_shows_count + bindparam('past')),
+    [{'row_id': id, 'upcoming': upcoming, 'past': past}
+     for id, (upcoming, past) in sorted(deltas.items())])
+
+def roll_forward(connection, now=None):
+  '''Move the shows that started since the last run from upcoming to past.
+  Returns the number of shows moved.'''
+  now = now or datetime.now()
+  until = rolled_until(connection, lock=True)
+  if until is None:
+    recount(connection, now)
+    return 0
+  if now <= until:
+    return 0
+  started = and_(Show.start_time > until, Show.start_time <= now)
+  moved = {}
+  for model, column in owners:
+    rows = connection.execute(select([column, func.count()]).where(started).group_by(column))
+    deltas = {id: [-count, count] for id, count in rows}
+    update_counters(connection, model, deltas)
+    moved[model] = sum(past for _, past in deltas.values())
+  connection.execute(watermark.update().values(rolled_until=now))
+  # every show moved once for its venue and once for its artist
+  return moved[Venue]
+
+
+@event.listens_for(ShowCounts.__table__, 'after_create')
+def start_counting(table, connection, **kw):
+  # A new schema has no shows, all counters start right at zero
+  connection.execute(table.insert().values(id=1, rolled_until=datetime.now()))
+
+@event.listens_for(Show, 'after_insert')
+def count_inserted_show(mapper, connection, show):
+  adjust(connection, [(show.venue_id, show.artist_id, show.start_time)])
+
+@event.listens_for(Show, 'after_delete')
+def count_deleted_show(mapper, connection, show):
+  adjust(connection, [(show.venue_id, show.artist_id, show.start_time)], sign=-1)
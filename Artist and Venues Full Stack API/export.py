@@ -0,0 +1,63 @@
+#----------------------------------------------------------------------------#
+# Streaming export of shows, with their venue and artist names.
+#
+# Rows are read from a server-side cursor (yield_per turns on
+# stream_results) EXPORT_CHUNK_ROWS at a time and written out as CSV or
+# NDJSON as they come, so memory stays flat whatever the size of the show
+# table. The first line goes out on its own, before the query has run.
+#----------------------------------------------------------------------------#
+import csv
+import io
+import json
+
+from models import db, Show, Venue, Artist
+
+FIELDS = ['venue_id', 'venue_name', 'artist_id', 'artist_name', 'start_time']
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def show_rows(since=None, until=None, chunk=1000):
+  '''Shows starting in [since, until), in start_time order, fetched `chunk`
+  rows at a time.'''
+  query = db.session.query(Show.venue_id, Venue.name, Show.artist_id, Artist.name, Show.start_time).join(
+    Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id)
+  if since is not None:
+    query = query.filter(Show.start_time >= since)
+  if until is not None:
+    query = query.filter(Show.start_time < until)
+  return query.order_by(Show.start_time, Show.venue_id).yield_per(chunk)
+
+def records(rows):
+  for venue_id, venue_name, artist_id, artist_name, start_time in rows:
+    yield [venue_id, venue_name, artist_id, artist_name, start_time.isoformat()]
+
+
+def csv_lines(rows):
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  writer.writerow(FIELDS)
+  yield buffer.getvalue()
+  for record in records(rows):
+    buffer.seek(0)
+    buffer.truncate()
+    writer.writerow(record)
+    yield buffer.getvalue()
+
+def ndjson_lines(rows):
+  for record in records(rows):
+    yield json.dumps(dict(zip(FIELDS, record)), separators=(',', ':')) + '\n'
+
+writers = {'csv': csv_lines, 'ndjson': ndjson_lines}
+
+
+def export(format, rows, chunk=1000):
+  '''Yield `rows` in `format`, the first line alone and then `chunk` lines
+  at a time.'''
+  piece = []
+  for number, line in enumerate(writers[format](rows)):
+    piece.append(line)
+    if number == 0 or len(piece) >= chunk:
+      yield ''.join(piece)
+      piece = []
+  if piece:
+    yield ''.join(piece)
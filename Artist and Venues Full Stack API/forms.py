@@ -1,15 +1,11 @@
 from datetime import datetime
-import phonenumbers
+from phones import normalize
 from flask_wtf import Form
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, SubmitField, BooleanField
 from wtforms.validators import DataRequired, AnyOf, URL, ValidationError
 
 def check_phone_number(self, phone):
-    try:
-        p = phonenumbers.parse(phone.data)
-        if not phonenumbers.is_valid_number(p):
-            raise ValueError()
-    except (phonenumbers.phonenumberutil.NumberParseException, ValueError):
+    if not phone.data or normalize(phone.data) is None:
         raise ValidationError('Invalid phone number')
 
 class ShowForm(Form):
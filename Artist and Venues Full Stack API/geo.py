@@ -0,0 +1,106 @@
+#----------------------------------------------------------------------------#
+# Offline geocoding and geohash radius search for venues.
+#
+# Venues are placed at the centre of their city, looked up in the local
+# gazetteer.csv, and stored with a geohash. A radius query reads the geohash
+# cells covering the circle as index range scans, then keeps the venues that
+# really are within the radius.
+#----------------------------------------------------------------------------#
+import csv
+import math
+import os
+from functools import lru_cache
+
+GAZETTEER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gazetteer.csv')
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Stored geohash length, cells of about 5 by 5 metres
+PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+@lru_cache(maxsize=1)
+def gazetteer():
+  '''(lowercased city, state) -> (latitude, longitude) of gazetteer.csv.'''
+  with open(GAZETTEER, newline='', encoding='utf-8') as f:
+    return {(row['city'].strip().lower(), row['state'].strip().upper()):
+            (float(row['latitude']), float(row['longitude'])) for row in csv.DictReader(f)}
+
+def geocode(city, state):
+  '''Coordinates of the centre of `city`, None when the gazetteer doesn't
+  know it.'''
+  if not city or not state:
+    return None
+  return gazetteer().get((city.strip().lower(), state.strip().upper()))
+
+def locate(city, state):
+  '''(latitude, longitude, geohash) of a venue in `city`, Nones when the
+  city is unknown.'''
+  location = geocode(city, state)
+  if location is None:
+    return None, None, None
+  return location + (encode(*location),)
+
+
+def encode(latitude, longitude, precision=PRECISION):
+  '''Geohash of a point.'''
+  lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+  chars, bits, value, even = [], 0, 0, True
+  while len(chars) < precision:
+    interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+    middle = (interval[0] + interval[1]) / 2
+    value <<= 1
+    if coordinate >= middle:
+      value |= 1
+      interval[0] = middle
+    else:
+      interval[1] = middle
+    even = not even
+    bits += 1
+    if bits == 5:
+      chars.append(BASE32[value])
+      bits, value = 0, 0
+  return ''.join(chars)
+
+def cell_size(precision):
+  '''Height and width, in degrees, of the geohash cells of `precision`.'''
+  bits = 5 * precision
+  return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+def covering_cells(latitude, longitude, radius_km):
+  '''Geohash prefixes whose cells together cover the circle: the cell of the
+  centre and its eight neighbours, at the finest precision whose cells are
+  at least `radius_km` across.'''
+  km_per_lon_degree = KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6)
+  precision = 1
+  for candidate in range(PRECISION, 0, -1):
+    height, width = cell_size(candidate)
+    if height * KM_PER_DEGREE >= radius_km and width * km_per_lon_degree >= radius_km:
+      precision = candidate
+      break
+  height, width = cell_size(precision)
+  cells = set()
+  for dlat in (-height, 0, height):
+    for dlon in (-width, 0, width):
+      lat = min(max(latitude + dlat, -90.0), 90.0 - 1e-9)
+      lon = (longitude + dlon + 180.0) % 360.0 - 180.0
+      cells.add(encode(lat, lon, precision))
+  return sorted(cells)
+
+def bounding_box(latitude, longitude, radius_km):
+  '''(min lat, max lat, min lon, max lon) around the circle. The longitude
+  bounds are left open when the circle crosses the antimeridian or a pole.'''
+  dlat = radius_km / KM_PER_DEGREE
+  cos = math.cos(math.radians(latitude))
+  if abs(latitude) + dlat >= 90 or cos * 180 * KM_PER_DEGREE <= radius_km:
+    return latitude - dlat, latitude + dlat, -180.0, 180.0
+  dlon = radius_km / (KM_PER_DEGREE * cos)
+  if longitude - dlon < -180 or longitude + dlon > 180:
+    return latitude - dlat, latitude + dlat, -180.0, 180.0
+  return latitude - dlat, latitude + dlat, longitude - dlon, longitude + dlon
+
+def distance_km(lat1, lon1, lat2, lon2):
+  '''Great circle distance between two points.'''
+  lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+  a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+  return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
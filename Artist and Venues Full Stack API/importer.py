@@ -0,0 +1,124 @@
+#----------------------------------------------------------------------------#
+# Streaming bulk import of venues, artists and shows.
+#
+# Rows are read lazily from CSV (with a header line) or NDJSON files,
+# validated with the same WTForms forms the create pages use, and written in
+# chunks, one transaction per chunk. Rows that fail validation or can't be
+# inserted go to an NDJSON rejects file instead of stopping the import.
+#----------------------------------------------------------------------------#
+import csv
+import io
+import json
+from itertools import islice
+
+from werkzeug.datastructures import MultiDict
+
+JSON_SUFFIXES = ('.ndjson', '.jsonl', '.json')
+
+
+def read_rows(path):
+  '''Yield (line number, row, error) for every record of `path`.'''
+  with open(path, newline='', encoding='utf-8') as f:
+    if path.endswith(JSON_SUFFIXES):
+      for number, line in enumerate(f, 1):
+        if not line.strip():
+          continue
+        try:
+          yield number, json.loads(line), None
+        except ValueError as e:
+          yield number, line.rstrip('\n'), str(e)
+    else:
+      reader = csv.DictReader(f)
+      for row in reader:
+        yield reader.line_num, row, None
+
+
+def formdata(row, multiple=()):
+  '''Turn a row into form data. Fields named in `multiple` may be a list or
+  a comma separated string.'''
+  data = MultiDict()
+  for key, value in row.items():
+    if value is None or value is False:
+      continue
+    if isinstance(value, list):
+      values = value
+    elif key in multiple:
+      values = [item.strip() for item in str(value).split(',') if item.strip()]
+    else:
+      values = [value]
+    for item in values:
+      data.add(key, 'y' if item is True else str(item))
+  return data
+
+
+def validate(form_class, row, multiple=()):
+  '''The validated form for `row` and its errors (empty when valid).'''
+  form = form_class(formdata=formdata(row, multiple), meta={'csrf': False})
+  form.validate()
+  return form, form.errors
+
+
+def chunks(iterable, size):
+  iterator = iter(iterable)
+  while True:
+    chunk = list(islice(iterator, size))
+    if not chunk:
+      return
+    yield chunk
+
+
+def copy_rows(connection, table, columns, rows):
+  '''Load `rows` (tuples in `columns` order) with PostgreSQL COPY.'''
+  buffer = io.StringIO()
+  csv.writer(buffer).writerows(rows)
+  buffer.seek(0)
+  cursor = connection.connection.cursor()
+  cursor.copy_expert(
+    f'COPY {table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def import_rows(rows, prepare, insert, session, chunk_size=5000, rejects=None):
+  '''Validate and insert `rows` as produced by read_rows().
+
+  `prepare(row)` returns (record, errors); `insert(records)` writes a list
+  of records inside the current transaction. Every chunk is committed on its
+  own. When a chunk fails to insert it is rolled back and retried row by row
+  so only the offending rows are rejected. Returns (imported, rejected).'''
+  imported = rejected = 0
+
+  def reject(number, row, errors):
+    nonlocal rejected
+    rejected += 1
+    if rejects is not None:
+      rejects.write(json.dumps({'line': number, 'row': row, 'errors': errors}, default=str) + '\n')
+
+  for chunk in chunks(rows, chunk_size):
+    valid = []
+    for number, row, error in chunk:
+      if error:
+        reject(number, row, {'row': [error]})
+        continue
+      record, errors = prepare(row)
+      if errors:
+        reject(number, row, errors)
+      else:
+        valid.append((number, row, record))
+    if not valid:
+      continue
+
+    try:
+      insert([record for _, _, record in valid])
+      session.commit()
+      imported += len(valid)
+    except Exception:
+      session.rollback()
+      for number, row, record in valid:
+        try:
+          insert([record])
+          session.commit()
+          imported += 1
+        except Exception as e:
+          session.rollback()
+          reject(number, row, {'row': [str(getattr(e, 'orig', e))]})
+
+  return imported, rejected
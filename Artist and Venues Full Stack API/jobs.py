@@ -0,0 +1,146 @@
+#----------------------------------------------------------------------------#
+# Jobs: side effects of writes, run off the request path.
+#
+# A write queues its side effects (thumbnailing a new image, refreshing
+# recommendations) as rows of the job table, in its own transaction, so a
+# job exists exactly when the write committed. After a request that queued
+# any, one of JOBS_WORKERS threads of the app process claims the due jobs
+# and runs each. A handler does its slow part (a download, say) first and
+# writes its results in a short transaction that also deletes the job, so
+# no connection is held meanwhile. A failing job is retried after
+# JOB_RETRY_SECONDS, doubling with every attempt, and left in the table
+# after JOB_MAX_ATTEMPTS. `flask run-jobs` runs whatever is due, retries
+# and jobs of crashed processes included, run it from cron.
+#----------------------------------------------------------------------------#
+import json
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import g, has_request_context
+from sqlalchemy import and_, or_, select
+
+from models import Job
+
+table = Job.__table__
+
+
+def enqueue(connection, kind, **payload):
+  '''Queue a `kind` job in the transaction of `connection`, its handler is
+  called with `payload` once that commits.'''
+  connection.execute(table.insert().values(
+    kind=kind, payload=json.dumps(payload, sort_keys=True), attempts=0, run_after=datetime.now()))
+  if has_request_context():
+    g.jobs_queued = True
+
+
+class JobQueue(object):
+  '''Handlers of the jobs of an app, and the threads running them.'''
+
+  def __init__(self, app=None, db=None):
+    self.handlers = {}
+    self.pool = None
+    # drains submitted to the pool and not started yet
+    self.waiting = 0
+    self.lock = threading.Lock()
+    if app is not None:
+      self.init_app(app, db)
+
+  def init_app(self, app, db):
+    self.app = app
+    self.db = db
+    app.extensions['jobs'] = self
+    app.after_request(self.wake)
+
+  def handler(self, kind):
+    '''Register the decorated function(begin, **payload) as the handler of
+    `kind` jobs. `with begin() as connection:` opens the transaction
+    writing its results, which deletes the job when it commits.'''
+    def register(fn):
+      self.handlers[kind] = fn
+      return fn
+    return register
+
+  def wake(self, response):
+    workers = self.app.config['JOBS_WORKERS']
+    if not g.pop('jobs_queued', False) or not workers:
+      return response
+    with self.lock:
+      if self.pool is None:
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='jobs')
+      # a drain not started yet will see the new jobs anyway
+      if self.waiting >= workers:
+        return response
+      self.waiting += 1
+    self.pool.submit(self.drain)
+    return response
+
+  def drain(self):
+    with self.lock:
+      self.waiting -= 1
+    with self.app.app_context():
+      try:
+        while sum(self.run_pending()):
+          pass
+      except Exception:
+        self.app.logger.exception('Job worker failed')
+
+  def claim(self, limit):
+    '''Lease up to `limit` due jobs to this worker, oldest first.'''
+    now = datetime.now()
+    token = uuid.uuid4().hex
+    free = or_(table.c.claimed_until.is_(None), table.c.claimed_until < now)
+    due = select([table.c.id]).where(and_(
+      table.c.run_after <= now, table.c.attempts < self.app.config['JOB_MAX_ATTEMPTS'], free)).order_by(
+      table.c.run_after, table.c.id).limit(limit)
+    with self.db.engine.begin() as connection:
+      if connection.dialect.name == 'postgresql':
+        # concurrent workers skip each other's jobs instead of waiting on them
+        due = due.with_for_update(skip_locked=True)
+      connection.execute(table.update().where(and_(table.c.id.in_(due), free)).values(
+        claimed_by=token, claimed_until=now + timedelta(seconds=self.app.config['JOB_LEASE_SECONDS'])))
+      return connection.execute(select([table]).where(table.c.claimed_by == token).order_by(table.c.id)).fetchall()
+
+  def run(self, job):
+    '''Run a claimed job, True when it succeeded.'''
+    done = []
+
+    @contextmanager
+    def begin():
+      with self.db.engine.begin() as connection:
+        yield connection
+        connection.execute(table.delete().where(and_(table.c.id == job.id, table.c.claimed_by == job.claimed_by)))
+      done.append(True)
+
+    try:
+      self.handlers[job.kind](begin, **json.loads(job.payload))
+      if not done:
+        # nothing to write
+        with begin():
+          pass
+      return True
+    except Exception as e:
+      attempts = job.attempts + 1
+      delay = self.app.config['JOB_RETRY_SECONDS'] * 2 ** job.attempts
+      self.app.logger.warning('Job %d (%s) failed, attempt %d of %d: %r', job.id, job.kind, attempts,
+                              self.app.config['JOB_MAX_ATTEMPTS'], e)
+      with self.db.engine.begin() as connection:
+        connection.execute(table.update().where(table.c.id == job.id).values(
+          attempts=attempts, run_after=datetime.now() + timedelta(seconds=delay), claimed_by=None,
+          claimed_until=None, last_error=repr(e)))
+      return False
+
+  def run_pending(self, limit=None):
+    '''Claim and run up to `limit` due jobs, JOBS_BATCH by default.
+    Returns the numbers of jobs that succeeded and failed.'''
+    results = [self.run(job) for job in self.claim(limit or self.app.config['JOBS_BATCH'])]
+    return results.count(True), results.count(False)
+
+  def retry_failed(self):
+    '''Give the jobs past JOB_MAX_ATTEMPTS another round of attempts.
+    Returns their number.'''
+    with self.db.engine.begin() as connection:
+      return connection.execute(table.update().where(table.c.attempts >= self.app.config['JOB_MAX_ATTEMPTS']).values(
+        attempts=0, run_after=datetime.now())).rowcount
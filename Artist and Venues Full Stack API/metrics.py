@@ -0,0 +1,168 @@
+#----------------------------------------------------------------------------#
+# Process metrics served at /metrics in the Prometheus text format.
+#
+# SQLAlchemy event hooks count pool checkouts and time every statement,
+# attributed to the route being served. Every gunicorn worker has its own
+# pool and its own numbers, so scrape each worker or sum them up: the pool
+# needs (pool size + overflow) x workers connections at most.
+#----------------------------------------------------------------------------#
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from flask import has_request_context, request
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+# Upper bounds, in seconds, of the histogram buckets
+QUERY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+WAIT_BUCKETS = (.0001, .001, .005, .01, .05, .1, .5, 1, 5, 30)
+
+
+class Histogram(object):
+  '''Cumulative histogram of observed values, thread safe.'''
+
+  def __init__(self, buckets):
+    self.buckets = buckets
+    self.counts = [0] * (len(buckets) + 1)
+    self.sum = 0.0
+    self.lock = threading.Lock()
+
+  def observe(self, value):
+    with self.lock:
+      self.counts[bisect_left(self.buckets, value)] += 1
+      self.sum += value
+
+  def samples(self, name, labels=''):
+    # Prometheus lines: one cumulative count per bucket, then sum and count
+    with self.lock:
+      counts, total = list(self.counts), self.sum
+    lines = []
+    cumulative = 0
+    for bound, count in zip(self.buckets + ('+Inf',), counts):
+      cumulative += count
+      lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+    suffix = f'{{{labels}}}' if labels else ''
+    lines.append(f'{name}_sum{suffix} {total:.6f}')
+    lines.append(f'{name}_count{suffix} {cumulative}')
+    return lines
+
+
+# Time spent waiting for a pooled connection, see TimedQueuePool
+pool_wait = Histogram(WAIT_BUCKETS)
+pool_timeouts = Counter()
+
+
+class TimedQueuePool(QueuePool):
+  '''QueuePool recording how long each checkout waited in pool_wait.'''
+
+  def _do_get(self):
+    started = time.perf_counter()
+    try:
+      return super()._do_get()
+    except exc.TimeoutError:
+      pool_timeouts['timeout'] += 1
+      raise
+    finally:
+      pool_wait.observe(time.perf_counter() - started)
+
+
+def route():
+  # The rule of the request being served, for labelling
+  if has_request_context() and request.url_rule is not None:
+    return request.url_rule.rule
+  return 'none'
+
+
+class Metrics(object):
+  '''Collects pool metrics of the app's engine and query metrics of it and
+  of any engine watched, such as read replicas.'''
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.pool_events = Counter()
+    self.queries = Counter()
+    self.query_time = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+    self.engine = None
+
+  def init_app(self, app, db):
+    with app.app_context():
+      self.engine = db.engine
+    self.watch(self.engine)
+    for name in ('connect', 'checkout', 'checkin', 'invalidate'):
+      event.listen(self.engine.pool, name, self.pool_event(name))
+
+  def watch(self, engine):
+    event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+    event.listen(engine, 'handle_error', self.handle_error)
+
+  def pool_event(self, name):
+    def count(*args):
+      with self.lock:
+        self.pool_events[name] += 1
+    return count
+
+  def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append((context, time.perf_counter()))
+
+  def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()[1]
+    rule = route()
+    with self.lock:
+      self.queries[rule] += 1
+      histogram = self.query_time[rule]
+    histogram.observe(elapsed)
+
+  def handle_error(self, context):
+    # A failed statement never reaches after_cursor_execute, drop its start
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started and started[-1][0] is context.execution_context:
+      started.pop()
+
+  def pool_status(self):
+    # Gauges of the current pool, when its class keeps them
+    pool = self.engine.pool
+    if not isinstance(pool, QueuePool):
+      return {}
+    return {name: getattr(pool, name)() for name in ('size', 'checkedin', 'checkedout', 'overflow')}
+
+  def render(self, cache_stats=None):
+    '''All metrics in the Prometheus text exposition format.'''
+    lines = []
+    def metric(name, kind, help):
+      lines.append(f'# HELP {name} {help}')
+      lines.append(f'# TYPE {name} {kind}')
+
+    with self.lock:
+      pool_events = dict(self.pool_events)
+      queries = dict(self.queries)
+      query_time = dict(self.query_time)
+
+    pool_class = type(self.engine.pool).__name__
+    metric('fyyur_db_pool_events_total', 'counter', 'Pool connects, checkouts, checkins and invalidations.')
+    for name in ('connect', 'checkout', 'checkin', 'invalidate'):
+      lines.append(f'fyyur_db_pool_events_total{{pool="{pool_class}",event="{name}"}} {pool_events.get(name, 0)}')
+    for name, value in self.pool_status().items():
+      metric(f'fyyur_db_pool_{name}', 'gauge', f'Current pool {name}.')
+      lines.append(f'fyyur_db_pool_{name} {value}')
+    metric('fyyur_db_pool_timeouts_total', 'counter', 'Checkouts that gave up waiting for a connection.')
+    lines.append(f'fyyur_db_pool_timeouts_total {pool_timeouts["timeout"]}')
+    metric('fyyur_db_pool_wait_seconds', 'histogram', 'Time spent waiting for a pooled connection.')
+    lines.extend(pool_wait.samples('fyyur_db_pool_wait_seconds'))
+
+    metric('fyyur_db_queries_total', 'counter', 'SQL statements executed, per route.')
+    for rule, count in sorted(queries.items()):
+      lines.append(f'fyyur_db_queries_total{{route="{rule}"}} {count}')
+    metric('fyyur_db_query_seconds', 'histogram', 'SQL statement execution time, per route.')
+    for rule, histogram in sorted(query_time.items()):
+      lines.extend(histogram.samples('fyyur_db_query_seconds', f'route="{rule}"'))
+
+    if cache_stats is not None:
+      backend = cache_stats['backend']
+      for counter in ('hits', 'misses', 'invalidations'):
+        metric(f'fyyur_cache_{counter}_total', 'counter', f'Listing cache {counter}, per route.')
+        for rule, count in sorted(cache_stats[counter].items()):
+          lines.append(f'fyyur_cache_{counter}_total{{backend="{backend}",route="{rule}"}} {count}')
+    return '\n'.join(lines) + '\n'
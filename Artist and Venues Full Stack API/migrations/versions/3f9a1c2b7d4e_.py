@@ -0,0 +1,37 @@
+"""trigram search indexes on venue and artist
+
+Revision ID: 3f9a1c2b7d4e
+Revises: 6eb9d83ce53c
+Create Date: 2026-10-18 09:12:41.503117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c2b7d4e'
+down_revision = '6eb9d83ce53c'
+branch_labels = None
+depends_on = None
+
+searchable = {
+    'venue': ['name', 'city', 'genres'],
+    'artist': ['name', 'city', 'genres'],
+}
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, columns in searchable.items():
+        for column in columns:
+            op.create_index(
+                f'ix_{table}_{column}_trgm', table, [column],
+                postgresql_using='gin',
+                postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    for table, columns in searchable.items():
+        for column in columns:
+            op.drop_index(f'ix_{table}_{column}_trgm', table_name=table)
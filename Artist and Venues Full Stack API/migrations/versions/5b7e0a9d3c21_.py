@@ -0,0 +1,26 @@
+"""covering indexes for show lookups by venue and artist
+
+Revision ID: 5b7e0a9d3c21
+Revises: 8c41e5d2a9f0
+Create Date: 2026-10-18 10:41:55.170342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e0a9d3c21'
+down_revision = '8c41e5d2a9f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_show_venue_id_start_time', 'show', ['venue_id', 'start_time', 'artist_id'])
+    op.create_index('ix_show_artist_id_start_time', 'show', ['artist_id', 'start_time', 'venue_id'])
+
+
+def downgrade():
+    op.drop_index('ix_show_artist_id_start_time', table_name='show')
+    op.drop_index('ix_show_venue_id_start_time', table_name='show')
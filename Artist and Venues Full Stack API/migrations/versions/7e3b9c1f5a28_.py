@@ -0,0 +1,26 @@
+"""One show per venue and start time
+
+Revision ID: 7e3b9c1f5a28
+Revises: d4f8a2c6b913
+Create Date: 2026-10-18 15:02:11.840315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e3b9c1f5a28'
+down_revision = 'd4f8a2c6b913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fails if the venue is already double booked somewhere, those shows
+    # have to be moved or removed by hand first.
+    op.create_unique_constraint('uq_show_venue_id_start_time', 'show', ['venue_id', 'start_time'])
+
+
+def downgrade():
+    op.drop_constraint('uq_show_venue_id_start_time', 'show', type_='unique')
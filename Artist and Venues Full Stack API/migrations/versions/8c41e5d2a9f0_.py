@@ -0,0 +1,93 @@
+"""normalise venue and artist genres into a genre table
+
+Revision ID: 8c41e5d2a9f0
+Revises: 3f9a1c2b7d4e
+Create Date: 2026-10-18 10:02:17.884120
+
+"""
+import csv
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c41e5d2a9f0'
+down_revision = '3f9a1c2b7d4e'
+branch_labels = None
+depends_on = None
+
+# owner table -> (association table, owner key column, old genres column length)
+owners = {
+    'venue': ('venue_genre', 'venue_id', 500),
+    'artist': ('artist_genre', 'artist_id', 120),
+}
+
+
+def parse_genres(value):
+    # Genres were stored as the text of a list, either a Postgres array
+    # literal ({Jazz,"Rock n Roll"}) or a Python one (['Jazz', 'Rock n Roll'])
+    if not value:
+        return []
+    value = value.strip().lstrip('{[').rstrip('}]')
+    names = next(csv.reader([value], skipinitialspace=True), [])
+    return [name.strip().strip('\'"').strip() for name in names if name.strip()]
+
+
+def upgrade():
+    genre = op.create_table('genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for owner, (link, key, _) in owners.items():
+        op.create_table(link,
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([key], [f'{owner}.id'], ),
+        sa.ForeignKeyConstraint(['genre_id'], ['genre.id'], ),
+        sa.PrimaryKeyConstraint(key, 'genre_id')
+        )
+        op.create_index(f'ix_{link}_genre_id', link, ['genre_id', key])
+
+    # Move the stringified lists into the new tables
+    conn = op.get_bind()
+    genre_ids = {}
+    for owner, (link, key, _) in owners.items():
+        links = []
+        for owner_id, genres in conn.execute(sa.text(f'SELECT id, genres FROM {owner}')):
+            for name in dict.fromkeys(parse_genres(genres)):
+                if name not in genre_ids:
+                    genre_ids[name] = conn.execute(
+                        genre.insert().values(name=name).returning(genre.c.id)).scalar()
+                links.append({key: owner_id, 'genre_id': genre_ids[name]})
+        if links:
+            op.bulk_insert(sa.table(link, sa.column(key), sa.column('genre_id')), links)
+
+        op.drop_index(f'ix_{owner}_genres_trgm', table_name=owner)
+        op.drop_column(owner, 'genres')
+
+    op.create_index('ix_genre_name_trgm', 'genre', ['name'],
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_genre_name_trgm', table_name='genre')
+    conn = op.get_bind()
+    for owner, (link, key, length) in owners.items():
+        op.add_column(owner, sa.Column('genres', sa.String(length=length), nullable=True))
+        rows = conn.execute(sa.text(
+            f'SELECT {link}.{key}, genre.name FROM {link} '
+            f'JOIN genre ON genre.id = {link}.genre_id ORDER BY {link}.{key}, genre.name'))
+        genres = {}
+        for owner_id, name in rows:
+            genres.setdefault(owner_id, []).append(name)
+        for owner_id, names in genres.items():
+            conn.execute(sa.text(f'UPDATE {owner} SET genres = :genres WHERE id = :id'),
+                         genres='{' + ','.join(f'"{name}"' for name in names) + '}', id=owner_id)
+        op.create_index(f'ix_{owner}_genres_trgm', owner, ['genres'],
+                        postgresql_using='gin', postgresql_ops={'genres': 'gin_trgm_ops'})
+        op.drop_index(f'ix_{link}_genre_id', table_name=link)
+        op.drop_table(link)
+    op.drop_table('genre')
@@ -0,0 +1,86 @@
+"""show partitioned by month of start_time
+
+Revision ID: 9d3e6b2f8c41
+Revises: f0a4c8e2b619
+Create Date: 2026-10-18 21:48:12.630914
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3e6b2f8c41'
+down_revision = 'f0a4c8e2b619'
+branch_labels = None
+depends_on = None
+
+indexes = {
+    'ix_show_venue_id_start_time': ['venue_id', 'start_time', 'artist_id'],
+    'ix_show_artist_id_start_time': ['artist_id', 'start_time', 'venue_id'],
+    'ix_show_start_time': ['start_time', 'venue_id', 'artist_id'],
+}
+# Months created ahead of the current one, `flask show-partitions` adds more
+MONTHS_AHEAD = 12
+
+
+def add_months(month, count):
+    month_index = month.year * 12 + month.month - 1 + count
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def create_show(partition_by=None):
+    op.create_table('show',
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], name='show_artist_id_fkey'),
+        sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], name='show_venue_id_fkey'),
+        sa.PrimaryKeyConstraint('venue_id', 'artist_id', 'start_time', name='show_pkey'),
+        sa.UniqueConstraint('venue_id', 'start_time', name='uq_show_venue_id_start_time'),
+        postgresql_partition_by=partition_by
+    )
+    for name, columns in indexes.items():
+        op.create_index(name, 'show', columns)
+
+
+def set_aside_show():
+    # Index and constraint names are unique per schema, free them first.
+    # Before this revision show had no primary key, and the inspector
+    # doesn't see the constraints of a partitioned table.
+    constraints = [name for name, in op.get_bind().execute(
+        "SELECT conname FROM pg_constraint WHERE conrelid = 'show'::regclass")]
+    op.rename_table('show', 'show_old')
+    for name in constraints:
+        op.execute(f'ALTER TABLE show_old RENAME CONSTRAINT {name} TO {name}_old')
+    for name in indexes:
+        op.execute(f'ALTER INDEX {name} RENAME TO {name}_old')
+
+
+def upgrade():
+    set_aside_show()
+    create_show(partition_by='RANGE (start_time)')
+    op.execute('CREATE TABLE show_default PARTITION OF show DEFAULT')
+
+    first, last = op.get_bind().execute('SELECT min(start_time), max(start_time) FROM show_old').first()
+    this_month = date.today().replace(day=1)
+    month = min(first.date(), this_month).replace(day=1) if first else this_month
+    last = max(last.date().replace(day=1) if last else this_month, add_months(this_month, MONTHS_AHEAD))
+    while month <= last:
+        op.execute(f"CREATE TABLE show_y{month.year:04d}m{month.month:02d} PARTITION OF show "
+                   f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')")
+        month = add_months(month, 1)
+
+    op.execute('INSERT INTO show (venue_id, artist_id, start_time) SELECT venue_id, artist_id, start_time FROM show_old')
+    op.drop_table('show_old')
+    op.execute('ANALYZE show')
+
+
+def downgrade():
+    set_aside_show()
+    create_show()
+    op.execute('INSERT INTO show (venue_id, artist_id, start_time) SELECT venue_id, artist_id, start_time FROM show_old')
+    # dropping the partitioned table drops its partitions
+    op.drop_table('show_old')
@@ -0,0 +1,45 @@
+"""E.164 normalised phone numbers on venue and artist
+
+Revision ID: a71c93e05b6d
+Revises: e2d6b1f47a08
+Create Date: 2026-10-18 12:05:48.311274
+
+"""
+from alembic import op
+import phonenumbers
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a71c93e05b6d'
+down_revision = 'e2d6b1f47a08'
+branch_labels = None
+depends_on = None
+
+
+def e164(number):
+    try:
+        parsed = phonenumbers.parse(number)
+    except phonenumbers.phonenumberutil.NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(parsed):
+        return None
+    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+
+
+def upgrade():
+    conn = op.get_bind()
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('phone_e164', sa.String(length=16), nullable=True))
+        updates = []
+        for id, phone in conn.execute(sa.text(f'SELECT id, phone FROM {table} WHERE phone IS NOT NULL')):
+            normalised = e164(phone)
+            if normalised:
+                updates.append({'row_id': id, 'phone_e164': normalised})
+        if updates:
+            conn.execute(sa.text(f'UPDATE {table} SET phone_e164 = :phone_e164 WHERE id = :row_id'), updates)
+
+
+def downgrade():
+    op.drop_column('artist', 'phone_e164')
+    op.drop_column('venue', 'phone_e164')
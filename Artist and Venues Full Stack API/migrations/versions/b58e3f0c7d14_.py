@@ -0,0 +1,133 @@
+"""Venue coordinates and geohash
+
+Revision ID: b58e3f0c7d14
+Revises: 7e3b9c1f5a28
+Create Date: 2026-10-18 16:11:52.274906
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b58e3f0c7d14'
+down_revision = '7e3b9c1f5a28'
+branch_labels = None
+depends_on = None
+
+# (lowercased city, state) -> city centre, gazetteer.csv as of this revision
+CITIES = {
+    ('albuquerque', 'NM'): (35.0844, -106.6504),
+    ('anchorage', 'AK'): (61.2181, -149.9003),
+    ('atlanta', 'GA'): (33.749, -84.388),
+    ('austin', 'TX'): (30.2672, -97.7431),
+    ('baltimore', 'MD'): (39.2904, -76.6122),
+    ('berkeley', 'CA'): (37.8715, -122.273),
+    ('birmingham', 'AL'): (33.5186, -86.8104),
+    ('boise', 'ID'): (43.615, -116.2023),
+    ('boston', 'MA'): (42.3601, -71.0589),
+    ('brooklyn', 'NY'): (40.6782, -73.9442),
+    ('buffalo', 'NY'): (42.8864, -78.8784),
+    ('burlington', 'VT'): (44.4759, -73.2121),
+    ('charleston', 'SC'): (32.7765, -79.9311),
+    ('charlotte', 'NC'): (35.2271, -80.8431),
+    ('chicago', 'IL'): (41.8781, -87.6298),
+    ('cincinnati', 'OH'): (39.1031, -84.512),
+    ('cleveland', 'OH'): (41.4993, -81.6944),
+    ('columbus', 'OH'): (39.9612, -82.9988),
+    ('dallas', 'TX'): (32.7767, -96.797),
+    ('denver', 'CO'): (39.7392, -104.9903),
+    ('des moines', 'IA'): (41.5868, -93.625),
+    ('detroit', 'MI'): (42.3314, -83.0458),
+    ('el paso', 'TX'): (31.7619, -106.485),
+    ('fort worth', 'TX'): (32.7555, -97.3308),
+    ('honolulu', 'HI'): (21.3069, -157.8583),
+    ('houston', 'TX'): (29.7604, -95.3698),
+    ('indianapolis', 'IN'): (39.7684, -86.1581),
+    ('jacksonville', 'FL'): (30.3322, -81.6557),
+    ('kansas city', 'MO'): (39.0997, -94.5786),
+    ('las vegas', 'NV'): (36.1699, -115.1398),
+    ('los angeles', 'CA'): (34.0522, -118.2437),
+    ('louisville', 'KY'): (38.2527, -85.7585),
+    ('madison', 'WI'): (43.0731, -89.4012),
+    ('memphis', 'TN'): (35.1495, -90.049),
+    ('miami', 'FL'): (25.7617, -80.1918),
+    ('milwaukee', 'WI'): (43.0389, -87.9065),
+    ('minneapolis', 'MN'): (44.9778, -93.265),
+    ('nashville', 'TN'): (36.1627, -86.7816),
+    ('new orleans', 'LA'): (29.9511, -90.0715),
+    ('new york', 'NY'): (40.7128, -74.006),
+    ('newark', 'NJ'): (40.7357, -74.1724),
+    ('oakland', 'CA'): (37.8044, -122.2712),
+    ('oklahoma city', 'OK'): (35.4676, -97.5164),
+    ('omaha', 'NE'): (41.2565, -95.9345),
+    ('orlando', 'FL'): (28.5383, -81.3792),
+    ('philadelphia', 'PA'): (39.9526, -75.1652),
+    ('phoenix', 'AZ'): (33.4484, -112.074),
+    ('pittsburgh', 'PA'): (40.4406, -79.9959),
+    ('portland', 'ME'): (43.6591, -70.2568),
+    ('portland', 'OR'): (45.5152, -122.6784),
+    ('providence', 'RI'): (41.824, -71.4128),
+    ('raleigh', 'NC'): (35.7796, -78.6382),
+    ('richmond', 'VA'): (37.5407, -77.436),
+    ('sacramento', 'CA'): (38.5816, -121.4944),
+    ('salt lake city', 'UT'): (40.7608, -111.891),
+    ('san antonio', 'TX'): (29.4241, -98.4936),
+    ('san diego', 'CA'): (32.7157, -117.1611),
+    ('san francisco', 'CA'): (37.7749, -122.4194),
+    ('san jose', 'CA'): (37.3382, -121.8863),
+    ('santa fe', 'NM'): (35.687, -105.9378),
+    ('seattle', 'WA'): (47.6062, -122.3321),
+    ('st. louis', 'MO'): (38.627, -90.1994),
+    ('tampa', 'FL'): (27.9506, -82.4572),
+    ('tucson', 'AZ'): (32.2226, -110.9747),
+    ('tulsa', 'OK'): (36.154, -95.9928),
+    ('washington', 'DC'): (38.9072, -77.0369),
+}
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash(latitude, longitude, precision=9):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def upgrade():
+    op.add_column('venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('venue', sa.Column('geohash', sa.String(length=12), nullable=True))
+
+    # Geocode existing venues from the gazetteer, one lookup per city
+    conn = op.get_bind()
+    cities = conn.execute(sa.text('SELECT DISTINCT city, state FROM venue')).fetchall()
+    for city, state in cities:
+        location = CITIES.get((city.strip().lower(), state.strip().upper())) if city and state else None
+        if location is not None:
+            conn.execute(sa.text(
+                'UPDATE venue SET latitude = :latitude, longitude = :longitude, geohash = :geohash '
+                'WHERE city = :city AND state = :state'),
+                latitude=location[0], longitude=location[1], geohash=geohash(*location), city=city, state=state)
+
+    op.create_index(op.f('ix_venue_geohash'), 'venue', ['geohash'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_venue_geohash'), table_name='venue')
+    op.drop_column('venue', 'geohash')
+    op.drop_column('venue', 'longitude')
+    op.drop_column('venue', 'latitude')
@@ -0,0 +1,34 @@
+"""recommended artists of venue and artist pages
+
+Revision ID: c5e1a7d9b042
+Revises: 9d3e6b2f8c41
+Create Date: 2026-10-18 22:31:47.208554
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e1a7d9b042'
+down_revision = '9d3e6b2f8c41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('recommended_artist',
+        sa.Column('kind', sa.String(length=6), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('kind', 'owner_id', 'artist_id')
+    )
+    op.create_index('ix_recommended_artist_kind_owner_id_score', 'recommended_artist',
+                    ['kind', 'owner_id', 'score', 'artist_id'])
+
+
+def downgrade():
+    op.drop_index('ix_recommended_artist_kind_owner_id_score', table_name='recommended_artist')
+    op.drop_table('recommended_artist')
@@ -0,0 +1,44 @@
+"""Upcoming and past show counters on venue and artist
+
+Revision ID: d4f8a2c6b913
+Revises: a71c93e05b6d
+Create Date: 2026-10-18 14:20:37.502918
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f8a2c6b913'
+down_revision = 'a71c93e05b6d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    now = datetime.now()
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.execute(sa.text(
+            f'UPDATE {table} SET '
+            f'upcoming_shows_count = (SELECT count(*) FROM show WHERE show.{table}_id = {table}.id AND start_time > :now), '
+            f'past_shows_count = (SELECT count(*) FROM show WHERE show.{table}_id = {table}.id AND start_time <= :now)'
+        ).bindparams(now=now))
+
+    op.create_table('show_counts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('rolled_until', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(sa.text('INSERT INTO show_counts (id, rolled_until) VALUES (1, :now)').bindparams(now=now))
+
+
+def downgrade():
+    op.drop_table('show_counts')
+    for table in ('artist', 'venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,24 @@
+"""chronological index for the shows listing
+
+Revision ID: e2d6b1f47a08
+Revises: 5b7e0a9d3c21
+Create Date: 2026-10-18 11:20:03.642958
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2d6b1f47a08'
+down_revision = '5b7e0a9d3c21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_show_start_time', 'show', ['start_time', 'venue_id', 'artist_id'])
+
+
+def downgrade():
+    op.drop_index('ix_show_start_time', table_name='show')
@@ -0,0 +1,36 @@
+"""job queue for side effects of writes
+
+Revision ID: e8b4d1f6a273
+Revises: c5e1a7d9b042
+Create Date: 2026-10-18 23:52:09.417305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b4d1f6a273'
+down_revision = 'c5e1a7d9b042'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=40), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('run_after', sa.DateTime(), nullable=False),
+        sa.Column('claimed_by', sa.String(length=32), nullable=True),
+        sa.Column('claimed_until', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_job_run_after', 'job', ['run_after'])
+
+
+def downgrade():
+    op.drop_index('ix_job_run_after', table_name='job')
+    op.drop_table('job')
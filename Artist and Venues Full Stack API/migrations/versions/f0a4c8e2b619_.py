@@ -0,0 +1,26 @@
+"""Thumbnails of venue and artist images
+
+Revision ID: f0a4c8e2b619
+Revises: b58e3f0c7d14
+Create Date: 2026-10-18 17:34:05.118263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f0a4c8e2b619'
+down_revision = 'b58e3f0c7d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('venue', sa.Column('thumbnail', sa.String(length=68), nullable=True))
+    op.add_column('artist', sa.Column('thumbnail', sa.String(length=68), nullable=True))
+
+
+def downgrade():
+    op.drop_column('artist', 'thumbnail')
+    op.drop_column('venue', 'thumbnail')
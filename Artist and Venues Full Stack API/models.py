@@ -0,0 +1,153 @@
+#----------------------------------------------------------------------------#
+# Models.
+#----------------------------------------------------------------------------#
+from replicas import RoutingSQLAlchemy
+from search import index_for_search
+
+# Reads of read-only requests go to replicas when configured, see replicas.py
+db = RoutingSQLAlchemy()
+
+class Show(db.Model):
+    __tablename__ = 'show'
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('artist.id'), primary_key=True)
+    start_time = db.Column(db.DateTime, primary_key=True)
+
+    # Shows are looked up for one venue or one artist, usually bounded by
+    # start_time, or listed chronologically by /shows. Each index holds every
+    # column of the table so those lookups never have to visit the table.
+    # A venue hosts a single show at a time, see booking.py. On PostgreSQL the
+    # table is partitioned by month of start_time, see partitions.py.
+    __table_args__ = (
+        db.UniqueConstraint('venue_id', 'start_time', name='uq_show_venue_id_start_time'),
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time', 'artist_id'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time', 'venue_id'),
+        db.Index('ix_show_start_time', 'start_time', 'venue_id', 'artist_id'),
+        {'postgresql_partition_by': 'RANGE (start_time)'},
+    )
+
+# Until `flask show-partitions` adds the months, shows land in the default partition
+db.event.listen(Show.__table__, 'after_create', db.DDL(
+    'CREATE TABLE show_default PARTITION OF show DEFAULT').execute_if(dialect='postgresql'))
+
+class Genre(db.Model):
+    __tablename__ = 'genre'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    @classmethod
+    def named(cls, names):
+        # Genre rows for the given names, creating the ones that don't exist yet
+        names = list(dict.fromkeys(names))
+        existing = {genre.name: genre for genre in cls.query.filter(cls.name.in_(names))}
+        return [existing.get(name) or cls(name=name) for name in names]
+
+# Genre <-> venue/artist links. The primary keys serve lookups by venue or
+# artist, the genre_id indexes serve listings filtered by genre.
+venue_genre = db.Table('venue_genre',
+    db.Column('venue_id', db.Integer, db.ForeignKey('venue.id'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'), primary_key=True),
+    db.Index('ix_venue_genre_genre_id', 'genre_id', 'venue_id')
+)
+
+artist_genre = db.Table('artist_genre',
+    db.Column('artist_id', db.Integer, db.ForeignKey('artist.id'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'), primary_key=True),
+    db.Index('ix_artist_genre_genre_id', 'genre_id', 'artist_id')
+)
+
+class Venue(db.Model):
+    __tablename__ = 'venue'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    address = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    phone_e164 = db.Column(db.String(16))
+    # City centre from the gazetteer, see geo.py. Radius queries scan
+    # geohash ranges of the index.
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12), index=True)
+    image_link = db.Column(db.String(500))
+    # Name of the stored thumbnail of image_link, see thumbnails.py
+    thumbnail = db.Column(db.String(68))
+    facebook_link = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=venue_genre, order_by=Genre.name)
+    website = db.Column(db.String(500))
+    seeking_description = db.Column(db.Boolean, default=False)
+    # Maintained by counters.py, split at ShowCounts.rolled_until
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    shows_venue = db.relationship('Show', backref='venue')
+
+class Artist(db.Model):
+    __tablename__ = 'artist'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    phone_e164 = db.Column(db.String(16))
+    genres = db.relationship('Genre', secondary=artist_genre, order_by=Genre.name)
+    image_link = db.Column(db.String(500))
+    thumbnail = db.Column(db.String(68))
+    facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String(500))
+    seeking_venue = db.Column(db.Boolean, default=False)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    shows_art = db.relationship('Show', backref='artist')
+
+    # DONE: implement any missing fields, as a database migration using Flask-Migrate
+
+# DONE Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+
+class RecommendedArtist(db.Model):
+    # Artists recommended on the page of a venue or an artist, see
+    # recommendations.py. A page reads its list by (kind, owner_id, score).
+    __tablename__ = 'recommended_artist'
+    kind = db.Column(db.String(6), primary_key=True)
+    owner_id = db.Column(db.Integer, primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('artist.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+
+    artist = db.relationship('Artist', viewonly=True)
+
+    __table_args__ = (
+        db.Index('ix_recommended_artist_kind_owner_id_score', 'kind', 'owner_id', 'score', 'artist_id'),
+    )
+
+# The list of each page, best first, loaded together with its venue or artist
+for model, kind in [(Venue, 'venue'), (Artist, 'artist')]:
+    model.recommendations = db.relationship(RecommendedArtist, viewonly=True,
+        primaryjoin=db.and_(db.foreign(RecommendedArtist.owner_id) == model.id, RecommendedArtist.kind == kind),
+        order_by=[RecommendedArtist.score.desc(), RecommendedArtist.artist_id])
+
+class Job(db.Model):
+    # Side effects of a write, queued in its transaction and run off the
+    # request path, see jobs.py. Workers claim due jobs by run_after.
+    __tablename__ = 'job'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.DateTime, nullable=False)
+    claimed_by = db.Column(db.String(32))
+    claimed_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+    __table_args__ = (
+        db.Index('ix_job_run_after', 'run_after'),
+    )
+
+class ShowCounts(db.Model):
+    # Single row: shows starting after rolled_until are counted as upcoming
+    __tablename__ = 'show_counts'
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_until = db.Column(db.DateTime, nullable=False)
+
+index_for_search(Venue.__table__, ['name', 'city'])
+index_for_search(Artist.__table__, ['name', 'city'])
@@ -0,0 +1,96 @@
+#----------------------------------------------------------------------------#
+# Monthly partitions of the show table, on PostgreSQL.
+#
+# show is range partitioned on start_time: one partition per month, named
+# show_yYYYYmMM, and show_default for shows outside of them. Queries bounded
+# on start_time (upcoming shows, availability, the counter roll forward,
+# exports) only read the partitions of their range, so they don't slow down
+# as history grows. `flask show-partitions` creates the months ahead, run it
+# from cron. `flask archive-shows` detaches the months past the retention,
+# writes each one to a gzipped CSV file and drops it.
+#----------------------------------------------------------------------------#
+import gzip
+import os
+import re
+import tempfile
+from datetime import date
+
+from sqlalchemy import text
+
+from counters import owners, rolled_until, update_counters
+
+NAME = re.compile(r'^show_y(\d{4})m(\d{2})$')
+
+
+def month_start(value):
+  return date(value.year, value.month, 1)
+
+def add_months(month, count):
+  month_index = month.year * 12 + month.month - 1 + count
+  return date(month_index // 12, month_index % 12 + 1, 1)
+
+def partition_name(month):
+  return f'show_y{month.year:04d}m{month.month:02d}'
+
+
+def partitions(connection):
+  '''Months of the attached show partitions, in order.'''
+  names = [row[0] for row in connection.execute(text(
+    "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+    "WHERE pg_inherits.inhparent = 'show'::regclass"))]
+  return sorted(date(int(match.group(1)), int(match.group(2)), 1)
+                for match in map(NAME.match, names) if match)
+
+def create_partitions(connection, first, last):
+  '''Create the missing partitions of the months from `first` to `last`,
+  moving their shows out of show_default. Returns the months created.'''
+  existing = set(partitions(connection))
+  created = []
+  month = month_start(first)
+  while month <= last:
+    if month not in existing:
+      name, start, end = partition_name(month), month.isoformat(), add_months(month, 1).isoformat()
+      in_range = f"start_time >= '{start}' AND start_time < '{end}'"
+      # show_default may not keep shows of a range being attached
+      connection.execute(text(f'CREATE TABLE {name} (LIKE show INCLUDING DEFAULTS)'))
+      connection.execute(text(f'INSERT INTO {name} SELECT * FROM show_default WHERE {in_range}'))
+      connection.execute(text(f'DELETE FROM show_default WHERE {in_range}'))
+      connection.execute(text(f"ALTER TABLE show ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+      created.append(month)
+    month = add_months(month, 1)
+  return created
+
+
+def archive(connection, before, directory):
+  '''Detach the partitions of the months ending before `before`, and of
+  shows already counted as past, write each to `directory` as
+  show_yYYYYmMM.csv.gz and drop it. Their shows leave the past counters.
+  Returns the paths written.'''
+  until = rolled_until(connection)
+  before = month_start(before)
+  if until is not None:
+    before = min(before, month_start(until))
+  os.makedirs(directory, exist_ok=True)
+  written = []
+  for month in partitions(connection):
+    if add_months(month, 1) > before:
+      break
+    name = partition_name(month)
+    connection.execute(text(f'ALTER TABLE show DETACH PARTITION {name}'))
+    if until is not None:
+      for model, column in owners:
+        rows = connection.execute(text(f'SELECT {column.key}, count(*) FROM {name} GROUP BY {column.key}'))
+        update_counters(connection, model, {id: [0, -count] for id, count in rows})
+
+    path = os.path.join(directory, name + '.csv.gz')
+    fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+      with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+        connection.connection.cursor().copy_expert(f'COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)', f)
+      os.replace(temporary, path)
+    except BaseException:
+      os.unlink(temporary)
+      raise
+    connection.execute(text(f'DROP TABLE {name}'))
+    written.append(path)
+  return written
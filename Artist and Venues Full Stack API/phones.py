@@ -0,0 +1,29 @@
+#----------------------------------------------------------------------------#
+# Phone number validation.
+#
+# Parsing with phonenumbers is by far the most expensive part of validating a
+# venue or artist, and bulk imports see the same numbers over and over, so
+# results are memoised in a bounded LRU keyed by the raw input.
+#----------------------------------------------------------------------------#
+from functools import lru_cache
+
+import phonenumbers
+
+CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize(number):
+  '''`number` in E.164 form (+14159311234), or None if it isn't valid.'''
+  try:
+    parsed = phonenumbers.parse(number)
+  except phonenumbers.phonenumberutil.NumberParseException:
+    return None
+  if not phonenumbers.is_valid_number(parsed):
+    return None
+  return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+
+
+def batch_validate(numbers):
+  '''Map each distinct number of `numbers` to its E.164 form or None.'''
+  return {number: normalize(number) for number in set(numbers)}
@@ -0,0 +1,191 @@
+#----------------------------------------------------------------------------#
+# Queries shared by the HTML views and the JSON API.
+#----------------------------------------------------------------------------#
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import and_, or_, tuple_
+from sqlalchemy.orm import joinedload, selectinload
+
+from geo import bounding_box, covering_cells, distance_km
+from models import db, Show, Genre, Venue, Artist, RecommendedArtist
+from search import ilike_contains, search
+
+# The Show column holding the id of each kind of entity
+show_column = {Venue: Show.venue_id, Artist: Show.artist_id}
+
+
+def partition_shows(shows, render):
+  # Split already loaded shows into past and upcoming, in start time order,
+  # turning each one into its template data with `render`
+  now = datetime.now()
+  past_shows, upcoming_shows = [], []
+  for show in sorted(shows, key=lambda show: show.start_time):
+    (upcoming_shows if show.start_time > now else past_shows).append(render(show))
+  return past_shows, upcoming_shows
+
+def show_cursor(show):
+  # Opaque position of a show in the chronological show listing
+  return f'{show.start_time.isoformat()},{show.venue_id},{show.artist_id}'
+
+def parse_show_cursor(cursor):
+  # Inverse of show_cursor(), raises ValueError on anything else
+  start_time, venue_id, artist_id = cursor.split(',')
+  return datetime.fromisoformat(start_time), int(venue_id), int(artist_id)
+
+#  Venues
+#  ----------------------------------------------------------------
+
+def venue_areas(genre=None):
+  # Every venue together with its number of upcoming shows in a single query,
+  # ordered so that venues of the same area come out next to each other.
+  rows = db.session.query(
+    Venue.id, Venue.name, Venue.city, Venue.state,
+    Venue.upcoming_shows_count.label('num_upcoming_shows'))
+  if genre:
+    rows = rows.filter(Venue.genres.any(Genre.name == genre))
+  rows = rows.order_by(Venue.state, Venue.city, Venue.id).all()
+
+  data = []
+  for (city, state), area_venues in groupby(rows, key=lambda row: (row.city, row.state)):
+    data.append({
+      'city': city,
+      'state': state,
+      'venues': [{
+        'id': venue.id,
+        'name': venue.name,
+        'num_upcoming_shows': venue.num_upcoming_shows
+      } for venue in area_venues],
+    })
+
+  return data
+
+def venue_listing(columns, genre=None):
+  data = db.session.query(*columns).order_by(Venue.id)
+  if genre:
+    data = data.filter(Venue.genres.any(Genre.name == genre))
+  return data
+
+def load_venue(venue_id):
+  # The venue with its genres and recommended artists, then all of its shows
+  # with their artists: two statements whatever the number of shows.
+  return Venue.query.options(
+    joinedload(Venue.genres),
+    joinedload(Venue.recommendations).joinedload(RecommendedArtist.artist),
+    selectinload(Venue.shows_venue).joinedload(Show.artist)
+  ).get(venue_id)
+
+def venue_show(show):
+  return {
+    "start_time" : show.start_time,
+    "artist_id" : show.artist_id,
+    "artist_image_link" : show.artist.image_link,
+    "artist_thumbnail" : show.artist.thumbnail,
+    "artist_name" : show.artist.name
+  }
+
+def venues_near(latitude, longitude, radius_km, limit):
+  # Venues within `radius_km` of the point, nearest first, as (distance, row).
+  # The geohash cells covering the circle are index range scans, the
+  # bounding box and the exact distance trim what they return.
+  min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+  cells = [and_(Venue.geohash >= cell, Venue.geohash < cell + '~')
+           for cell in covering_cells(latitude, longitude, radius_km)]
+  rows = db.session.query(
+    Venue.id, Venue.name, Venue.city, Venue.state, Venue.latitude, Venue.longitude
+  ).filter(or_(*cells), Venue.latitude.between(min_lat, max_lat),
+           Venue.longitude.between(min_lon, max_lon)).all()
+
+  hits = []
+  for row in rows:
+    distance = distance_km(latitude, longitude, row.latitude, row.longitude)
+    if distance <= radius_km:
+      hits.append((distance, row))
+  hits.sort(key=lambda hit: (hit[0], hit[1].id))
+  return hits[:limit]
+
+#  Artists
+#  ----------------------------------------------------------------
+
+def artist_listing(columns, genre=None):
+  data = db.session.query(*columns).order_by(Artist.id)
+  if genre:
+    data = data.filter(Artist.genres.any(Genre.name == genre))
+  return data
+
+def load_artist(artist_id):
+  # The artist with its genres and recommended artists, then all of its
+  # shows with their venues: two statements whatever the number of shows.
+  return Artist.query.options(
+    joinedload(Artist.genres),
+    joinedload(Artist.recommendations).joinedload(RecommendedArtist.artist),
+    selectinload(Artist.shows_art).joinedload(Show.venue)
+  ).get(artist_id)
+
+def artist_show(show):
+  return {
+    "start_time" : show.start_time,
+    "venue_id" : show.venue_id,
+    "venue_image_link" : show.venue.image_link,
+    "venue_thumbnail" : show.venue.thumbnail,
+    "venue_name" : show.venue.name
+  }
+
+def recommended_artist(recommendation):
+  return {
+    "artist_id": recommendation.artist_id,
+    "artist_name": recommendation.artist.name,
+    "artist_image_link": recommendation.artist.image_link,
+    "artist_thumbnail": recommendation.artist.thumbnail,
+  }
+
+#  Search
+#  ----------------------------------------------------------------
+
+def search_page(model, term, limit, offset):
+  # One page of ranked search hits with their upcoming show counts, and
+  # the total number of hits
+  matches = search(db.session.query(model.id, model.name, model.upcoming_shows_count), model, term,
+    model.genres.any(ilike_contains(Genre.name, term)))
+  hits = matches.limit(limit).offset(offset).all()
+
+  return {
+    "count": matches.order_by(None).count(),
+    "data": [{
+      "id": hit.id,
+      "name": hit.name,
+      "num_upcoming_shows": hit.upcoming_shows_count
+    } for hit in hits]
+  }
+
+#  Shows
+#  ----------------------------------------------------------------
+
+def shows_page(per_page, after=None, upcoming_only=True):
+  # Keyset pagination over (start_time, venue_id, artist_id): the page after
+  # `after` is an index range scan however deep into the listing it is.
+  # Returns the page and the cursor of the next one, if any.
+  page = db.session.query(
+    Show.venue_id,
+    Venue.name.label('venue_name'),
+    Show.artist_id,
+    Artist.image_link.label('artist_image_link'),
+    Artist.thumbnail.label('artist_thumbnail'),
+    Artist.name.label('artist_name'),
+    Show.start_time
+  ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id)
+  if upcoming_only:
+    page = page.filter(Show.start_time > datetime.now())
+  if after:
+    cursor = parse_show_cursor(after)
+    # The plain start_time bound, implied by the row comparison, lets
+    # PostgreSQL skip the partitions before the cursor
+    page = page.filter(Show.start_time >= cursor[0],
+                       tuple_(Show.start_time, Show.venue_id, Show.artist_id) > cursor)
+  data = page.order_by(Show.start_time, Show.venue_id, Show.artist_id).limit(per_page + 1).all()
+
+  next_cursor = None
+  if len(data) > per_page:
+    data = data[:per_page]
+    next_cursor = show_cursor(data[-1])
+  return data, next_cursor
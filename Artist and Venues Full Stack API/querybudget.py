@@ -0,0 +1,79 @@
+#----------------------------------------------------------------------------#
+# Per-request SQL statement counting, for development and CI.
+#
+# Every statement a request runs is recorded. A request going over its
+# budget (QUERY_BUDGETS per endpoint, QUERY_BUDGET_DEFAULT otherwise) or
+# running the same statement shape QUERY_REPEAT_LIMIT times or more, the
+# tell-tale of an N+1 loop, is logged with its most repeated shapes. With
+# QUERY_BUDGET_STRICT set, going over budget raises QueryBudgetExceeded so
+# the request, and the test making it, fails.
+#----------------------------------------------------------------------------#
+import re
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+# Literals and bound parameters, and IN lists of them
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|:\w+|\?")
+IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+
+class QueryBudgetExceeded(Exception):
+  pass
+
+
+def statement_shape(statement):
+  '''`statement` with its literals and parameters replaced by ?, so that the
+  same query issued for different rows has the same shape.'''
+  shape = LITERAL.sub('?', ' '.join(statement.split()))
+  return IN_LIST.sub('(?)', shape)
+
+
+class QueryBudget(object):
+  '''Counts the statements of each request of an app.'''
+
+  def __init__(self, app=None, db=None):
+    self.app = app
+    if app is not None:
+      self.init_app(app, db)
+
+  def init_app(self, app, db):
+    self.app = app
+    with app.app_context():
+      self.watch(db.engine)
+    app.before_request(self.start)
+    app.after_request(self.check)
+
+  def watch(self, engine):
+    event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+
+  def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'statements' in g:
+      g.statements.append(statement)
+
+  def start(self):
+    if self.app.config['QUERY_BUDGET_ENABLED']:
+      g.statements = []
+
+  def budget(self, endpoint):
+    return self.app.config['QUERY_BUDGETS'].get(endpoint, self.app.config['QUERY_BUDGET_DEFAULT'])
+
+  def check(self, response):
+    if 'statements' not in g:
+      return response
+    statements = g.pop('statements')
+    response.headers['X-Query-Count'] = str(len(statements))
+
+    budget = self.budget(request.endpoint)
+    shapes = Counter(statement_shape(statement) for statement in statements).most_common(3)
+    repeated = shapes and shapes[0][1] >= self.app.config['QUERY_REPEAT_LIMIT']
+    if len(statements) > budget or repeated:
+      self.app.logger.warning(
+        '%s %s ran %d statements (budget %d), most repeated:\n%s', request.method, request.path,
+        len(statements), budget, '\n'.join(f'  {count} x {shape}' for shape, count in shapes))
+    if len(statements) > budget and self.app.config['QUERY_BUDGET_STRICT']:
+      raise QueryBudgetExceeded(
+        f'{request.method} {request.path} ran {len(statements)} statements, '
+        f'budget {budget}: {shapes[0][1]} x {shapes[0][0]}')
+    return response
@@ -0,0 +1,136 @@
+#----------------------------------------------------------------------------#
+# Artists recommended from show history.
+#
+# The show table is read as a sparse artist x venue matrix: which artists
+# played which venues. Two artists are similar when they played the same
+# venues, two venues when they hosted the same artists, both by cosine
+# similarity. An artist page lists the artists most similar to it, a venue
+# page the artists who played the venues most similar to it and never
+# played there. The top RECOMMENDATIONS_PER_PAGE of each are kept in the
+# recommended_artist table, so pages read them with one index range scan.
+#
+# `flask recommendations` rebuilds every list, run it from cron. A show
+# pairing an artist and a venue for the first time refreshes the lists that
+# pair changes most: the artist's, its co-stars at the venue, the venue's
+# and the other venues of the artist.
+#----------------------------------------------------------------------------#
+import math
+from collections import Counter, defaultdict
+
+from sqlalchemy import and_, delete, exists, select
+
+from models import Show, RecommendedArtist
+
+table = RecommendedArtist.__table__
+# Owner ids per IN list, below the oldest SQLite limit on bound parameters
+CHUNK = 500
+
+
+class Graph(object):
+  '''Artists and venues linked by the shows between them.'''
+
+  def __init__(self, pairs=()):
+    self.venues = defaultdict(set)
+    self.artists = defaultdict(set)
+    self.add(pairs)
+
+  def add(self, pairs):
+    for venue_id, artist_id in pairs:
+      self.venues[artist_id].add(venue_id)
+      self.artists[venue_id].add(artist_id)
+
+  def similar_artists(self, artist_id, count):
+    '''[(score, artist id)] of the `count` artists most similar to
+    `artist_id`. Needs every venue of it, every artist of those venues and
+    every venue of those artists.'''
+    common = Counter()
+    for venue_id in self.venues[artist_id]:
+      common.update(self.artists[venue_id])
+    common.pop(artist_id, None)
+    degree = len(self.venues[artist_id])
+    scores = [(shared / math.sqrt(degree * len(self.venues[other])), other) for other, shared in common.items()]
+    return top(scores, count)
+
+  def similar_venues(self, venue_id, count):
+    common = Counter()
+    for artist_id in self.artists[venue_id]:
+      common.update(self.venues[artist_id])
+    common.pop(venue_id, None)
+    degree = len(self.artists[venue_id])
+    scores = [(shared / math.sqrt(degree * len(self.artists[other])), other) for other, shared in common.items()]
+    return top(scores, count)
+
+  def artists_for_venue(self, venue_id, count, venues=20):
+    '''[(score, artist id)] of the artists who played the `venues` venues
+    most similar to `venue_id` and not `venue_id` itself, scored by the
+    similarity of the venues they played. Needs every artist of the venue,
+    every venue of those artists and every artist of those venues.'''
+    scores = Counter()
+    for similarity, other in self.similar_venues(venue_id, venues):
+      for artist_id in self.artists[other]:
+        scores[artist_id] += similarity
+    for artist_id in self.artists[venue_id]:
+      scores.pop(artist_id, None)
+    return top([(score, artist_id) for artist_id, score in scores.items()], count)
+
+
+def top(scores, count):
+  # Highest scores first, ties broken by lowest id so lists are stable
+  return sorted(scores, key=lambda item: (-item[0], item[1]))[:count]
+
+
+def rows(kind, owner_id, scores):
+  return [{'kind': kind, 'owner_id': owner_id, 'artist_id': artist_id, 'score': score}
+          for score, artist_id in scores]
+
+def insert(connection, kind, lists):
+  # Add the lists of {owner id: [(score, artist id)]}
+  records = [row for owner_id in sorted(lists) for row in rows(kind, owner_id, lists[owner_id])]
+  for i in range(0, len(records), 10000):
+    connection.execute(table.insert(), records[i:i + 10000])
+
+def write(connection, kind, lists):
+  # Replace the lists of {owner id: [(score, artist id)]}
+  owners = sorted(lists)
+  for i in range(0, len(owners), CHUNK):
+    connection.execute(delete(table).where(and_(table.c.kind == kind, table.c.owner_id.in_(owners[i:i + CHUNK]))))
+  insert(connection, kind, lists)
+
+
+def pairs(connection, where=None):
+  '''Distinct (venue_id, artist_id) of all shows, or of those matching
+  `where`.'''
+  query = select([Show.venue_id, Show.artist_id]).distinct()
+  if where is not None:
+    query = query.where(where)
+  return connection.execute(query).fetchall()
+
+
+def rebuild(connection, count=10, venues=20):
+  '''Recompute every list from the show table.'''
+  graph = Graph(pairs(connection))
+  connection.execute(delete(table))
+  insert(connection, 'artist', {id: graph.similar_artists(id, count) for id in list(graph.venues)})
+  insert(connection, 'venue', {id: graph.artists_for_venue(id, count, venues) for id in list(graph.artists)})
+
+def is_new_pair(connection, venue_id, artist_id, start_time):
+  '''Whether the show of `artist_id` at `venue_id` starting at `start_time`
+  is their only one.'''
+  other_show = select([Show.start_time]).where(and_(
+    Show.venue_id == venue_id, Show.artist_id == artist_id, Show.start_time != start_time))
+  return not connection.execute(select([exists(other_show)])).scalar()
+
+def refresh(connection, venue_id, artist_id, count=10, venues=20):
+  '''Recompute the lists changed most by the first show of `artist_id` at
+  `venue_id`, already written to the show table.'''
+  # The shows of everything the lists are computed from, three hops out from
+  # the artists of the venue and from the venues of the artist
+  venue_artists = select([Show.artist_id]).where(Show.venue_id == venue_id)
+  artist_venues = select([Show.venue_id]).where(Show.artist_id == artist_id)
+  hop = select([Show.venue_id]).where(Show.artist_id.in_(venue_artists))
+  graph = Graph(pairs(connection, Show.artist_id.in_(select([Show.artist_id]).where(Show.venue_id.in_(hop)))))
+  hop = select([Show.artist_id]).where(Show.venue_id.in_(artist_venues))
+  graph.add(pairs(connection, Show.venue_id.in_(select([Show.venue_id]).where(Show.artist_id.in_(hop)))))
+
+  write(connection, 'artist', {id: graph.similar_artists(id, count) for id in graph.artists[venue_id]})
+  write(connection, 'venue', {id: graph.artists_for_venue(id, count, venues) for id in graph.venues[artist_id]})
@@ -0,0 +1,141 @@
+#----------------------------------------------------------------------------#
+# Read replicas.
+#
+# Requests that only read (GET and HEAD, and views marked @read_only) run
+# their queries on one of the SQLALCHEMY_REPLICA_URIS, taken in turn. All
+# else goes to the primary: writes, CLI commands, whatever a request runs
+# after its first flush, and every request of a client for
+# REPLICA_STICKY_SECONDS after it committed, so that it reads its own
+# writes. A replica failing its health check, or dropping a connection, is
+# left out for REPLICA_CHECK_INTERVAL seconds.
+#----------------------------------------------------------------------------#
+import itertools
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, orm, text
+from sqlalchemy.exc import DBAPIError
+
+READ_METHODS = {'GET', 'HEAD'}
+
+
+def read_only(view):
+  '''Mark a view that doesn't write, a search form POST for instance, as
+  servable by a replica.'''
+  view.read_only = True
+  return view
+
+def reads_only():
+  view = current_app.view_functions.get(request.endpoint)
+  return request.method in READ_METHODS or getattr(view, 'read_only', False)
+
+
+class RoutingSession(SignallingSession):
+  '''Session reading from the replica picked for the current request.'''
+
+  def get_bind(self, mapper=None, clause=None):
+    if not self._flushing and has_request_context() and g.get('replica') is not None:
+      return g.replica
+    return SignallingSession.get_bind(self, mapper, clause)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def after_flush(db_session, flush_context):
+  # the rest of the request reads what it wrote
+  if has_request_context():
+    g.replica = None
+
+@event.listens_for(RoutingSession, 'after_commit')
+def after_commit(db_session):
+  if has_request_context() and not reads_only():
+    session['primary_until'] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class Replica(object):
+  def __init__(self, engine):
+    self.engine = engine
+    self.healthy = True
+    # time.monotonic() of the last health check
+    self.checked = float('-inf')
+
+
+class Replicas(object):
+  '''Replica engines of an app, used in turn while healthy. `watchers` are
+  called with every replica engine, to hook their events.'''
+
+  def __init__(self, app=None, watchers=()):
+    self.watchers = list(watchers)
+    self.replicas = []
+    self.turn = itertools.count()
+    self.lock = threading.Lock()
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.app = app
+    app.extensions['replicas'] = self
+    app.before_request(self.route)
+    self.configure(app.config['SQLALCHEMY_REPLICA_URIS'])
+
+  def configure(self, urls):
+    '''Replace the replicas by those at `urls`.'''
+    replicas = []
+    for url in urls:
+      engine = create_engine(url, **self.app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+      replica = Replica(engine)
+      event.listen(engine, 'handle_error', self.disconnected(replica))
+      for watch in self.watchers:
+        watch(engine)
+      replicas.append(replica)
+    old, self.replicas = self.replicas, replicas
+    for replica in old:
+      replica.engine.dispose()
+
+  @property
+  def engines(self):
+    return [replica.engine for replica in self.replicas]
+
+  def disconnected(self, replica):
+    def handle_error(context):
+      if context.is_disconnect:
+        self.app.logger.warning('Lost replica %r: %s', replica.engine.url, context.original_exception)
+        replica.healthy = False
+        replica.checked = time.monotonic()
+    return handle_error
+
+  def check(self, replica):
+    try:
+      with replica.engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+    except DBAPIError as e:
+      if replica.healthy:
+        self.app.logger.warning('Replica %r failed its health check: %s', replica.engine.url, e.orig)
+      replica.healthy = False
+    else:
+      replica.healthy = True
+
+  def pick(self):
+    '''The engine of the next healthy replica, None when all are down.'''
+    replicas = self.replicas
+    for _ in range(len(replicas)):
+      replica = replicas[next(self.turn) % len(replicas)]
+      with self.lock:
+        due = time.monotonic() - replica.checked >= self.app.config['REPLICA_CHECK_INTERVAL']
+        if due:
+          replica.checked = time.monotonic()
+      if due:
+        self.check(replica)
+      if replica.healthy:
+        return replica.engine
+    return None
+
+  def route(self):
+    g.replica = None
+    if self.replicas and reads_only() and session.get('primary_until', 0) < time.time():
+      g.replica = self.pick()
@@ -0,0 +1,132 @@
+#----------------------------------------------------------------------------#
+# Synthetic venues, artists and shows for development and benchmarks.
+#
+# generate() fills the database at a given scale from a seeded random
+# generator, so the same seed always yields the same data. Venues are placed
+# in gazetteer cities, popular venues and artists get more shows, and shows
+# spread over the past year and the next six months, mostly in the evening.
+#----------------------------------------------------------------------------#
+import random
+from datetime import datetime, timedelta
+
+from counters import recount
+from geo import encode, gazetteer
+from models import db, Genre, Venue, Artist, Show, venue_genre, artist_genre
+from phones import normalize
+
+# venues, artists, shows
+SCALES = {
+  '10k': (1000, 1000, 10000),
+  '100k': (10000, 10000, 100000),
+  '1M': (50000, 50000, 1000000),
+}
+GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk',
+          'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk',
+          'R&B', 'Reggae', 'Rock n Roll', 'Soul', 'Other']
+VENUE_WORDS = (['The', 'Old', 'Blue', 'Golden', 'Velvet', 'Red', 'Silver', 'Little', 'Grand', 'Dueling'],
+               ['Musical', 'Park', 'Square', 'Harbor', 'Union', 'Mission', 'Electric', 'Rooftop', 'River', 'Pianos'],
+               ['Hop', 'Hall', 'Lounge', 'Club', 'Bar', 'Theatre', 'Cellar', 'Garden', 'Room', 'Ballroom'])
+ARTIST_WORDS = (['Guns', 'Matt', 'The Wild', 'Lunar', 'Broken', 'Midnight', 'Neon', 'Paper', 'Velvet', 'Static'],
+                ['N', 'and the', 'Sax', 'Echo', 'Glass', 'Wolf', 'River', 'Honey', 'Iron', 'Atlas'],
+                ['Petals', 'Quevado', 'Band', 'Collective', 'Trio', 'Kings', 'Hearts', 'Machines', 'Ghosts', 'Radio'])
+STREETS = ['Main', 'Valencia', 'Mission', 'Market', 'Broadway', 'Elm', 'Oak', 'Pine', 'Maple', 'Cedar']
+AREA_CODES = ['212', '213', '303', '305', '312', '404', '415', '512', '617', '206']
+EVENING_HOURS = [18, 19, 19, 20, 20, 20, 21, 21, 22, 23]
+# Shows start from a year ago to six months ahead
+DAYS = 365 + 183
+
+
+def phone(rng):
+  return f'+1 {rng.choice(AREA_CODES)}-{rng.randrange(200, 1000)}-{rng.randrange(10000):04d}'
+
+def name(rng, words, number):
+  return ' '.join(rng.choice(part) for part in words) + ('' if number % 7 else f' {number}')
+
+def popularity(rng, count):
+  # Long tail weights, capped so that the busiest venues and artists get
+  # about four times the average number of shows
+  return [min(rng.paretovariate(1.2), 20) for _ in range(count)]
+
+def insert(table, rows, chunk=10000):
+  for i in range(0, len(rows), chunk):
+    db.session.execute(table.insert(), rows[i:i + chunk])
+
+
+def generate(venues, artists, shows, seed=0, now=None):
+  '''Add `venues` venues, `artists` artists and `shows` shows, then recount
+  the show counters. Returns the number of rows added per table.'''
+  rng = random.Random(seed)
+  now = (now or datetime.now()).replace(minute=0, second=0, microsecond=0)
+  cities = sorted(gazetteer().items())
+  genres = Genre.named(GENRES)
+  db.session.add_all(genres)
+  db.session.flush()
+  genre_ids = [genre.id for genre in genres]
+  first_venue = (db.session.query(db.func.max(Venue.id)).scalar() or 0) + 1
+  first_artist = (db.session.query(db.func.max(Artist.id)).scalar() or 0) + 1
+
+  rows = []
+  for i in range(venues):
+    (city, state), (latitude, longitude) = rng.choice(cities)
+    number = phone(rng)
+    rows.append({
+      'id': first_venue + i, 'name': name(rng, VENUE_WORDS, i), 'city': city.title(), 'state': state,
+      'address': f'{rng.randrange(1, 3000)} {rng.choice(STREETS)} Street',
+      'phone': number, 'phone_e164': normalize(number),
+      'latitude': latitude, 'longitude': longitude, 'geohash': encode(latitude, longitude),
+      'image_link': f'https://images.example.com/venues/{first_venue + i}.jpg',
+      'facebook_link': f'https://www.facebook.com/venue{first_venue + i}',
+      'website': f'https://venue{first_venue + i}.example.com',
+      'seeking_description': rng.random() < .3,
+    })
+  insert(Venue.__table__, rows)
+  insert(venue_genre, [{'venue_id': row['id'], 'genre_id': genre_id} for row in rows
+                       for genre_id in rng.sample(genre_ids, rng.randint(1, 3))])
+
+  rows = []
+  for i in range(artists):
+    (city, state), _ = rng.choice(cities)
+    number = phone(rng)
+    rows.append({
+      'id': first_artist + i, 'name': name(rng, ARTIST_WORDS, i), 'city': city.title(), 'state': state,
+      'phone': number, 'phone_e164': normalize(number),
+      'image_link': f'https://images.example.com/artists/{first_artist + i}.jpg',
+      'facebook_link': f'https://www.facebook.com/artist{first_artist + i}',
+      'website': f'https://artist{first_artist + i}.example.com',
+      'seeking_venue': rng.random() < .4,
+    })
+  insert(Artist.__table__, rows)
+  insert(artist_genre, [{'artist_id': row['id'], 'genre_id': genre_id} for row in rows
+                        for genre_id in rng.sample(genre_ids, rng.randint(1, 2))])
+
+  rows = []
+  if shows and not (venues and artists):
+    raise ValueError('shows need venues and artists')
+  if shows > venues * len(set(EVENING_HOURS)) * DAYS // 2:
+    raise ValueError(f'{shows} shows are too many for {venues} venues')
+  venue_ids = range(first_venue, first_venue + venues)
+  artist_ids = range(first_artist, first_artist + artists)
+  venue_weights = popularity(rng, venues)
+  artist_weights = popularity(rng, artists)
+  # Neither a venue nor an artist plays two shows at once
+  venue_slots, artist_slots = set(), set()
+  while len(rows) < shows:
+    k = shows - len(rows)
+    for venue_id, artist_id in zip(rng.choices(venue_ids, venue_weights, k=k),
+                                   rng.choices(artist_ids, artist_weights, k=k)):
+      start_time = (now + timedelta(days=rng.randrange(-365, DAYS - 365))).replace(hour=rng.choice(EVENING_HOURS))
+      if (venue_id, start_time) in venue_slots or (artist_id, start_time) in artist_slots:
+        continue
+      venue_slots.add((venue_id, start_time))
+      artist_slots.add((artist_id, start_time))
+      rows.append({'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start_time})
+  insert(Show.__table__, rows)
+  # Rows were given their ids, move the sequences past them for the next
+  # venues and artists
+  if db.engine.dialect.name == 'postgresql':
+    for table in ('venue', 'artist'):
+      db.session.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), max(id)) FROM {table}")
+
+  recount(db.session.connection())
+  db.session.commit()
+  return {'venues': venues, 'artists': artists, 'shows': len(rows)}
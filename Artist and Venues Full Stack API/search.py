@@ -0,0 +1,77 @@
+#----------------------------------------------------------------------------#
+# Ranked name search for venues and artists.
+#
+# PostgreSQL matches with ILIKE, which is answered from the pg_trgm GIN
+# indexes created by migrations 3f9a1c2b7d4e and 8c41e5d2a9f0, and ranks hits
+# by trigram similarity. SQLite mirrors every searchable table into an FTS5
+# table using the trigram tokenizer, kept up to date by triggers, and ranks
+# with bm25.
+#----------------------------------------------------------------------------#
+from sqlalchemy import DDL, event, func, literal_column, or_, select, table, column
+
+# table name -> searchable column names, filled in by index_for_search()
+documents = {}
+
+
+def index_for_search(tbl, columns):
+  '''Make `columns` of `tbl` searchable. On SQLite the FTS5 mirror and its
+  triggers are created and dropped together with the table.'''
+  documents[tbl.name] = list(columns)
+  name = tbl.name
+  fts = f'{name}_fts'
+  cols = ', '.join(columns)
+  new_cols = ', '.join(f'new.{c}' for c in columns)
+  old_cols = ', '.join(f'old.{c}' for c in columns)
+
+  statements = [
+    f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{name}', "
+    f"content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER {name}_fts_ai AFTER INSERT ON {name} BEGIN "
+    f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+    f"CREATE TRIGGER {name}_fts_ad AFTER DELETE ON {name} BEGIN "
+    f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END",
+    f"CREATE TRIGGER {name}_fts_au AFTER UPDATE ON {name} BEGIN "
+    f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+    f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+  ]
+  for statement in statements:
+    event.listen(tbl, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+  event.listen(tbl, 'before_drop', DDL(f'DROP TABLE IF EXISTS {fts}').execute_if(dialect='sqlite'))
+
+
+def ilike_contains(column, term):
+  '''Case insensitive match of `term` anywhere in `column`, its LIKE
+  wildcards taken literally.'''
+  escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+  return column.ilike(f'%{escaped}%', escape='\\')
+
+
+def search(query, model, term, also=None):
+  '''Restrict `query` to rows of `model` matching `term` in any of its
+  searchable columns, best matches first. Rows satisfying the optional
+  `also` clause (e.g. a match on a related table) are returned as well,
+  ranked after direct matches.'''
+  name = model.__tablename__
+  columns = [getattr(model, c) for c in documents[name]]
+  dialect = query.session.get_bind().dialect.name
+
+  # FTS5 trigrams need at least three characters to match on
+  if dialect == 'sqlite' and len(term) >= 3:
+    fts = table(f'{name}_fts', column('rowid'))
+    phrase = '"' + term.replace('"', '""') + '"'
+    hits = select([fts.c.rowid, func.bm25(literal_column(fts.name)).label('rank')]).where(
+      literal_column(fts.name).op('MATCH')(phrase)).alias(f'{name}_hits')
+    if also is None:
+      return query.join(hits, hits.c.rowid == model.id).order_by(hits.c.rank, model.id)
+    return query.outerjoin(hits, hits.c.rowid == model.id).filter(
+      or_(hits.c.rowid.isnot(None), also)
+    ).order_by(func.coalesce(hits.c.rank, 0), model.id)
+
+  matched = [ilike_contains(c, term) for c in columns]
+  if also is not None:
+    matched.append(also)
+  matches = query.filter(or_(*matched))
+  if dialect == 'postgresql':
+    rank = func.greatest(*[func.similarity(c, term) for c in columns])
+    return matches.order_by(rank.desc(), model.id)
+  return matches.order_by(model.id)
@@ -0,0 +1,1037 @@
+import csv
+import gzip
+import html
+import http.server
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import babel.dates
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+# Point the app at a throwaway SQLite database before it is imported
+db_fd, db_path = tempfile.mkstemp(suffix='.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+# Jobs run when a test runs them, not in background threads
+os.environ['JOBS_WORKERS'] = '0'
+
+from availability import calendar, free_intervals
+from booking import is_slot_taken
+from cache import FragmentCache, LRUCache
+from counters import recount, roll_forward
+from export import export, show_rows
+from jobs import enqueue
+from models import Job
+from geo import distance_km, encode
+from partitions import add_months, archive, create_partitions, month_start, partition_name, partitions
+from phones import batch_validate
+from querybudget import QueryBudgetExceeded, statement_shape
+from sampledata import generate
+from thumbnails import ImageError, fetch
+from app import (app, cache, db, jobs, metrics, replicas, Venue, Artist, Show, Genre, format_datetime, format_datetimes,
+                 load_artist, load_venue, venues_near)
+
+
+@contextmanager
+def count_queries():
+    """Collect every SQL statement issued inside the block."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def sequential_scans(statements, table):
+    """Statements among `statements` that read `table` without an index."""
+    scans = []
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            conn.execute('SET enable_seqscan = off')
+        for statement, parameters in statements:
+            if f'FROM {table}' not in statement and f'JOIN {table}' not in statement:
+                continue
+            if conn.dialect.name == 'sqlite':
+                plan = conn.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+                if any(row[-1].startswith(f'SCAN {table}') for row in plan):
+                    scans.append(statement)
+            else:
+                plan = conn.execute('EXPLAIN ' + statement, parameters)
+                if any(f'Seq Scan on {table}' in row[0] for row in plan):
+                    scans.append(statement)
+    return scans
+
+
+def seed(venues, shows_per_venue, city_count=5):
+    """Insert `venues` venues spread over `city_count` cities, one artist
+    and `shows_per_venue` upcoming shows for every venue."""
+    artist = Artist(name='Guns N Petals', city='San Francisco', state='CA')
+    db.session.add(artist)
+    db.session.flush()
+    start = datetime.now() + timedelta(days=1)
+    for i in range(venues):
+        venue = Venue(name=f'Venue {i}', city=f'City {i % city_count}', state='CA')
+        db.session.add(venue)
+        db.session.flush()
+        for j in range(shows_per_venue):
+            db.session.add(Show(venue_id=venue.id, artist_id=artist.id,
+                                start_time=start + timedelta(hours=j)))
+    db.session.commit()
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the Fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        cache.clear()
+        calendar.invalidate()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    '''
+    Endpoint GET /venues
+    The venue directory is built with a constant number of queries,
+    however many venues and shows there are.
+    '''
+    def test_venues_query_count_is_constant(self):
+        seed(venues=10, shows_per_venue=2)
+        with count_queries() as small:
+            response = self.client().get('/venues')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Number of upcomgins shows: 2', response.data)
+
+        seed(venues=200, shows_per_venue=5)
+        cache.clear()
+        with count_queries() as large:
+            response = self.client().get('/venues')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(small), len(large))
+
+    def test_venues_grouped_by_area(self):
+        seed(venues=6, shows_per_venue=1, city_count=3)
+        past = Show(venue_id=1, artist_id=1, start_time=datetime.now() - timedelta(days=1))
+        db.session.add(past)
+        db.session.commit()
+        response = self.client().get('/venues')
+        body = response.data.decode()
+        for i in range(3):
+            self.assertEqual(body.count(f'City {i}, CA'), 1)
+        self.assertEqual(body.count('Number of upcomgins shows: 1'), 6)
+
+    '''
+    Endpoint POST /venues/search and /artists/search
+    Upcoming show counts for all hits are resolved with one grouped query
+    and the hits are paged.
+    '''
+    def test_search_venues_query_count_is_constant(self):
+        seed(venues=5, shows_per_venue=1)
+        with count_queries() as small:
+            self.client().post('/venues/search', data={'search_term': 'venue'})
+        seed(venues=40, shows_per_venue=3)
+        with count_queries() as large:
+            response = self.client().post('/venues/search', data={'search_term': 'venue'})
+        self.assertEqual(len(small), len(large))
+        self.assertIn(b'Number of search results for "venue": 45', response.data)
+
+    def test_search_venues_paging(self):
+        seed(venues=12, shows_per_venue=1)
+        response = self.client().post('/venues/search', data={'search_term': 'venue', 'limit': 5, 'offset': 10})
+        body = response.data.decode()
+        self.assertIn('Number of search results for "venue": 12', body)
+        self.assertEqual(body.count('href="/venues/'), 2)
+
+    def test_search_artists_counts_upcoming_shows(self):
+        seed(venues=3, shows_per_venue=2)
+        response = self.client().post('/artists/search', data={'search_term': 'petals'})
+        self.assertIn(b'Number of search results for "petals": 1', response.data)
+        # the kept counters agree with a recount
+        with db.engine.begin() as connection:
+            recount(connection)
+        self.assertEqual(db.session.query(Artist.upcoming_shows_count).all(), [(6,)])
+
+    def test_search_ranks_matches(self):
+        db.session.add_all([
+            Venue(name='Park Square Live Music & Coffee', city='San Francisco', state='CA'),
+            Venue(name='The Dueling Pianos Bar', city='New York', state='NY'),
+            Venue(name='The Musical Hop', city='San Francisco', state='CA'),
+        ])
+        db.session.commit()
+        response = self.client().post('/venues/search', data={'search_term': 'Music'})
+        body = response.data.decode()
+        self.assertIn('Number of search results for "Music": 2', body)
+        self.assertNotIn('Dueling', body)
+
+        response = self.client().post('/venues/search', data={'search_term': 'new york'})
+        self.assertIn(b'The Dueling Pianos Bar', response.data)
+
+        # too short for trigrams, answered by the LIKE fallback
+        response = self.client().post('/venues/search', data={'search_term': 'Ho'})
+        self.assertIn(b'The Musical Hop', response.data)
+
+        # LIKE wildcards in the term match only themselves
+        db.session.add(Venue(name='100% Jazz', city='Austin', state='TX'))
+        db.session.commit()
+        response = self.client().post('/venues/search', data={'search_term': '_'})
+        self.assertIn(b'Number of search results for "_": 0', response.data)
+        response = self.client().post('/venues/search', data={'search_term': '0%'})
+        self.assertIn(b'Number of search results for "0%": 1', response.data)
+
+    '''
+    Genres are stored in their own table and listings can be filtered by them
+    '''
+    def test_create_venue_with_genres(self):
+        response = self.client().post('/venues/create', data={
+            'name': 'The Musical Hop', 'city': 'San Francisco', 'state': 'CA',
+            'address': '1015 Folsom Street', 'phone': '+1 415 931 1234',
+            'genres': ['Jazz', 'Reggae'], 'image_link': 'https://example.com/hop.jpg',
+            'facebook_link': 'https://www.facebook.com/TheMusicalHop',
+            'website': 'https://www.themusicalhop.com'})
+        self.assertEqual(response.status_code, 200)
+        venue = Venue.query.filter_by(name='The Musical Hop').one()
+        self.assertEqual([genre.name for genre in venue.genres], ['Jazz', 'Reggae'])
+        self.assertEqual(venue.phone_e164, '+14159311234')
+
+        response = self.client().get(f'/venues/{venue.id}')
+        self.assertIn(b'<span class="genre">Reggae</span>', response.data)
+
+    def test_listings_filtered_by_genre(self):
+        jazz, folk = Genre.named(['Jazz', 'Folk'])
+        db.session.add_all([
+            Venue(name='Jazz Cellar', city='Austin', state='TX', genres=[jazz]),
+            Venue(name='Folk Barn', city='Austin', state='TX', genres=[folk]),
+            Artist(name='Quartet', city='Austin', state='TX', genres=[jazz, folk]),
+            Artist(name='Fiddler', city='Austin', state='TX', genres=[folk]),
+        ])
+        db.session.commit()
+        self.assertEqual(Genre.named(['Folk', 'Swing'])[0].id, folk.id)
+
+        body = self.client().get('/venues?genre=Jazz').data.decode()
+        self.assertIn('Jazz Cellar', body)
+        self.assertNotIn('Folk Barn', body)
+        body = self.client().get('/artists?genre=Jazz').data.decode()
+        self.assertIn('Quartet', body)
+        self.assertNotIn('Fiddler', body)
+
+        response = self.client().post('/artists/search', data={'search_term': 'folk'})
+        self.assertIn(b'Number of search results for "folk": 2', response.data)
+
+    '''
+    Endpoint GET /venues/<id> and /artists/<id>
+    Detail pages load the entity, its genres and all of its shows in two
+    statements and split the shows into past and upcoming.
+    '''
+    def test_venue_detail_statement_count(self):
+        seed(venues=1, shows_per_venue=3)
+        db.session.add(Show(venue_id=1, artist_id=1, start_time=datetime.now() - timedelta(days=3)))
+        db.session.commit()
+        db.session.expunge_all()
+        with count_queries() as statements:
+            response = self.client().get('/venues/1')
+        body = response.data.decode()
+        self.assertEqual(len(statements), 2)
+        self.assertIn('3 Upcoming Shows', body)
+        self.assertIn('1 Past Show', body)
+
+    def test_artist_detail_statement_count(self):
+        seed(venues=4, shows_per_venue=2)
+        db.session.expunge_all()
+        with count_queries() as statements:
+            response = self.client().get('/artists/1')
+        self.assertEqual(len(statements), 2)
+        self.assertIn(b'8 Upcoming Shows', response.data)
+        self.assertIn(b'Venue 3', response.data)
+
+    def test_missing_detail_page(self):
+        self.assertEqual(self.client().get('/venues/42').status_code, 404)
+        self.assertEqual(self.client().get('/artists/42').status_code, 404)
+
+    '''
+    Show lookups by venue or artist, bounded by start_time, are answered
+    from the show indexes rather than by scanning the table.
+    '''
+    def test_show_lookups_use_indexes(self):
+        seed(venues=20, shows_per_venue=5)
+        with count_queries() as statements:
+            self.client().get('/venues')
+            self.client().get('/venues/3')
+            self.client().get('/artists/1')
+            self.client().get('/shows')
+            self.client().post('/venues/search', data={'search_term': 'venue'})
+            self.client().post('/artists/search', data={'search_term': 'petals'})
+        self.assertEqual(sequential_scans(statements, 'show'), [])
+
+    '''
+    Endpoint GET /shows
+    Shows are listed a page at a time, following a keyset cursor.
+    '''
+    def test_shows_keyset_pages(self):
+        seed(venues=5, shows_per_venue=3)
+        db.session.add(Show(venue_id=1, artist_id=1, start_time=datetime.now() - timedelta(days=1)))
+        db.session.commit()
+
+        seen = []
+        url = '/shows?per_page=4'
+        while url:
+            response = self.client().get(url)
+            self.assertEqual(response.status_code, 200)
+            body = response.data.decode()
+            seen.append(body.count('class="tile tile-show"'))
+            match = re.search(r'href="(/shows\?after=[^"]+)"', body)
+            url = html.unescape(match.group(1)) if match else None
+        self.assertEqual(seen, [4, 4, 4, 3])
+
+        response = self.client().get('/shows?upcoming=0&per_page=100')
+        self.assertEqual(response.data.decode().count('class="tile tile-show"'), 16)
+        self.assertEqual(self.client().get('/shows?after=garbage').status_code, 400)
+
+    '''
+    Listing fragments are served from the cache until a create handler
+    invalidates them.
+    '''
+    def test_listing_cache_hits_and_invalidation(self):
+        before = cache.stats()
+        seed(venues=3, shows_per_venue=1)
+        self.client().get('/venues')
+        with count_queries() as statements:
+            response = self.client().get('/venues')
+        self.assertEqual(statements, [])
+        self.assertIn(b'Venue 2', response.data)
+
+        self.client().post('/venues/create', data={
+            'name': 'Brand New Hall', 'city': 'City 0', 'state': 'CA',
+            'address': '1 Main Street', 'phone': '+1 415 931 1234',
+            'genres': ['Jazz'], 'image_link': 'https://example.com/hall.jpg',
+            'facebook_link': 'https://www.facebook.com/hall',
+            'website': 'https://hall.example.com'})
+        self.assertIn(b'Brand New Hall', self.client().get('/venues').data)
+
+        after = self.client().get('/cache/stats').get_json()
+        for counter, expected in [('hits', 1), ('misses', 2), ('invalidations', 1)]:
+            self.assertEqual(after[counter]['venues'] - before[counter].get('venues', 0), expected)
+
+    '''
+    Endpoint GET /metrics
+    Pool events, per-route query counts and timings in the Prometheus format.
+    '''
+    def test_metrics(self):
+        seed(venues=3, shows_per_venue=1)
+        detail_queries = metrics.queries['/venues/<int:venue_id>']
+        self.client().get('/venues')
+        self.client().get('/venues/1')
+        response = self.client().get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.data.decode()
+        self.assertRegex(body, r'fyyur_db_pool_events_total\{pool="\w+",event="checkout"\} [1-9]')
+        self.assertIn(f'fyyur_db_queries_total{{route="/venues/<int:venue_id>"}} {detail_queries + 2}', body)
+        self.assertRegex(body, r'fyyur_db_query_seconds_count\{route="/venues"\} [1-9]')
+        self.assertRegex(body, r'fyyur_cache_misses_total\{backend="LRUCache",route="venues"\} [1-9]')
+        # failed statements don't leave their start times behind
+        with db.engine.connect() as connection:
+            with self.assertRaises(OperationalError):
+                connection.execute('SELECT * FROM no_such_table')
+            self.assertEqual(connection.info['query_started'], [])
+
+    def test_listing_cache_entries_expire(self):
+        lru = LRUCache(max_entries=2)
+        lru.set('a', 'A', ttl=60)
+        lru.set('b', 'B', ttl=0)
+        lru.set('c', 'C', ttl=60)
+        self.assertIsNone(lru.get('b'))
+        lru.set('d', 'D', ttl=60)
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(lru.get('c'), 'C')
+        # other processes' invalidations never reach it, TTLs are capped
+        capped = LRUCache(max_ttl=0)
+        capped.set('a', 'A', ttl=600)
+        self.assertIsNone(capped.get('a'))
+        self.assertEqual(FragmentCache.from_config(app.config).backend.max_ttl, app.config['CACHE_MEMORY_TTL'])
+
+    '''
+    Command flask import-data
+    Rows are validated with the form rules, bad rows go to the rejects file.
+    '''
+    def test_import_venues_and_shows(self):
+        workdir = tempfile.mkdtemp()
+        venues_csv = os.path.join(workdir, 'venues.csv')
+        with open(venues_csv, 'w') as f:
+            f.write('name,city,state,address,phone,genres,image_link,facebook_link,website\n')
+            f.write('Jazz Cellar,Austin,TX,1 Main St,+1 415 931 1234,"Jazz,Blues",'
+                    'https://example.com/a.jpg,https://facebook.com/a,https://a.example.com\n')
+            f.write('Bad Phone,Austin,TX,2 Main St,12345,Jazz,'
+                    'https://example.com/b.jpg,https://facebook.com/b,https://b.example.com\n')
+        shows_json = os.path.join(workdir, 'shows.ndjson')
+        with open(shows_json, 'w') as f:
+            f.write('{"venue_id": 1, "artist_id": 1, "start_time": "2035-05-21 21:30:00"}\n')
+            f.write('{"venue_id": 7, "artist_id": 1, "start_time": "2035-05-21 21:30:00"}\n')
+            f.write('{"venue_id": 1, "artist_id": 1}\n')
+            f.write('not json\n')
+        rejects = os.path.join(workdir, 'rejects.ndjson')
+
+        db.session.add(Artist(name='Guns N Petals', city='San Francisco', state='CA'))
+        db.session.commit()
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['import-data', 'venues', venues_csv, '--rejects', rejects])
+        self.assertIn('Imported 1 venues, rejected 1.', result.output)
+        venue = Venue.query.one()
+        self.assertEqual([genre.name for genre in venue.genres], ['Blues', 'Jazz'])
+        with open(rejects) as f:
+            self.assertEqual(json.loads(f.readline())['errors'], {'phone': ['Invalid phone number']})
+
+        result = runner.invoke(args=['import-data', 'shows', shows_json, '--rejects', rejects,
+                                     '--chunk-size', '2'])
+        self.assertIn('Imported 1 shows, rejected 3.', result.output)
+        self.assertEqual(Show.query.one().start_time, datetime(2035, 5, 21, 21, 30))
+        db.session.expire_all()
+        self.assertEqual(Venue.query.one().upcoming_shows_count, 1)
+
+    '''
+    Endpoint GET /api/v1/venues/nearby
+    Venues are geocoded from the gazetteer on creation and found by radius.
+    '''
+    def test_nearby_venues(self):
+        self.assertEqual(encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        for name, city, state in [('Fillmore', 'San Francisco', 'CA'), ('Fox', 'Oakland', 'CA'),
+                                  ('Bowery', 'New York', 'NY'), ('Nowhere', 'Smallville', 'KS')]:
+            response = self.client().post('/venues/create', data={
+                'name': name, 'city': city, 'state': state, 'address': '1 Main Street',
+                'phone': '+1 415 931 1234', 'genres': ['Jazz'], 'image_link': 'https://example.com/a.jpg',
+                'facebook_link': 'https://www.facebook.com/a', 'website': 'https://a.example.com'})
+            self.assertEqual(response.status_code, 200)
+        self.assertIsNone(Venue.query.filter_by(name='Nowhere').one().geohash)
+
+        body = self.client().get('/api/v1/venues/nearby?lat=37.7749&lng=-122.4194&radius=20').get_json()
+        self.assertEqual([venue['name'] for venue in body['data']], ['Fillmore', 'Fox'])
+        self.assertEqual(body['data'][0]['distance_km'], 0)
+        self.assertAlmostEqual(body['data'][1]['distance_km'], 13.4, delta=0.5)
+        response = self.client().get('/api/v1/venues/nearby?lat=91&lng=0')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['message'], 'lat and lng are required coordinates')
+
+    def test_nearby_matches_brute_force(self):
+        rng = random.Random(7)
+        points = [(rng.uniform(25, 48), rng.uniform(-124, -70)) for _ in range(2000)]
+        db.session.execute(Venue.__table__.insert(), [
+            {'name': f'Venue {i}', 'latitude': lat, 'longitude': lon, 'geohash': encode(lat, lon)}
+            for i, (lat, lon) in enumerate(points, 1)])
+        db.session.commit()
+        for radius in (5, 50, 300):
+            for lat, lon in points[:10]:
+                lat, lon = lat + rng.uniform(-.5, .5), lon + rng.uniform(-.5, .5)
+                expected = sorted(i for i, point in enumerate(points, 1)
+                                  if distance_km(lat, lon, *point) <= radius)
+                with count_queries() as statements:
+                    hits = venues_near(lat, lon, radius, limit=len(points))
+                self.assertEqual(sorted(venue.id for _, venue in hits), expected)
+                self.assertEqual(sequential_scans(statements, 'venue'), [])
+
+    '''
+    Endpoint GET /api/v1/venues/availability
+    Free slots of many venues within a window, from the cached day calendars.
+    '''
+    def test_free_intervals(self):
+        length = timedelta(hours=3)
+        day = datetime(2035, 5, 25)
+        starts = [day + timedelta(hours=h) for h in (12, 19, 21, 26)]
+        self.assertEqual(free_intervals(starts, day + timedelta(hours=16), day + timedelta(hours=30),
+                                        length, timedelta(hours=1)),
+                         [(day + timedelta(hours=16), day + timedelta(hours=19)),
+                          (day + timedelta(hours=24), day + timedelta(hours=26)),
+                          (day + timedelta(hours=29), day + timedelta(hours=30))])
+        self.assertEqual(free_intervals([], day, day + length, length, length), [(day, day + length)])
+
+    def test_venue_availability(self):
+        seed(venues=3, shows_per_venue=0)
+        friday = datetime(2035, 5, 25)
+        for venue_id, hours in [(1, (19,)), (2, (16, 19, 22)), (3, (14,))]:
+            for hour in hours:
+                db.session.add(Show(venue_id=venue_id, artist_id=1, start_time=friday + timedelta(hours=hour)))
+        db.session.commit()
+
+        window = 'start=2035-05-25T18:00:00&end=2035-05-26T01:00:00'
+        body = self.client().get(f'/api/v1/venues/availability?{window}').get_json()
+        self.assertEqual(body['data'], [
+            {'id': 1, 'name': 'Venue 0', 'free': [['2035-05-25T22:00:00', '2035-05-26T01:00:00']]},
+            {'id': 3, 'name': 'Venue 2', 'free': [['2035-05-25T18:00:00', '2035-05-26T01:00:00']]},
+        ])
+        body = self.client().get(f'/api/v1/venues/availability?{window}&min_length=240&limit=2').get_json()
+        self.assertEqual([venue['id'] for venue in body['data']], [])
+        self.assertEqual(body['next'], 2)
+
+        # the cached day is dropped when a show is booked through the form
+        self.client().post('/shows/create', data={'venue_id': 3, 'artist_id': 1,
+                                                  'start_time': '2035-05-25 20:00:00'})
+        body = self.client().get(f'/api/v1/venues/availability?{window}&min_length=120').get_json()
+        self.assertEqual(body['data'][-1], {'id': 3, 'name': 'Venue 2', 'free': [
+            ['2035-05-25T18:00:00', '2035-05-25T20:00:00'], ['2035-05-25T23:00:00', '2035-05-26T01:00:00']]})
+        self.assertEqual(self.client().get('/api/v1/venues/availability?start=friday').status_code, 400)
+
+    '''
+    Command flask thumbnails and endpoint GET /thumbnails/<name>
+    Images are fetched once each from a local server, scaled down and served
+    under content-addressed names.
+    '''
+    def test_thumbnails(self):
+        served = []
+        images = {}
+        for path, size in [('/big.png', (1200, 800)), ('/small.png', (100, 50))]:
+            buffer = io.BytesIO()
+            Image.new('RGB', size, (200, 30, 30)).save(buffer, 'PNG')
+            images[path] = buffer.getvalue()
+
+        class ImageHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                served.append(self.path)
+                if self.path not in images:
+                    self.send_error(404)
+                    return
+                if images[self.path] is None:
+                    self.send_response(302)
+                    self.send_header('Location', 'file:///etc/passwd')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.end_headers()
+                self.wfile.write(images[self.path])
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{server.server_address[1]}'
+        app.config['THUMBNAIL_DIR'] = tempfile.mkdtemp()
+        # the image server is on 127.0.0.1
+        app.config['THUMBNAIL_ALLOW_PRIVATE'] = True
+        try:
+            db.session.add_all([
+                Venue(name='Big', image_link=base + '/big.png'),
+                Venue(name='Small', image_link=base + '/small.png'),
+                Venue(name='Missing', image_link=base + '/missing.png'),
+                Artist(name='Also Big', image_link=base + '/big.png'),
+            ])
+            db.session.commit()
+            result = app.test_cli_runner().invoke(args=['thumbnails', '--workers', '4'])
+
+            # a new venue queues its own, the others are done or missing
+            db.session.add(Venue(name='Queued', image_link=base + '/small.png'))
+            db.session.commit()
+            self.assertEqual(jobs.run_pending(), (4, 1))
+            queued = Venue.query.filter_by(name='Queued').one()
+
+            # outside of tests, links to internal addresses are never fetched
+            for url in [base + '/big.png', 'http://169.254.169.254/latest/meta-data/', 'http://10.1.2.3/a.png',
+                        'http://[::1]/a.png', 'ftp://example.com/a.png', 'file:///etc/passwd']:
+                with self.assertRaises(ImageError):
+                    fetch(url, timeout=1)
+            # nor redirects to them
+            images['/redirect.png'] = None
+            with self.assertRaises(ImageError):
+                fetch(base + '/redirect.png', timeout=1, allow_private=True)
+        finally:
+            app.config['THUMBNAIL_ALLOW_PRIVATE'] = False
+            server.shutdown()
+            server.server_close()
+        self.assertIn('Thumbnailed 2 images, 1 failed.', result.output)
+        self.assertEqual(sorted(served), ['/big.png', '/missing.png', '/missing.png', '/redirect.png', '/small.png',
+                                          '/small.png'])
+
+        big, small, missing, _ = Venue.query.order_by(Venue.id).all()
+        self.assertEqual(Artist.query.one().thumbnail, big.thumbnail)
+        self.assertIsNone(missing.thumbnail)
+        self.assertEqual(queued.thumbnail, small.thumbnail)
+        self.assertRegex(big.thumbnail, r'^[0-9a-f]{64}\.jpg$')
+
+        response = self.client().get(f'/thumbnails/{big.thumbnail}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/jpeg')
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+        self.assertEqual(Image.open(io.BytesIO(response.data)).size, (320, 213))
+        response.close()
+        self.assertEqual(self.client().get('/thumbnails/../app.py').status_code, 404)
+
+        self.assertIn(f'src="/thumbnails/{big.thumbnail}"'.encode(), self.client().get('/venues/1').data)
+        self.assertIn(f'src="{base}/missing.png"'.encode(), self.client().get('/venues/3').data)
+
+    '''
+    Endpoint POST /shows/create
+    Concurrent bookings of the same venue slot: exactly one wins, the others
+    get a 409.
+    '''
+    def test_concurrent_bookings_never_double_book(self):
+        seed(venues=2, shows_per_venue=0)
+        db.session.add(Artist(name='The Wild Sax Band'))
+        db.session.commit()
+        slots = ['2035-05-21 18:00:00', '2035-05-21 21:00:00', '2035-05-22 21:00:00']
+        requests = [{'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start_time}
+                    for start_time in slots for venue_id in (1, 2) for artist_id in (1, 2)] * 4
+
+        def book(data):
+            return self.client().post('/shows/create', data=data).status_code
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            statuses = list(pool.map(book, requests))
+        self.assertEqual(statuses.count(200), len(slots) * 2)
+        self.assertEqual(statuses.count(409), len(requests) - len(slots) * 2)
+        self.assertEqual(db.session.query(Show.venue_id, Show.start_time).distinct().count(), len(slots) * 2)
+        self.assertEqual(Show.query.count(), len(slots) * 2)
+
+        response = self.client().post('/shows/create', data={'venue_id': 9, 'artist_id': 1,
+                                                              'start_time': slots[0]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b'No such venue.', response.data)
+
+    def test_booking_rejects_overlapping_shows(self):
+        seed(venues=1, shows_per_venue=0)
+        def book(start_time):
+            return self.client().post('/shows/create', data={'venue_id': 1, 'artist_id': 1,
+                                                              'start_time': start_time}).status_code
+        self.assertEqual(book('2035-05-21 20:00:00'), 200)
+        # the same start, or one within SHOW_LENGTH_MINUTES either side
+        self.assertEqual(book('2035-05-21 20:00:00'), 409)
+        self.assertEqual(book('2035-05-21 21:00:00'), 409)
+        self.assertEqual(book('2035-05-21 17:30:00'), 409)
+        self.assertEqual(book('2035-05-21 23:00:00'), 200)
+        self.assertEqual(book('2035-05-21 17:00:00'), 200)
+        self.assertEqual(Show.query.count(), 3)
+
+        # only unique violations on show are a taken slot
+        def integrity_error(table, row):
+            with self.assertRaises(IntegrityError) as raised:
+                with db.engine.begin() as connection:
+                    connection.execute(table.insert(), row)
+            return raised.exception
+        show = {'venue_id': 1, 'artist_id': 1, 'start_time': datetime(2035, 5, 21, 20)}
+        self.assertTrue(is_slot_taken(integrity_error(Show.__table__, show)))
+        self.assertTrue(is_slot_taken(integrity_error(Show.__table__, {**show, 'artist_id': 2})))
+        self.assertFalse(is_slot_taken(integrity_error(Venue.__table__, {'id': 1, 'name': 'Again'})))
+        self.assertFalse(is_slot_taken(integrity_error(Genre.__table__, {'name': None})))
+
+    '''
+    Statement budgets per request
+    '''
+    def test_query_budget_reports_repeated_statements(self):
+        self.assertEqual(
+            statement_shape("SELECT venue.id FROM venue\n WHERE venue.id IN (?, ?, ?) AND name = 'x' LIMIT 10"),
+            'SELECT venue.id FROM venue WHERE venue.id IN (?) AND name = ? LIMIT ?')
+
+        seed(venues=6, shows_per_venue=1)
+        saved = {key: app.config[key] for key in ('QUERY_BUDGET_ENABLED', 'QUERY_BUDGET_STRICT', 'QUERY_BUDGETS')}
+        app.config.update(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_STRICT=True,
+                          QUERY_BUDGETS={'api.venues': 1})
+        try:
+            with self.assertLogs(app.logger, 'WARNING') as logs:
+                with self.assertRaises(QueryBudgetExceeded):
+                    self.client().get('/api/v1/venues?fields=name,genres')
+        finally:
+            app.config.update(saved)
+        self.assertIn('ran 2 statements (budget 1)', logs.output[0])
+
+    '''
+    Show counters on venues and artists
+    Kept by show inserts and deletes, rolled from upcoming to past by
+    flask roll-show-counts.
+    '''
+    def test_show_counters_roll_forward(self):
+        seed(venues=2, shows_per_venue=3)
+        db.session.add(Show(venue_id=1, artist_id=1, start_time=datetime.now() - timedelta(days=2)))
+        db.session.commit()
+        counts = lambda model: db.session.query(
+            model.id, model.upcoming_shows_count, model.past_shows_count).order_by(model.id).all()
+        self.assertEqual(counts(Venue), [(1, 3, 1), (2, 3, 0)])
+        self.assertEqual(counts(Artist), [(1, 6, 1)])
+
+        # the first two shows of every venue start within the next 25 hours
+        later = datetime.now() + timedelta(hours=25, minutes=30)
+        self.assertEqual(roll_forward(db.session.connection(), later), 4)
+        self.assertEqual(roll_forward(db.session.connection(), later), 0)
+        db.session.commit()
+        self.assertEqual(counts(Venue), [(1, 1, 3), (2, 1, 2)])
+        self.assertEqual(counts(Artist), [(1, 2, 5)])
+
+        db.session.delete(Show.query.filter_by(venue_id=2).order_by(Show.start_time.desc()).first())
+        db.session.commit()
+        self.assertEqual(counts(Venue), [(1, 1, 3), (2, 0, 2)])
+
+        result = app.test_cli_runner().invoke(args=['roll-show-counts', '--recount'])
+        self.assertIn('Recounted all shows.', result.output)
+        # split at the real current time again
+        self.assertEqual(counts(Venue), [(1, 3, 1), (2, 2, 0)])
+        self.assertEqual(counts(Artist), [(1, 5, 1)])
+
+    def test_generate_sample_data(self):
+        self.assertEqual(generate(50, 40, 600, seed=3), {'venues': 50, 'artists': 40, 'shows': 600})
+        self.assertEqual((Venue.query.count(), Artist.query.count(), Show.query.count()), (50, 40, 600))
+        # no artist plays two shows at once, the venue constraint covers venues
+        self.assertEqual(db.session.query(Show.artist_id, Show.start_time).distinct().count(), 600)
+        self.assertEqual(Venue.query.filter(Venue.geohash.is_(None) | Venue.phone_e164.is_(None)).count(), 0)
+        for model in (Venue, Artist):
+            self.assertEqual(db.session.query(db.func.sum(model.upcoming_shows_count + model.past_shows_count)).scalar(), 600)
+            self.assertEqual(db.session.query(db.func.sum(model.upcoming_shows_count)).scalar(),
+                             Show.query.filter(Show.start_time > datetime.now()).count())
+        self.assertTrue(all(venue.genres for venue in Venue.query))
+
+        # shows are spread unevenly, popular venues get more
+        per_venue = sorted(count for _, count in db.session.query(Show.venue_id, db.func.count()).group_by(Show.venue_id))
+        self.assertGreater(per_venue[-1], 2 * per_venue[len(per_venue) // 2])
+
+        result = app.test_cli_runner().invoke(args=['seed-data', '--scale', '10k', '--seed', '1'])
+        self.assertIn('Added 1000 venues, 1000 artists and 10000 shows.', result.output)
+        self.assertEqual(Venue.query.count(), 1050)
+        # ids handed out after seeding don't collide with the seeded ones
+        response = self.client().post('/venues/create', data=form_data)
+        self.assertIn(b'successfully listed', response.data)
+        self.assertEqual(Venue.query.filter_by(name='Brand New Hall').one().id, 1051)
+        response = self.client().post('/artists/create', data=form_data)
+        self.assertIn(b'successfully listed', response.data)
+        self.assertEqual(Artist.query.filter_by(name='Brand New Hall').one().id, 1041)
+
+    def test_read_replica_routing(self):
+        seed(venues=2, shows_per_venue=1)
+        fd, replica_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        replica = create_engine('sqlite:///' + replica_path)
+        db.metadata.create_all(replica)
+        replica.execute(Venue.__table__.insert(), [{'id': 1, 'name': 'Replica Hall'}])
+        name = lambda client, venue_id: client.get(f'/api/v1/venues/{venue_id}?fields=name').get_json().get('name')
+        try:
+            # the unreachable replica fails its health check and is skipped
+            replicas.configure(['sqlite:///' + replica_path, 'sqlite:////nonexistent/replica.db'])
+            client = self.client()
+            self.assertEqual([name(client, 1) for _ in range(4)], ['Replica Hall'] * 4)
+
+            # writes go to the primary, and their client reads them from there
+            response = client.post('/venues/create', data=form_data)
+            self.assertIn(b'successfully listed', response.data)
+            self.assertEqual(name(client, 3), 'Brand New Hall')
+            self.assertEqual(name(client, 1), 'Venue 0')
+            self.assertEqual(self.client().get('/api/v1/venues/3').status_code, 404)
+
+            replicas.configure(['sqlite:////nonexistent/replica.db'])
+            self.assertEqual(name(self.client(), 1), 'Venue 0')
+        finally:
+            replicas.configure([])
+            replica.dispose()
+            os.unlink(replica_path)
+
+    def test_show_partition_months(self):
+        month = month_start(datetime(2026, 11, 30, 21, 30))
+        self.assertEqual(month, date(2026, 11, 1))
+        self.assertEqual([add_months(month, count) for count in (-11, -1, 1, 2)],
+                         [date(2025, 12, 1), date(2026, 10, 1), date(2026, 12, 1), date(2027, 1, 1)])
+        self.assertEqual(partition_name(add_months(month, 2)), 'show_y2027m01')
+        # partitions are a PostgreSQL feature, SQLite keeps a plain table
+        result = app.test_cli_runner().invoke(args=['show-partitions'])
+        self.assertIn('only partitioned on PostgreSQL', result.output)
+
+    def test_batch_validate_phone_numbers(self):
+        self.assertEqual(batch_validate(['+1 415 931 1234', '(415) 931-1234', '+1 415 931 1234', '12345']), {
+            '+1 415 931 1234': '+14159311234',
+            '(415) 931-1234': None,
+            '12345': None,
+        })
+
+    '''
+    Endpoints /api/v1/...
+    JSON versions of the pages, selecting only the requested fields.
+    '''
+    def test_api_venue_listing_sparse_fields(self):
+        seed(venues=3, shows_per_venue=2)
+        with count_queries() as statements:
+            response = self.client().get('/api/v1/venues?fields=name,num_upcoming_shows&limit=2')
+        body = response.get_json()
+        self.assertEqual(body['data'], [
+            {'name': 'Venue 0', 'num_upcoming_shows': 2},
+            {'name': 'Venue 1', 'num_upcoming_shows': 2},
+        ])
+        self.assertEqual(body['next'], 2)
+        self.assertNotIn('venue.address', statements[0][0])
+
+        body = self.client().get('/api/v1/venues?fields=id&after=2').get_json()
+        self.assertEqual(body, {'data': [{'id': 3}], 'next': None})
+        self.assertEqual(self.client().get('/api/v1/venues?fields=nope').status_code, 400)
+
+    def test_api_detail_search_and_shows(self):
+        seed(venues=2, shows_per_venue=2)
+        body = self.client().get('/api/v1/artists/1').get_json()
+        self.assertEqual(body['name'], 'Guns N Petals')
+        self.assertEqual(len(body['upcoming_shows']), 4)
+        self.assertEqual(self.client().get('/api/v1/venues/9').status_code, 404)
+
+        body = self.client().get('/api/v1/venues/search?q=venue&limit=1').get_json()
+        self.assertEqual(body['count'], 2)
+        self.assertEqual(len(body['data']), 1)
+
+        body = self.client().get('/api/v1/shows?limit=3&fields=venue_name,start_time').get_json()
+        self.assertEqual(len(body['data']), 3)
+        self.assertEqual(set(body['data'][0]), {'venue_name', 'start_time'})
+        body = self.client().get('/api/v1/shows?after=' + body['next']).get_json()
+        self.assertEqual(len(body['data']), 1)
+
+    def test_export_shows(self):
+        seed(venues=3, shows_per_venue=2)
+        response = self.client().get('/api/v1/shows/export')
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename=shows.csv')
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]['venue_name'], 'Venue 0')
+        self.assertEqual(rows[0]['artist_name'], 'Guns N Petals')
+        self.assertEqual([row['start_time'] for row in rows], sorted(row['start_time'] for row in rows))
+
+        # three shows start at each of two times
+        since = datetime.fromisoformat(rows[3]['start_time'])
+        response = self.client().get(f'/api/v1/shows/export?format=ndjson&since={since.isoformat()}')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(records), 3)
+        self.assertEqual(set(records[0]), {'venue_id', 'venue_name', 'artist_id', 'artist_name', 'start_time'})
+        self.assertEqual(self.client().get('/api/v1/shows/export?format=xml').status_code, 400)
+        self.assertEqual(self.client().get('/api/v1/shows/export?since=tomorrow').status_code, 400)
+
+        # one streamed statement, the header sent on its own before it runs
+        with count_queries() as statements:
+            pieces = export('csv', show_rows(chunk=4), chunk=4)
+            self.assertEqual(next(pieces), 'venue_id,venue_name,artist_id,artist_name,start_time\r\n')
+            self.assertEqual(len(statements), 0)
+            self.assertEqual([piece.count('\n') for piece in pieces], [4, 2])
+        self.assertEqual(len(statements), 1)
+
+        result = app.test_cli_runner().invoke(args=['export-shows', '--format', 'ndjson', '--until', rows[3]['start_time']])
+        self.assertEqual(len(result.output.splitlines()), 3)
+
+    def test_recommendations(self):
+        db.session.add_all([Venue(name=f'Hall {i}') for i in range(3)] + [Artist(name=f'Band {i}') for i in range(4)])
+        start = datetime.now() + timedelta(days=1)
+        for i, (venue_id, artist_id) in enumerate([(1, 1), (2, 1), (1, 2), (2, 2), (2, 3), (3, 3), (3, 4)]):
+            db.session.add(Show(venue_id=venue_id, artist_id=artist_id, start_time=start + timedelta(days=i)))
+        db.session.commit()
+        # one refresh queued by each pair
+        self.assertEqual(jobs.run_pending(), (7, 0))
+        result = app.test_cli_runner().invoke(args=['recommendations'])
+        self.assertIn('Rebuilt', result.output)
+
+        def ids(kind, owner_id):
+            db.session.expire_all()
+            owner = load_venue(owner_id) if kind == 'venue' else load_artist(owner_id)
+            return [recommendation.artist_id for recommendation in owner.recommendations]
+        self.assertEqual(ids('artist', 1), [2, 3])
+        self.assertEqual(ids('artist', 4), [3])
+        # artists of the similar venues, leaving out those already played
+        self.assertEqual(ids('venue', 1), [3])
+        self.assertIn('Artists Who Played Similar Venues', self.client().get('/venues/1').data.decode())
+
+        # the first show of Band 3 at Hall 0 queues a refresh of both of their lists
+        response = self.client().post('/shows/create', data={**form_data, 'venue_id': 1, 'artist_id': 4})
+        self.assertIn(b'successfully listed', response.data)
+        self.assertEqual(ids('artist', 4), [3])
+        self.assertEqual(jobs.run_pending(), (1, 0))
+        self.assertEqual(ids('artist', 4), [1, 2, 3])
+        self.assertEqual(ids('artist', 1), [2, 3, 4])
+        self.assertEqual(ids('venue', 1), [3])
+        self.assertEqual(ids('venue', 3), [1, 2])
+        db.session.expunge_all()
+        with count_queries() as statements:
+            self.assertIn(b'Band 0', self.client().get('/artists/4').data)
+        self.assertEqual(len(statements), 2)
+
+    def test_jobs(self):
+        calls = []
+
+        @jobs.handler('test')
+        def flaky(begin, fail):
+            calls.append(fail)
+            if fail:
+                raise ValueError('try again')
+
+        # queued with the venue, run once it is committed
+        db.session.add(Venue(name='No Image'))
+        db.session.commit()
+        self.assertEqual(Job.query.count(), 0)
+        # a private address, refused before any connection is made
+        response = self.client().post('/venues/create', data={**form_data, 'image_link': 'http://10.0.0.1/hall.jpg'})
+        self.assertIn(b'successfully listed', response.data)
+        job = Job.query.one()
+        self.assertEqual((job.kind, json.loads(job.payload)), ('thumbnail', {'table': 'venue', 'id': 2}))
+
+        db.session.rollback()
+        with db.engine.begin() as connection:
+            enqueue(connection, 'test', fail=False)
+            enqueue(connection, 'test', fail=True)
+        db.session.remove()
+        self.assertFalse(app.config['THUMBNAIL_ALLOW_PRIVATE'])
+        self.assertEqual(jobs.run_pending(), (1, 2))
+        self.assertEqual(calls, [False, True])
+        thumbnail, failed = Job.query.order_by(Job.id).all()
+        self.assertIn('10.0.0.1', thumbnail.last_error)
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn('try again', failed.last_error)
+        self.assertGreater(failed.run_after, datetime.now() + timedelta(seconds=20))
+        # not due again until its retry delay has passed
+        self.assertEqual(jobs.run_pending(), (0, 0))
+
+        db.session.query(Job).update({'run_after': datetime.now(), 'attempts': app.config['JOB_MAX_ATTEMPTS'] - 1})
+        db.session.commit()
+        self.assertEqual(jobs.run_pending(), (0, 2))
+        self.assertEqual(jobs.run_pending(), (0, 0))
+        del jobs.handlers['test']
+        result = app.test_cli_runner().invoke(args=['run-jobs', '--retry-failed'])
+        self.assertIn('Retrying 2 failed jobs.', result.output)
+        self.assertIn('Ran 0 jobs, 2 failed.', result.output)
+
+    def test_api_etag(self):
+        seed(venues=1, shows_per_venue=1)
+        response = self.client().get('/api/v1/venues/1')
+        etag = response.headers['ETag']
+        response = self.client().get('/api/v1/venues/1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+    '''
+    Start times are formatted from the datetime objects, with one parsed
+    babel pattern per format.
+    '''
+    def test_format_datetime(self):
+        start_time = datetime(2035, 5, 21, 21, 30)
+        self.assertEqual(format_datetime(start_time, 'full'), 'Monday May, 21, 2035 at 9:30PM')
+        self.assertEqual(format_datetime('2035-05-21 21:30:00'), 'Mon 05, 21, 2035 9:30PM')
+        self.assertEqual(format_datetimes([start_time, '2035-05-22 10:00:00'], 'full'),
+                         ['Monday May, 21, 2035 at 9:30PM', 'Tuesday May, 22, 2035 at 10:00AM'])
+        # the other babel format names follow the locale
+        for format in ('short', 'long'):
+            for locale in ('en', 'de'):
+                self.assertEqual(format_datetime(start_time, format, locale),
+                                 babel.dates.format_datetime(start_time, format, locale=locale))
+        self.assertEqual(format_datetime(start_time, 'short'), '5/21/35, 9:30 PM')
+
+        db.session.add_all([Venue(name='Hall'), Artist(name='Band')])
+        db.session.add(Show(venue_id=1, artist_id=1, start_time=start_time))
+        db.session.commit()
+        self.assertIn(b'Monday May, 21, 2035 at 9:30PM', self.client().get('/shows').data)
+        self.assertIn(b'Monday May, 21, 2035 at 9:30PM', self.client().get('/venues/1').data)
+
+
+@unittest.skipUnless(os.getenv('TEST_POSTGRES_URL'), 'set TEST_POSTGRES_URL to a scratch PostgreSQL database')
+class PostgresPartitionTestCase(unittest.TestCase):
+    """Show partitions, only created on PostgreSQL, in the scratch database
+    at TEST_POSTGRES_URL. Its tables are dropped and recreated."""
+
+    def setUp(self):
+        self.engine = create_engine(os.environ['TEST_POSTGRES_URL'])
+        db.metadata.drop_all(self.engine)
+        db.metadata.create_all(self.engine)
+
+    def tearDown(self):
+        db.metadata.drop_all(self.engine)
+        self.engine.dispose()
+
+    def test_create_and_archive_partitions(self):
+        now = datetime(2026, 10, 18, 12)
+        this_month = month_start(now)
+        # two shows, at two venues, in each of five months
+        starts = [datetime.combine(add_months(this_month, count), datetime.min.time()) + timedelta(days=2, hours=20)
+                  for count in (-30, -29, -3, 0, 1)]
+        with self.engine.begin() as connection:
+            connection.execute(Venue.__table__.insert(), [{'name': 'Hall 0'}, {'name': 'Hall 1'}])
+            connection.execute(Artist.__table__.insert(), [{'name': 'Band 0'}])
+            connection.execute(Show.__table__.insert(), [
+                {'venue_id': venue_id, 'artist_id': 1, 'start_time': start} for start in starts for venue_id in (1, 2)])
+            recount(connection, now)
+            # until they have a partition, shows are kept in show_default
+            self.assertEqual(partitions(connection), [])
+            self.assertEqual(connection.execute('SELECT count(*) FROM show_default').scalar(), 10)
+
+        with self.engine.begin() as connection:
+            created = create_partitions(connection, add_months(this_month, -30), add_months(this_month, 2))
+            self.assertEqual(len(created), 33)
+            self.assertEqual(partitions(connection), created)
+            self.assertEqual(connection.execute('SELECT count(*) FROM show_default').scalar(), 0)
+            self.assertEqual(connection.execute(f'SELECT count(*) FROM {partition_name(this_month)}').scalar(), 2)
+            self.assertEqual(create_partitions(connection, this_month, add_months(this_month, 2)), [])
+
+        directory = tempfile.mkdtemp()
+        with self.engine.begin() as connection:
+            written = archive(connection, add_months(this_month, -24), directory)
+            # the six months ending before the retention, two of them with shows
+            self.assertEqual([os.path.basename(path) for path in written],
+                             [partition_name(add_months(this_month, count)) + '.csv.gz' for count in range(-30, -24)])
+            self.assertEqual(partitions(connection), created[6:])
+            self.assertEqual(connection.execute('SELECT count(*) FROM show').scalar(), 6)
+            # archived shows leave the past counters
+            self.assertEqual(connection.execute(
+                'SELECT upcoming_shows_count, past_shows_count FROM venue ORDER BY id').fetchall(), [(1, 2), (1, 2)])
+            self.assertEqual(connection.execute(
+                'SELECT upcoming_shows_count, past_shows_count FROM artist').fetchall(), [(2, 4)])
+        with gzip.open(written[0], 'rt') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([(row['venue_id'], row['start_time']) for row in rows],
+                         [('1', str(starts[0])), ('2', str(starts[0]))])
+        with gzip.open(written[-1], 'rt') as f:
+            self.assertEqual(f.read(), 'venue_id,artist_id,start_time\n')
+
+
+# Every route of the app, with its arguments filled in, and form data good
+# for any of the POST routes
+form_data = {
+    'search_term': 'venue', 'name': 'Brand New Hall', 'city': 'City 0', 'state': 'CA',
+    'address': '1 Main Street', 'phone': '+1 415 931 1234', 'genres': ['Jazz'],
+    'image_link': 'https://example.com/hall.jpg', 'facebook_link': 'https://www.facebook.com/hall',
+    'website': 'https://hall.example.com', 'venue_id': 1, 'artist_id': 1,
+    'start_time': '2035-05-21 21:30:00'}
+route_args = {
+    '/api/v1/venues/nearby': '?lat=37.77&lng=-122.42&radius=25',
+    '/api/v1/venues/availability': '?start=2035-05-25T18:00:00&end=2035-05-26T01:00:00',
+    '/api/v1/artists/availability': '?start=2035-05-25T18:00:00&end=2035-05-26T01:00:00',
+}
+routes = [(method, rule) for rule in app.url_map.iter_rules() if rule.endpoint != 'static'
+          for method in sorted(rule.methods & {'GET', 'POST'})]
+
+@pytest.mark.parametrize('method,rule', routes, ids=[f'{method} {rule}' for method, rule in routes])
+def test_route_query_budget(query_budget, method, rule):
+    """Each route stays within its statement budget on a seeded database."""
+    seed(venues=20, shows_per_venue=3)
+    path = rule.rule.replace('<int:venue_id>', '1').replace('<int:artist_id>', '1').replace(
+        '<name>', '0' * 64 + '.jpg')
+    path += route_args.get(rule.rule, '')
+    response = query_budget.open(path, method=method, data=form_data)
+    # no thumbnail is stored in the fresh database
+    assert response.status_code == (404 if rule.endpoint == 'thumbnail' else 200)
+    budget = app.config['QUERY_BUDGETS'].get(rule.endpoint, app.config['QUERY_BUDGET_DEFAULT'])
+    assert int(response.headers['X-Query-Count']) <= budget
+
+
+def tearDownModule():
+    os.close(db_fd)
+    os.unlink(db_path)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+#----------------------------------------------------------------------------#
+# Thumbnails of venue and artist images.
+#
+# `flask thumbnails` fetches every image_link that has no thumbnail yet, each
+# URL once, in a pool of worker threads, scales it down and stores it as a
+# JPEG named after the SHA-256 of its bytes. Pages then serve the thumbnail
+# from /thumbnails/ with a one year cache lifetime (the name changes with
+# the content) and fall back to the original link until it exists. New
+# venues and artists queue a job thumbnailing their image, see jobs.py.
+#
+# Image links come from anyone filling in a form, so only http and https
+# are fetched, without proxies, and every connection, redirects included,
+# goes to an address checked to be public: no loopback, private,
+# link-local or reserved ones.
+#----------------------------------------------------------------------------#
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import re
+import socket
+import tempfile
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+NAME = re.compile(r'^[0-9a-f]{64}\.jpg$')
+
+
+class ImageError(Exception):
+  pass
+
+
+SCHEMES = {'http', 'https'}
+
+
+def public_address(host, port, allow_private=False):
+  '''The (address, port) to connect to for `host`, refusing hosts that
+  resolve to any non-public address.'''
+  try:
+    infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+  except (OSError, UnicodeError) as e:
+    raise ImageError(f'{host}: {e}')
+  for _, _, _, _, sockaddr in infos:
+    address = ipaddress.ip_address(sockaddr[0].split('%')[0])
+    if not allow_private and (not address.is_global or address.is_multicast):
+      raise ImageError(f'{host}: {address} is not a public address')
+  return infos[0][4][:2]
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+  allow_private = False
+
+  def connect(self):
+    self.sock = socket.create_connection(public_address(self.host, self.port, self.allow_private), self.timeout)
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+  allow_private = False
+
+  def connect(self):
+    sock = socket.create_connection(public_address(self.host, self.port, self.allow_private), self.timeout)
+    self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+  def __init__(self, connection):
+    super().__init__()
+    self.connection = connection
+
+  def http_open(self, request):
+    return self.do_open(self.connection, request)
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+  def __init__(self, connection):
+    super().__init__()
+    self.connection = connection
+
+  def https_open(self, request):
+    return self.do_open(self.connection, request)
+
+class RedirectHandler(urllib.request.HTTPRedirectHandler):
+  def redirect_request(self, request, fp, code, msg, headers, url):
+    if urllib.parse.urlsplit(url).scheme not in SCHEMES:
+      raise ImageError(f'{url}: redirect to an unsupported scheme')
+    return super().redirect_request(request, fp, code, msg, headers, url)
+
+
+def opener(allow_private=False):
+  # Only the handlers listed here: no proxies, no file: or ftp: URLs
+  http_connection = type('Connection', (PublicHTTPConnection,), {'allow_private': allow_private})
+  https_connection = type('Connection', (PublicHTTPSConnection,), {'allow_private': allow_private})
+  director = urllib.request.OpenerDirector()
+  for handler in (PublicHTTPHandler(http_connection), PublicHTTPSHandler(https_connection), RedirectHandler(),
+                  urllib.request.HTTPDefaultErrorHandler(), urllib.request.HTTPErrorProcessor(),
+                  urllib.request.UnknownHandler()):
+    director.add_handler(handler)
+  return director
+
+
+def fetch(url, timeout=10, max_bytes=10 * 1024 * 1024, allow_private=False):
+  '''The body of `url`, refusing anything larger than `max_bytes` and, unless
+  `allow_private`, any host that isn't on a public address.'''
+  if urllib.parse.urlsplit(url).scheme not in SCHEMES:
+    raise ImageError(f'{url}: only http and https links are fetched')
+  request = urllib.request.Request(url, headers={'User-Agent': 'fyyur-thumbnailer'})
+  try:
+    with opener(allow_private).open(request, timeout=timeout) as response:
+      data = response.read(max_bytes + 1)
+  except (OSError, ValueError, http.client.HTTPException) as e:
+    raise ImageError(f'{url}: {e}')
+  if len(data) > max_bytes:
+    raise ImageError(f'{url}: larger than {max_bytes} bytes')
+  return data
+
+
+def make_thumbnail(data, size=(320, 320), quality=85):
+  '''JPEG bytes of the image `data` scaled to fit in `size`.'''
+  try:
+    image = Image.open(io.BytesIO(data))
+    image.thumbnail(size, Image.LANCZOS)
+  except (OSError, ValueError, Image.DecompressionBombError) as e:
+    raise ImageError(f'not an image: {e}')
+  if image.mode != 'RGB':
+    image = image.convert('RGB')
+  output = io.BytesIO()
+  image.save(output, 'JPEG', quality=quality, optimize=True)
+  return output.getvalue()
+
+
+class ThumbnailStore(object):
+  '''Directory of thumbnails named by the SHA-256 of their content.'''
+
+  def __init__(self, directory):
+    self.directory = directory
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def put(self, data):
+    '''Store `data` and return its name, written atomically and only once.'''
+    name = hashlib.sha256(data).hexdigest() + '.jpg'
+    path = self.path(name)
+    if not os.path.exists(path):
+      os.makedirs(self.directory, exist_ok=True)
+      fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+      with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+      os.replace(temporary, path)
+    return name
+
+
+def ingest(urls, store, workers=8, size=(320, 320), timeout=10, max_bytes=10 * 1024 * 1024, allow_private=False):
+  '''Thumbnail every distinct URL of `urls` in `workers` threads. Returns
+  {url: thumbnail name or ImageError}.'''
+  def thumbnail(url):
+    try:
+      return store.put(make_thumbnail(fetch(url, timeout, max_bytes, allow_private), size))
+    except ImageError as e:
+      return e
+
+  urls = list(dict.fromkeys(url for url in urls if url))
+  with ThreadPoolExecutor(max_workers=workers) as pool:
+    return dict(zip(urls, pool.map(thumbnail, urls)))